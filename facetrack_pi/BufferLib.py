@@ -0,0 +1,114 @@
+import threading
+import numpy as np
+
+
+class WorkBuffers:
+    """Recycled frame-sized arrays and a per-frame allocation counter.
+
+    acquire(name, shape) checks an array out of a small set kept under
+    `name` and release(array) checks it back in. An array handed to more
+    than one consumer (e.g. two pipeline queues) gets a retain() per extra
+    holder and is reused only once every holder has released it. The set
+    grows to however many are checked out at once, up to `max_slots`,
+    after which nothing new is allocated. An array that is never released
+    is never reused.
+
+    release() and retain() ignore anything acquire() did not hand out
+    (None, views, OpenCV outputs), so callers can give back whatever they
+    got without checking where it came from.
+
+    With `enabled` False acquire() returns None, OpenCV allocates its own
+    outputs, and track()/count() still tally those allocations, so the
+    counter compares both modes. Only frame-sized buffers in our own code
+    are counted, not OpenCV internals such as the cascade pyramid.
+    """
+    def __init__(self, enabled=True, max_slots=16):
+        self.enabled = enabled
+        self.max_slots = max_slots
+        self._slots = {}
+        self._holders = {}   # id(array) -> [array, holders] while checked out
+        self._lock = threading.Lock()
+        self.allocations = 0
+        self.frames = 0
+        self._frame_start = 0
+        self.last_frame = 0
+        self.max_per_frame = 0
+
+    def acquire(self, name, shape, dtype=np.uint8):
+        """Check out a free array of `shape` for `name`, or None when pooling is off."""
+        if not self.enabled:
+            return None
+        shape = tuple(shape)
+        dtype = np.dtype(dtype)
+        with self._lock:
+            slots = self._slots.setdefault(name, [])
+            if slots and (slots[0].shape != shape or slots[0].dtype != dtype):
+                # Size changed, start over; old arrays still out are just dropped
+                for buf in slots:
+                    self._holders.pop(id(buf), None)
+                slots.clear()
+            for buf in slots:
+                if id(buf) not in self._holders:
+                    self._holders[id(buf)] = [buf, 1]
+                    return buf
+            buf = np.empty(shape, dtype)
+            self.allocations += 1
+            if len(slots) < self.max_slots:
+                slots.append(buf)
+                self._holders[id(buf)] = [buf, 1]
+            return buf
+
+    def _entry(self, buf):
+        entry = self._holders.get(id(buf))
+        if entry is None or entry[0] is not buf:
+            return None
+        return entry
+
+    def retain(self, buf):
+        """Add a holder to a checked-out array; returns it."""
+        with self._lock:
+            entry = self._entry(buf)
+            if entry is not None:
+                entry[1] += 1
+        return buf
+
+    def release(self, *bufs):
+        """Give back arrays from acquire(); each becomes free after its last holder."""
+        with self._lock:
+            for buf in bufs:
+                entry = self._entry(buf) if buf is not None else None
+                if entry is None:
+                    continue
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self._holders[id(buf)]
+
+    def track(self, result, dst):
+        """Count `result` as an allocation unless OpenCV wrote it into `dst`."""
+        if dst is None or result is not dst:
+            self.allocations += 1
+        return result
+
+    def count(self, n=1):
+        self.allocations += n
+
+    def frame_done(self):
+        # Not locked: an approximate count is fine for a debug counter
+        self.last_frame = self.allocations - self._frame_start
+        self._frame_start = self.allocations
+        self.frames += 1
+        # Skip the first frames while the pools fill up
+        if self.frames > 10:
+            self.max_per_frame = max(self.max_per_frame, self.last_frame)
+
+    def get_stats(self):
+        return {
+            "enabled": self.enabled,
+            "frames": self.frames,
+            "allocations": self.allocations,
+            "per_frame_last": self.last_frame,
+            "per_frame_avg": self.allocations / self.frames if self.frames else 0.0,
+            "per_frame_max_steady": self.max_per_frame,
+            "buffers": {name: len(slots) for name, slots in self._slots.items()},
+            "checked_out": len(self._holders),
+        }
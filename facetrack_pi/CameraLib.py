@@ -1,38 +1,533 @@
-from picamera2 import Picamera2
-import cv2
+import numpy as np
 import sys
 import select
+import threading
+import time
+from FrameBusLib import FrameBusWriter
+from EncoderLib import ImageEncoder, BufferPool
+from BufferLib import WorkBuffers
+from FrameSourceLib import MappedArray
+from LazyLib import lazy_import
+
+cv2 = lazy_import("cv2")
+picamera2 = lazy_import("picamera2")
 
 class CameraLib:
-    def __init__(self, width=640, height=480, rotate_180=True):
+    def __init__(self, width=640, height=480, rotate_180=True, luma=False, lores_size=None,
+                 buffer_pool=False, source=None):
+        # Frame source: with `source` (see FrameSourceLib) frames come from
+        # a recording or a generator instead of the camera, so everything
+        # below also runs off the Pi. Its frames are taken as recorded:
+        # source.upside_down replaces rotate_180.
+        self.source = source
+        if source is not None:
+            rotate_180 = source.upside_down
         self.rotate_180 = rotate_180
-        self.picam2 = Picamera2()
-        config = self.picam2.create_preview_configuration(
-            main={"format": "RGB888", "size": (width, height)}
-            )
-        self.picam2.configure(config)
+        self.width = width
+        self.height = height
+
+        # Buffer-pool mode: capture copies straight out of the camera's
+        # buffers into recycled arrays and conversions write into
+        # preallocated outputs. Frames and images returned in this mode are
+        # checked out of `buffers`; hand them back with buffers.release()
+        # once done so they can be reused. `buffers` counts allocations per
+        # frame in either mode (see BufferLib).
+        self.buffer_pool = buffer_pool
+        self.buffers = WorkBuffers(enabled=buffer_pool)
+        self._raw_layout = None
+
+        # Luma mode: the main stream is YUV420 and its Y plane is used as
+        # the grayscale image for detection with no conversion or copy.
+        # `lores_size` adds a small YUV420 stream that is converted to
+        # colour only for display and capture. Keep widths a multiple of
+        # 64 so the YUV planes are not padded.
+        if lores_size is not None and not luma:
+            raise ValueError("lores_size is only supported with luma=True")
+        self.luma = luma
+        self.lores_size = lores_size
+
+        if source is not None:
+            self.picam2 = source
+            self._mapped_array = MappedArray
+            Transform = None
+        else:
+            self.picam2 = picamera2.Picamera2()
+            self._mapped_array = picamera2.MappedArray
+            try:
+                from libcamera import Transform
+            except ImportError:
+                Transform = None
+
+        # Prefer flipping on the sensor (hflip + vflip == 180 degrees) so
+        # frames arrive upright and no per-frame copy is needed.
+        self.sensor_rotated = False
+        if rotate_180 and Transform is not None:
+            try:
+                config = self._make_config(transform=Transform(hflip=1, vflip=1))
+                self.picam2.configure(config)
+                self.sensor_rotated = True
+            except Exception as e:
+                print("Sensor transform not supported, rotating in software:", e)
+
+        if not self.sensor_rotated:
+            config = self._make_config()
+            self.picam2.configure(config)
         self.picam2.start()
+
+        # True when frames from get_raw_frame()/get_latest() are upside down
+        # and must go through upright()/upright_boxes() for display.
+        self.needs_rotation = rotate_180 and not self.sensor_rotated
+
+        # Streaming mode state (see start_stream)
+        self._stream_thread = None
+        self._stream_stop = threading.Event()
+        self._stream_cond = threading.Condition()
+        self._ring = None
+        self._ring_frames = None   # what each slot holds: its ring buffer or a bus slot
+        self._lores_ring = None
+        self._ring_seq = None
+        self._ring_ts = None
+        self._latest_slot = -1
+        self._seq = 0
+        self._readers = {}
+        self.frames_captured = 0
+        self._stream_start = None
+        self._bus = None
+        self._bus_lock = threading.Lock()
+        self._retired_buses = []
+
+        # Background JPEG encoding (see start_encoder)
+        self.encoder = None
+        self._burst_pool = None
+
+        # Sensor time of the last get_raw_frames() result, in seconds on
+        # the time.monotonic() clock (see _sensor_time)
+        self.frame_timestamp = None
+        self._capture_time = None
         return
-    
-    def get_frame(self):
-        frame = self.picam2.capture_array()
-        if self.rotate_180:
-            frame = cv2.rotate(frame, cv2.ROTATE_180)
+
+    def _sensor_time(self, metadata):
+        # libcamera's SensorTimestamp is when the frame was exposed, in ns
+        # on the monotonic clock, so latencies measured from it include
+        # exposure and ISP time. Fall back to now if it is missing.
+        ts = metadata.get("SensorTimestamp") if metadata else None
+        self._capture_time = ts / 1e9 if ts else time.monotonic()
+        return self._capture_time
+
+    def _make_config(self, transform=None):
+        if self.luma:
+            main = {"format": "YUV420", "size": (self.width, self.height)}
+        else:
+            main = {"format": "RGB888", "size": (self.width, self.height)}
+        kwargs = {"main": main}
+        if self.lores_size is not None:
+            kwargs["lores"] = {"format": "YUV420", "size": self.lores_size}
+        if transform is not None:
+            kwargs["transform"] = transform
+        return self.picam2.create_preview_configuration(**kwargs)
+
+    def _read_frames(self):
+        """Capture (main, lores) from one request into new arrays; lores is None if not configured."""
+        if self.lores_size is not None:
+            (frame, lores), metadata = self.picam2.capture_arrays(["main", "lores"])
+            self.buffers.count(2)
+        else:
+            (frame,), metadata = self.picam2.capture_arrays(["main"])
+            lores = None
+            self.buffers.count()
+        self._sensor_time(metadata)
+        self._raw_layout = (frame.shape, frame.dtype,
+                            lores.shape if lores is not None else None)
+        return frame, lores
+
+    def _read_request(self, out, lores_out=None):
+        """Like _read_frames() but copies main into `out` (and lores into `lores_out`)."""
+        # Copy straight from the camera's buffer; capture_array() would
+        # allocate a new array for every frame first.
+        request = self.picam2.capture_request()
+        try:
+            self._sensor_time(request.get_metadata())
+            with self._mapped_array(request, "main") as m:
+                np.copyto(out, m.array)
+            lores = None
+            if self.lores_size is not None:
+                with self._mapped_array(request, "lores") as m:
+                    if lores_out is None:
+                        lores = m.array.copy()
+                        self.buffers.count()
+                    else:
+                        np.copyto(lores_out, m.array)
+                        lores = lores_out
+        finally:
+            request.release()
+        return out, lores
+
+    def owned_copy(self, frame, name="copy"):
+        """Copy of `frame` the caller may keep; checked out of `buffers` in buffer-pool mode."""
+        buf = self.buffers.acquire(name, frame.shape, frame.dtype)
+        if buf is None:
+            self.buffers.count()
+            return frame.copy()
+        np.copyto(buf, frame)
+        return buf
+
+    def get_raw_frame(self):
+        """Frame in sensor orientation, owned by the caller.
+
+        Detection can run on this directly; only boxes that are shown or
+        used for control need mapping with upright_boxes(). In luma mode
+        this is the YUV420 main buffer (see gray_view).
+        """
+        frame, lores = self.get_raw_frames()
+        self.buffers.release(lores)
         return frame
 
+    def get_raw_frames(self):
+        """Like get_raw_frame() but returns (frame, lores).
+
+        While streaming this waits for a frame the "raw" consumer has not
+        seen yet, so a loop calling it runs at most at the camera's rate.
+        """
+        if self.is_streaming():
+            frame, lores, _, timestamp = self.get_latest(wait_new=True, with_lores=True,
+                                                         consumer="raw")
+            self.frame_timestamp = timestamp
+            return (self.owned_copy(frame, "raw"),
+                    self.owned_copy(lores, "raw_lores") if lores is not None else None)
+        if self.buffers.enabled and self._raw_layout is not None:
+            shape, dtype, lores_shape = self._raw_layout
+            out = self.buffers.acquire("raw", shape, dtype)
+            lores_out = self.buffers.acquire("raw_lores", lores_shape) if lores_shape else None
+            frames = self._read_request(out, lores_out)
+        else:
+            frames = self._read_frames()
+        self.frame_timestamp = self._capture_time
+        return frames
+
+    def get_frame(self):
+        """Upright colour frame for display or saving, owned by the caller."""
+        if self.is_streaming():
+            frame, lores, _, _ = self.get_latest(with_lores=True)
+            if self.luma or self.needs_rotation:
+                return self.to_color(frame, lores)
+            # Callers draw on the frame, so they get their own copy
+            # rather than a view into the ring.
+            return self.owned_copy(frame, "color")
+        raw, lores = self.get_raw_frames()
+        color = self.to_color(raw, lores)
+        self.buffers.release(lores)
+        if color is not raw:
+            self.buffers.release(raw)
+        return color
+
+    def gray_view(self, frame):
+        """Grayscale image for detection from a raw frame.
+
+        In luma mode this is a view of the Y plane, so nothing is copied.
+        """
+        if self.luma:
+            return frame[:self.height, :self.width]
+        dst = self.buffers.acquire("gray", frame.shape[:2])
+        return self.buffers.track(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=dst), dst)
+
+    def to_color(self, frame, lores=None, pooled=True):
+        """Upright BGR image from a raw frame, using lores when available.
+
+        The result may be smaller than the main stream when lores is used.
+        Without rotation or luma mode it is `frame` itself. With `pooled`
+        False it never comes from `buffers`, for images handed to another
+        thread that does not give them back.
+        """
+        if not self.luma:
+            return self.upright(frame, pooled=pooled)
+        if lores is not None:
+            src, name = lores, "color_lores"
+        else:
+            src, name = frame, "color"
+        shape = (src.shape[0] * 2 // 3, src.shape[1], 3)
+        dst = self.buffers.acquire(name, shape) if pooled else None
+        color = self.buffers.track(cv2.cvtColor(src, cv2.COLOR_YUV420p2BGR, dst=dst), dst)
+        if self.needs_rotation:
+            # Already our own buffer, so flip it in place
+            return cv2.flip(color, -1, dst=color)
+        return color
+
+    def upright(self, frame, dst=None, pooled=True):
+        """Rotate a raw frame for display; a no-op when the sensor flips."""
+        if not self.needs_rotation:
+            return frame
+        if dst is None and pooled:
+            dst = self.buffers.acquire("upright", frame.shape, frame.dtype)
+        return self.buffers.track(cv2.rotate(frame, cv2.ROTATE_180, dst=dst), dst)
+
+    def upright_boxes(self, boxes, shape):
+        """Map (x, y, w, h) boxes from raw to upright frame coordinates."""
+        if not self.needs_rotation or len(boxes) == 0:
+            return boxes
+        height, width = shape[:2]
+        boxes = np.array(boxes, dtype=np.int32)
+        boxes[:, 0] = width - boxes[:, 0] - boxes[:, 2]
+        boxes[:, 1] = height - boxes[:, 1] - boxes[:, 3]
+        return boxes
+
+    # -------------------------
+    # Streaming mode
+    # -------------------------
+    def start_stream(self, buffers=3):
+        """Start a capture thread that fills a ring of preallocated frames.
+
+        Frames returned by get_latest() are views into the ring in sensor
+        orientation (see needs_rotation) and stay valid until
+        `buffers - 1` newer frames have been captured.
+        """
+        if self.is_streaming():
+            return
+        if buffers < 2:
+            raise ValueError("Streaming needs at least 2 buffers")
+
+        first, first_lores = self._read_frames()
+        self._ring = [np.empty_like(first) for _ in range(buffers)]
+        self._ring_frames = list(self._ring)
+        if first_lores is not None:
+            self._lores_ring = [np.empty_like(first_lores) for _ in range(buffers)]
+        else:
+            self._lores_ring = None
+        self._ring_seq = [0] * buffers
+        self._ring_ts = [0.0] * buffers
+        self._latest_slot = -1
+        self._seq = 0
+        self._readers = {}
+        self.frames_captured = 0
+        self._stream_start = time.monotonic()
+
+        self._stream_stop.clear()
+        self._stream_thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._stream_thread.start()
+
+    def _capture_loop(self):
+        slot = 0
+        buffers = len(self._ring)
+        while not self._stream_stop.is_set():
+            lores_out = self._lores_ring[slot] if self._lores_ring else None
+            with self._bus_lock:
+                # When publishing, capture straight into the bus's next slot
+                # and let the ring slot point at it, so the frame is copied once
+                bus = self._bus
+                out = bus.begin() if bus is not None else self._ring[slot]
+                try:
+                    self._read_request(out, lores_out)
+                except Exception as e:
+                    print("Capture thread error:", e)
+                    self._stream_stop.set()
+                    break
+                timestamp = self._capture_time
+                if bus is not None:
+                    bus.commit(timestamp)
+
+                with self._stream_cond:
+                    self._seq += 1
+                    self._ring_frames[slot] = out
+                    self._ring_seq[slot] = self._seq
+                    self._ring_ts[slot] = timestamp
+                    self._latest_slot = slot
+                    self.frames_captured += 1
+                    self._stream_cond.notify_all()
+
+            slot = (slot + 1) % buffers
+
+    def get_latest(self, wait_new=False, timeout=1.0, with_lores=False, consumer="default"):
+        """Return (frame, seq, timestamp) for the newest streamed frame.
+
+        Only waits when no frame has arrived yet, or when `wait_new` is set
+        and the newest frame has already been read by this `consumer`.
+        Each consumer name has its own read cursor and delivered/dropped/
+        repeated counts, so e.g. the pipeline and a burst capture do not
+        take frames from each other. `timestamp` is the sensor time of
+        the frame on the time.monotonic() clock. With `with_lores` the result is
+        (frame, lores, seq, timestamp).
+        """
+        with self._stream_cond:
+            reader = self._readers.get(consumer)
+            if reader is None:
+                reader = self._readers[consumer] = {"last_seq": 0, "delivered": 0,
+                                                    "dropped": 0, "repeated": 0}
+            if wait_new:
+                ready = lambda: self._seq > reader["last_seq"]
+            else:
+                ready = lambda: self._seq > 0
+            if not ready():
+                self._stream_cond.wait_for(
+                    lambda: ready() or self._stream_stop.is_set(), timeout)
+            if self._seq == 0:
+                raise RuntimeError("No frame received from camera stream")
+
+            slot = self._latest_slot
+            seq = self._ring_seq[slot]
+            timestamp = self._ring_ts[slot]
+
+            if seq == reader["last_seq"]:
+                reader["repeated"] += 1
+            else:
+                # Frames that arrived before this consumer's first read
+                # were not dropped by it
+                if reader["last_seq"]:
+                    reader["dropped"] += seq - reader["last_seq"] - 1
+                reader["delivered"] += 1
+                reader["last_seq"] = seq
+
+            if with_lores:
+                lores = self._lores_ring[slot] if self._lores_ring else None
+                return self._ring_frames[slot], lores, seq, timestamp
+            return self._ring_frames[slot], seq, timestamp
+
+    def stop_stream(self):
+        if self._stream_thread is None:
+            return
+        self._stream_stop.set()
+        with self._stream_cond:
+            self._stream_cond.notify_all()
+        self._stream_thread.join(timeout=2.0)
+        self._stream_thread = None
+
+    def publish(self, name="facetrack_frames", slots=4):
+        """Also publish every streamed main frame to a shared-memory FrameBus.
+
+        Other processes attach with FrameBusLib.FrameBusReader(name) and
+        read frames in place instead of having them pickled. Frames are in
+        sensor orientation, as from get_raw_frame(). Starts the stream if
+        needed. The capture thread writes frames straight into the bus and
+        get_latest() returns them from there, so the bus has at least as
+        many slots as the ring.
+        """
+        if not self.is_streaming():
+            self.start_stream()
+        with self._bus_lock:
+            if self._bus is None:
+                first = self._ring[0]
+                self._bus = FrameBusWriter(name, first.shape, first.dtype,
+                                           slots=max(slots, len(self._ring)))
+            return self._bus
+
+    def unpublish(self):
+        with self._bus_lock:
+            bus, self._bus = self._bus, None
+            if bus is None:
+                return
+            with self._stream_cond:
+                # Give the ring its own buffers back
+                for slot, frame in enumerate(self._ring_frames):
+                    if frame is not self._ring[slot]:
+                        np.copyto(self._ring[slot], frame)
+                        self._ring_frames[slot] = self._ring[slot]
+        # Frames already handed out by get_latest() may be views of the bus,
+        # and unmapping memory under a numpy view crashes the process. Drop
+        # the name so no new reader attaches, but keep the mapping as long
+        # as this camera.
+        bus.unlink()
+        self._retired_buses.append(bus)
+
+    def is_streaming(self):
+        return self._stream_thread is not None and not self._stream_stop.is_set()
+
+    def get_stats(self):
+        with self._stream_cond:
+            elapsed = time.monotonic() - self._stream_start if self._stream_start else 0.0
+            default = self._readers.get("default", {})
+            return {
+                "streaming": self.is_streaming(),
+                "buffers": len(self._ring) if self._ring else 0,
+                "captured": self.frames_captured,
+                "delivered": default.get("delivered", 0),
+                "dropped": default.get("dropped", 0),
+                "repeated": default.get("repeated", 0),
+                "consumers": {name: {k: v for k, v in r.items() if k != "last_seq"}
+                              for name, r in self._readers.items()},
+                "capture_fps": self.frames_captured / elapsed if elapsed > 0 else 0.0,
+                "published": self._bus.frames_written if self._bus else 0,
+            }
+
     def preview(self, window_name = "Camera"):
+        """Show one frame; in buffer-pool mode it is only valid until the next call."""
         frame = self.get_frame()
         cv2.imshow(window_name, frame)
         cv2.waitKey(1)
+        self.buffers.release(frame)
         return frame
-    
+
     def capture(self, filename="image.jpg"):
         frame = self.get_frame()
         cv2.imwrite(filename, frame)
+        self.buffers.release(frame)
         return filename
 
+    # -------------------------
+    # Asynchronous capture
+    # -------------------------
+    def start_encoder(self, workers=2, max_pending=8, quality=90, format="jpg"):
+        """Start the background encoder used by capture_async/capture_burst."""
+        if self.encoder is None:
+            self.encoder = ImageEncoder(workers=workers, max_pending=max_pending,
+                                        quality=quality, format=format)
+        return self.encoder
+
+    def _convert_raw(self, raw):
+        # Runs on an encoder thread: raw sensor frame -> upright BGR. The
+        # encoder never hands the result back, so it is not pooled.
+        return self.to_color(raw, pooled=False)
+
+    def capture_async(self, filename="image.jpg", quality=None, format=None,
+                      block=False, timeout=None):
+        """Save a frame without waiting for the encode; returns a Future.
+
+        Only a raw copy is made on the calling thread; conversion, rotation,
+        encoding and the file write happen on the encoder. With `block`
+        False (the default) the snapshot is dropped and None returned when
+        the encoder is backed up, so a tracking loop never stalls on it.
+        With `filename` None the Future resolves to the encoded bytes.
+        """
+        encoder = self.start_encoder()
+        raw = self.get_raw_frame()
+        return encoder.submit(raw, filename, quality, format, block=block,
+                              timeout=timeout, convert=self._convert_raw,
+                              release=self.buffers.release)
+
+    def capture_burst(self, count, pattern="burst_{:04d}.jpg", quality=None, format=None):
+        """Grab `count` consecutive frames at full rate and save them in the background.
+
+        Frames are copied into a pool of preallocated raw buffers (reused by
+        later bursts of the same size) and encoded while the burst goes on,
+        so this returns after `count` frame periods with a list of Futures.
+        If the encoder falls behind, capture waits for a buffer to free up.
+        """
+        encoder = self.start_encoder()
+        if self.is_streaming():
+            shape, dtype = self._ring[0].shape, self._ring[0].dtype
+        else:
+            first = self._read_frames()[0]
+            shape, dtype = first.shape, first.dtype
+        pool = self._burst_pool
+        if pool is None or pool.shape != shape or pool.count < count:
+            pool = self._burst_pool = BufferPool(shape, dtype, count)
+
+        futures = []
+        for i in range(count):
+            buf = pool.acquire()
+            if self.is_streaming():
+                frame, _, _ = self.get_latest(wait_new=True, consumer="burst")
+                np.copyto(buf, frame)
+            else:
+                self._read_request(buf)
+            futures.append(encoder.submit(buf, pattern.format(i), quality, format, block=True,
+                                          convert=self._convert_raw, release=pool.release))
+        return futures
+
     def close(self):
         try:
+            self.stop_stream()
+            self.unpublish()
+            if self.encoder is not None:
+                self.encoder.close(wait=True)
+                self.encoder = None
             self.picam2.stop()
             cv2.destroyAllWindows()
         except Exception:
@@ -40,6 +535,8 @@ class CameraLib:
 
     def __del__(self):
         try:
+            self.stop_stream()
+            self.unpublish()
             self.picam2.stop()
             cv2.destroyAllWindows()
         except Exception:
@@ -50,7 +547,7 @@ def test():
     import select
     def kbhit():
         return select.select([sys.stdin], [], [], 0)[0]
-    
+
     cam = CameraLib(width=640, height=480, rotate_180=True)
 
     print("Press 'c' to capture, 'q' to quit.")
@@ -68,3 +565,85 @@ def test():
 
     cam.close()
 
+def test_stream():
+    cam = CameraLib(width=640, height=480, rotate_180=True)
+    cam.start_stream(buffers=3)
+
+    print("Streaming for 5 seconds...")
+    end = time.monotonic() + 5
+    while time.monotonic() < end:
+        frame, seq, timestamp = cam.get_latest(wait_new=True)
+        time.sleep(0.05)   # simulate a slow consumer
+    print("Stats:", cam.get_stats())
+
+    cam.close()
+
+def _bus_reader(name, seconds):
+    from FrameBusLib import FrameBusReader
+    reader = FrameBusReader(name)
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        item = reader.read(timeout=0.5)
+        if item is not None:
+            gray = cv2.cvtColor(item[0], cv2.COLOR_BGR2GRAY)
+    print("Reader stats:", reader.get_stats())
+    reader.close()
+
+def test_publish(seconds=5, readers=2):
+    import multiprocessing as mp
+    cam = CameraLib(width=640, height=480, rotate_180=True)
+    cam.publish("facetrack_frames")
+    procs = [mp.Process(target=_bus_reader, args=("facetrack_frames", seconds))
+             for _ in range(readers)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    print("Camera stats:", cam.get_stats())
+    cam.close()
+
+def test_burst(count=30):
+    cam = CameraLib(width=640, height=480, rotate_180=True)
+    cam.start_stream(buffers=3)
+    start = time.perf_counter()
+    futures = cam.capture_burst(count)
+    captured = time.perf_counter()
+    for f in futures:
+        f.result()
+    done = time.perf_counter()
+    print(f"Captured {count} frames in {captured - start:.2f} s, "
+          f"all saved after {done - start:.2f} s")
+    print("Encoder stats:", cam.encoder.get_stats())
+    cam.close()
+
+def benchmark_luma(frames=200, width=640, height=480, lores_size=(320, 240)):
+    """Compare RGB888 + cvtColor against the YUV420 luma view for detection input."""
+    results = {}
+    for name, kwargs in (("rgb", {}), ("luma", {"luma": True, "lores_size": lores_size})):
+        cam = CameraLib(width=width, height=height, rotate_180=False, **kwargs)
+        for _ in range(10):   # let exposure settle
+            cam.get_raw_frame()
+
+        capture_time = 0.0
+        gray_time = 0.0
+        for _ in range(frames):
+            t0 = time.perf_counter()
+            frame = cam.get_raw_frame()
+            t1 = time.perf_counter()
+            gray = cam.gray_view(frame)
+            t2 = time.perf_counter()
+            capture_time += t1 - t0
+            gray_time += t2 - t1
+
+        results[name] = {
+            "capture_ms": 1000.0 * capture_time / frames,
+            "gray_ms": 1000.0 * gray_time / frames,
+            "frame_bytes": frame.nbytes,
+        }
+        cam.close()
+        cam.picam2.close()
+
+    for name, r in results.items():
+        print(f"{name:5s} capture {r['capture_ms']:6.2f} ms  gray {r['gray_ms']:6.3f} ms"
+              f"  frame {r['frame_bytes'] / 1024:.0f} KB")
+    return results
@@ -0,0 +1,329 @@
+import numpy as np
+import json
+import os
+import time
+from LazyLib import lazy_import
+
+cv2 = lazy_import("cv2")
+
+# Default model locations for Raspberry Pi OS packages
+HAAR_PATH = "/usr/share/opencv4/haarcascades/haarcascade_frontalface_default.xml"
+LBP_PATH = "/usr/share/opencv4/lbpcascades/lbpcascade_frontalface_improved.xml"
+YUNET_PATH = "face_detection_yunet_2023mar.onnx"
+SSD_PROTO_PATH = "deploy.prototxt"
+SSD_MODEL_PATH = "res10_300x300_ssd_iter_140000.caffemodel"
+
+
+def _filter_size(faces, min_size, max_size):
+    if len(faces) == 0:
+        return faces
+    keep = np.ones(len(faces), dtype=bool)
+    if min_size:
+        keep &= (faces[:, 2] >= min_size[0]) & (faces[:, 3] >= min_size[1])
+    if max_size:
+        keep &= (faces[:, 2] <= max_size[0]) & (faces[:, 3] <= max_size[1])
+    return faces[keep]
+
+
+def _clip_boxes(faces, width, height):
+    """Clip (x, y, w, h) boxes to the image; the DNNs can return boxes past the edge."""
+    x0 = np.clip(faces[:, 0], 0, width)
+    y0 = np.clip(faces[:, 1], 0, height)
+    x1 = np.clip(faces[:, 0] + faces[:, 2], 0, width)
+    y1 = np.clip(faces[:, 1] + faces[:, 3], 0, height)
+    faces = np.stack([x0, y0, x1 - x0, y1 - y0], axis=1)
+    return faces[(faces[:, 2] > 0) & (faces[:, 3] > 0)]
+
+
+def _find_model(path):
+    """`path`, or the copy bundled with a pip OpenCV wheel if it is missing."""
+    if os.path.exists(path) or not hasattr(cv2, "data"):
+        return path
+    bundled = os.path.join(cv2.data.haarcascades, os.path.basename(path))
+    return bundled if os.path.exists(bundled) else path
+
+
+class CascadeDetector:
+    """OpenCV cascade (Haar or LBP) on a grayscale image."""
+    name = "cascade"
+
+    def __init__(self, model, scale_factor=1.3, min_neighbors=5):
+        # Off the Pi (e.g. CI) the OS cascade files are usually not there
+        model = _find_model(model)
+        self.model = model
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.cascade = cv2.CascadeClassifier(model)
+        if self.cascade.empty():
+            raise RuntimeError(f"Failed to load {self.name} cascade: " + model)
+
+    def detect(self, gray, min_size=None, max_size=None, scale_factor=None):
+        """Return an Nx4 array of (x, y, w, h) boxes.
+
+        `scale_factor` overrides the configured one for this call, e.g. a
+        finer pyramid step when refining a coarse box.
+        """
+        kwargs = {}
+        if min_size:
+            kwargs["minSize"] = tuple(min_size)
+        if max_size:
+            kwargs["maxSize"] = tuple(max_size)
+        return self.cascade.detectMultiScale(gray, scale_factor or self.scale_factor,
+                                             self.min_neighbors, **kwargs)
+
+
+class HaarDetector(CascadeDetector):
+    name = "haar"
+
+    def __init__(self, model=HAAR_PATH, scale_factor=1.3, min_neighbors=5):
+        super().__init__(model, scale_factor, min_neighbors)
+
+
+class LbpDetector(CascadeDetector):
+    """LBP cascade: integer features, usually 2-3x faster than Haar on the Pi."""
+    name = "lbp"
+
+    def __init__(self, model=LBP_PATH, scale_factor=1.2, min_neighbors=4):
+        super().__init__(model, scale_factor, min_neighbors)
+
+
+class YuNetDetector:
+    """YuNet CNN face detector through cv2.FaceDetectorYN (OpenCV >= 4.5.4).
+
+    Takes the same grayscale input as the cascades; it is expanded to
+    three channels for the network.
+    """
+    name = "yunet"
+
+    def __init__(self, model=YUNET_PATH, score_threshold=0.7, nms_threshold=0.3, top_k=50):
+        if not hasattr(cv2, "FaceDetectorYN"):
+            raise RuntimeError("YuNet needs OpenCV >= 4.5.4 (cv2.FaceDetectorYN)")
+        if not os.path.exists(model):
+            raise RuntimeError("YuNet model not found: " + model)
+        self.model = model
+        self.net = cv2.FaceDetectorYN.create(model, "", (320, 320),
+                                             score_threshold, nms_threshold, top_k)
+        self._input_size = (320, 320)
+
+    def detect(self, gray, min_size=None, max_size=None):
+        image = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR) if gray.ndim == 2 else gray
+        size = (image.shape[1], image.shape[0])
+        if size != self._input_size:
+            self.net.setInputSize(size)
+            self._input_size = size
+        _, found = self.net.detect(image)
+        if found is None:
+            return ()
+        faces = np.round(found[:, :4]).astype(np.int32)
+        faces = _clip_boxes(faces, size[0], size[1])
+        return _filter_size(faces, min_size, max_size)
+
+
+class SsdDetector:
+    """ResNet-10 SSD face model through cv2.dnn on the CPU."""
+    name = "ssd"
+
+    def __init__(self, proto=SSD_PROTO_PATH, model=SSD_MODEL_PATH, score_threshold=0.6,
+                 input_size=(300, 300)):
+        if not (os.path.exists(proto) and os.path.exists(model)):
+            raise RuntimeError("SSD model not found: " + model)
+        self.model = model
+        self.net = cv2.dnn.readNetFromCaffe(proto, model)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.score_threshold = score_threshold
+        self.input_size = input_size
+
+    def detect(self, gray, min_size=None, max_size=None):
+        image = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR) if gray.ndim == 2 else gray
+        height, width = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(image, 1.0, self.input_size, (104.0, 177.0, 123.0))
+        self.net.setInput(blob)
+        out = self.net.forward()[0, 0]
+        out = out[out[:, 2] >= self.score_threshold]
+        if len(out) == 0:
+            return ()
+        boxes = out[:, 3:7] * np.array([width, height, width, height])
+        boxes[:, 2:] -= boxes[:, :2]
+        faces = _clip_boxes(np.round(boxes).astype(np.int32), width, height)
+        return _filter_size(faces, min_size, max_size)
+
+
+BACKENDS = {
+    "haar": HaarDetector,
+    "lbp": LbpDetector,
+    "yunet": YuNetDetector,
+    "ssd": SsdDetector,
+}
+
+
+def make_detector(config=None):
+    """Build a detector from a config dict.
+
+    {"backend": "haar" | "lbp" | "yunet" | "ssd", ...}; every other key
+    except "scale" is passed to the backend (model, scale_factor,
+    min_neighbors, score_threshold, ...). "scale" is the detection scale
+    and is read by Facetrack.
+    """
+    config = dict(config or {})
+    backend = config.pop("backend", "haar")
+    config.pop("scale", None)
+    if backend not in BACKENDS:
+        raise ValueError("Unknown detector backend: " + str(backend))
+    return BACKENDS[backend](**config)
+
+
+class MotionGate:
+    """Cheap scene-change test to run before the face detector.
+
+    The gray frame is shrunk to `size` and compared with the frame from
+    the last time detection ran. Pixels that differ by more than
+    `pixel_threshold` gray levels count as changed; if fewer than
+    `threshold` (a fraction of the pixels) changed, the scene is treated
+    as unchanged and the previous detections can be reused. Counting
+    pixels rather than averaging the difference keeps a face-sized move
+    from being diluted by the still background. Detection is still forced
+    every `max_skip` frames to pick up slow lighting drift.
+    """
+    def __init__(self, size=(80, 60), threshold=0.002, pixel_threshold=12, max_skip=30):
+        self.size = size
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.max_skip = max_skip
+        self._small = np.empty((size[1], size[0]), dtype=np.uint8)
+        self._reference = None
+        self._diff = np.empty_like(self._small)
+        self._skipped_in_row = 0
+        self.last_score = 0.0
+        self.checked = 0
+        self.skipped = 0
+
+    def changed(self, gray):
+        """True if the detector should run on this frame."""
+        self.checked += 1
+        cv2.resize(gray, self.size, dst=self._small, interpolation=cv2.INTER_AREA)
+        if self._reference is None:
+            self._reference = self._small.copy()
+            return True
+
+        cv2.absdiff(self._small, self._reference, dst=self._diff)
+        cv2.threshold(self._diff, self.pixel_threshold, 255, cv2.THRESH_BINARY, dst=self._diff)
+        self.last_score = cv2.countNonZero(self._diff) / self._diff.size
+        if self.last_score < self.threshold and self._skipped_in_row < self.max_skip:
+            self._skipped_in_row += 1
+            self.skipped += 1
+            return False
+
+        self._skipped_in_row = 0
+        np.copyto(self._reference, self._small)
+        return True
+
+    def reset(self):
+        self._reference = None
+        self._skipped_in_row = 0
+
+    def get_stats(self):
+        return {
+            "checked": self.checked,
+            "skipped": self.skipped,
+            "skip_ratio": self.skipped / self.checked if self.checked else 0.0,
+            "last_score": self.last_score,
+        }
+
+
+def iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+# -------------------------
+# Benchmark
+# -------------------------
+def load_frames(frames_dir):
+    """Grayscale frames from a directory of images, in name order."""
+    names = sorted(n for n in os.listdir(frames_dir)
+                   if n.lower().endswith((".jpg", ".jpeg", ".png", ".bmp")))
+    frames = []
+    for n in names:
+        gray = cv2.imread(os.path.join(frames_dir, n), cv2.IMREAD_GRAYSCALE)
+        if gray is not None:
+            frames.append((n, gray))
+    return frames
+
+
+def benchmark_detectors(frames_dir, annotations=None, configs=None, scale=1.0, iou_threshold=0.5):
+    """Run each detector config over a recorded frame set.
+
+    `annotations` is a JSON file mapping image name to a list of
+    [x, y, w, h] ground-truth faces; without it recall is not reported.
+    Returns {name: {"ms_per_frame", "cpu_percent", "recall", ...}}.
+    """
+    frames = load_frames(frames_dir)
+    if not frames:
+        raise RuntimeError("No images found in " + frames_dir)
+    truth = None
+    if annotations:
+        with open(annotations) as f:
+            truth = json.load(f)
+    if configs is None:
+        configs = [{"backend": name} for name in BACKENDS]
+
+    results = {}
+    for config in configs:
+        name = config.get("name", config.get("backend", "haar"))
+        try:
+            detector = make_detector({k: v for k, v in config.items() if k != "name"})
+        except RuntimeError as e:
+            print(f"{name}: skipped ({e})")
+            continue
+
+        detector.detect(frames[0][1])   # warm up
+        hits = 0
+        expected = 0
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        for image_name, gray in frames:
+            if scale < 1.0:
+                small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                faces = detector.detect(small)
+                faces = [tuple(int(v / scale) for v in f) for f in faces]
+            else:
+                faces = [tuple(f) for f in detector.detect(gray)]
+            if truth is not None:
+                for gt in truth.get(image_name, []):
+                    expected += 1
+                    if any(iou(gt, f) >= iou_threshold for f in faces):
+                        hits += 1
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+
+        results[name] = {
+            "frames": len(frames),
+            "ms_per_frame": 1000.0 * wall / len(frames),
+            "cpu_percent": 100.0 * cpu / wall if wall > 0 else 0.0,
+            "recall": hits / expected if expected else None,
+        }
+
+    print(f"{'detector':10s} {'ms/frame':>9s} {'cpu %':>7s} {'recall':>7s}")
+    for name, r in results.items():
+        recall = f"{r['recall']:.3f}" if r["recall"] is not None else "-"
+        print(f"{name:10s} {r['ms_per_frame']:9.2f} {r['cpu_percent']:7.1f} {recall:>7s}")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark face detector backends")
+    parser.add_argument("frames_dir")
+    parser.add_argument("--annotations", help="JSON {image: [[x, y, w, h], ...]}")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS))
+    parser.add_argument("--scale", type=float, default=1.0)
+    args = parser.parse_args()
+    benchmark_detectors(args.frames_dir, args.annotations,
+                        [{"backend": b} for b in args.backends], args.scale)
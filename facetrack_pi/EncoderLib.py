@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from LazyLib import lazy_import
+
+cv2 = lazy_import("cv2")
+
+FORMATS = {
+    "jpg": ".jpg",
+    "jpeg": ".jpg",
+    "png": ".png",
+    "webp": ".webp",
+    "bmp": ".bmp",
+}
+
+
+def encode_params(fmt, quality):
+    """cv2.imencode parameters for `quality` (0-100) in the given format."""
+    if fmt in ("jpg", "jpeg"):
+        return [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+    if fmt == "webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+    if fmt == "png":
+        # PNG is lossless; map quality onto compression effort (100 -> fastest)
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(round(9 - 9 * quality / 100.0))]
+    return []
+
+
+class BufferPool:
+    """Fixed set of preallocated arrays handed out and returned by callers."""
+    def __init__(self, shape, dtype=np.uint8, count=4):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.count = count
+        self._free = [np.empty(shape, dtype) for _ in range(count)]
+        self._cond = threading.Condition()
+        self.waits = 0
+
+    def acquire(self, timeout=None):
+        """A free buffer, or None if none came back within `timeout`."""
+        with self._cond:
+            if not self._free:
+                self.waits += 1
+                if not self._cond.wait_for(lambda: self._free, timeout):
+                    return None
+            return self._free.pop()
+
+    def release(self, buf):
+        with self._cond:
+            self._free.append(buf)
+            self._cond.notify()
+
+    def available(self):
+        with self._cond:
+            return len(self._free)
+
+
+class ImageEncoder:
+    """Encode and save images on background threads.
+
+    cv2.imencode and file writes release the GIL, so a couple of threads
+    keep JPEG work off the capture/detection loop. At most `max_pending`
+    images are queued or in progress; past that submit() waits (block=True)
+    or drops the image, so a slow SD card cannot eat all the memory.
+    """
+    def __init__(self, workers=2, max_pending=8, quality=90, format="jpg"):
+        if format not in FORMATS:
+            raise ValueError("format must be one of " + ", ".join(FORMATS))
+        self.quality = quality
+        self.format = format
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="encoder")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.pending = 0
+        self.max_pending_seen = 0
+        self.bytes_written = 0
+        self.encode_time = 0.0
+        self.write_time = 0.0
+
+    def submit(self, image, filename=None, quality=None, format=None, block=True,
+               timeout=None, convert=None, release=None):
+        """Queue `image` for encoding and return a Future, or None if dropped.
+
+        The Future resolves to `filename` once the file is written, or to
+        the encoded bytes when `filename` is None. The caller must not
+        touch `image` until then; `release(image)` is called when the
+        encoder is done with it, e.g. to return it to a BufferPool.
+        `convert(image)` runs on the worker first (colour conversion,
+        rotation). The format comes from `format`, else from the file
+        extension, else the encoder default. With `block` a full queue is
+        waited on for up to `timeout` seconds (None: forever); without it
+        the image is dropped at once and `timeout` is ignored.
+        """
+        fmt = format
+        if fmt is None and filename:
+            fmt = os.path.splitext(filename)[1][1:].lower() or None
+        fmt = fmt or self.format
+        if fmt not in FORMATS:
+            # Checked before taking a slot; the image is still handed back
+            if release is not None:
+                release(image)
+            raise ValueError("Unsupported image format: " + fmt)
+
+        # Semaphore.acquire() refuses a timeout when not blocking
+        if not (self._slots.acquire(True, timeout) if block else self._slots.acquire(False)):
+            with self._lock:
+                self.dropped += 1
+            if release is not None:
+                release(image)
+            return None
+
+        if filename and not os.path.splitext(filename)[1]:
+            filename += FORMATS[fmt]
+        quality = self.quality if quality is None else quality
+
+        with self._lock:
+            self.submitted += 1
+            self.pending += 1
+            self.max_pending_seen = max(self.max_pending_seen, self.pending)
+        return self._executor.submit(self._encode, image, filename, fmt, quality,
+                                     convert, release)
+
+    def _encode(self, image, filename, fmt, quality, convert, release):
+        try:
+            start = time.perf_counter()
+            frame = convert(image) if convert is not None else image
+            ok, data = cv2.imencode(FORMATS[fmt], frame, encode_params(fmt, quality))
+            if release is not None:
+                release(image)
+                release = None
+            if not ok:
+                raise RuntimeError("Failed to encode image as " + fmt)
+            encoded = time.perf_counter()
+            if filename:
+                with open(filename, "wb") as f:
+                    f.write(data)
+            written = time.perf_counter()
+            with self._lock:
+                self.completed += 1
+                self.bytes_written += len(data)
+                self.encode_time += encoded - start
+                self.write_time += written - encoded
+            return filename if filename else data.tobytes()
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            if release is not None:
+                release(image)
+            with self._lock:
+                self.pending -= 1
+            self._slots.release()
+
+    def get_stats(self):
+        with self._lock:
+            done = self.completed
+            return {
+                "submitted": self.submitted,
+                "completed": done,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "pending": self.pending,
+                "max_pending": self.max_pending_seen,
+                "bytes": self.bytes_written,
+                "avg_encode_ms": 1000.0 * self.encode_time / done if done else 0.0,
+                "avg_write_ms": 1000.0 * self.write_time / done if done else 0.0,
+            }
+
+    def close(self, wait=True):
+        """Stop accepting work; with `wait` finish everything queued first."""
+        self._executor.shutdown(wait=wait)
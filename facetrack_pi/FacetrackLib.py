@@ -1,71 +1,791 @@
-import cv2
+import numpy as np
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from CameraLib import CameraLib
 from ServoLib import ServoLib
+from PipelineLib import LatestQueue, Stage
+from MetricsLib import Metrics
+from DetectorLib import CascadeDetector, make_detector, MotionGate, iou
+from TrackerLib import FaceTracker
+from ParallelDetectLib import ParallelDetector
+from StreamLib import MjpegServer
+from FrameSourceLib import make_source
+from LazyLib import lazy_import, import_times
 
+cv2 = lazy_import("cv2")
 
 
 class Facetrack:
-    def __init__(self):
+    def __init__(self, stream=True, roi_search=False, roi_margin=0.5, rescan_interval=10,
+                 detect_scale=1.0, refine=False, scale_factor=None, min_neighbors=None,
+                 luma=False, lores_size=None, async_servo=True, servo_backend="gpiozero",
+                 metrics_port=None, metrics_log=None, detector_config=None,
+                 motion_gate=False, motion_threshold=0.002,
+                 track_faces=False, detect_every=1, target_policy="largest",
+                 parallel_workers=None, parallel_mode="frames",
+                 display="window", stream_port=8080, stream_host="127.0.0.1",
+                 stream_fps=10.0, stream_size=(320, 240),
+                 buffer_pool=False, source=None):
         print("Initializing facetracker...")
 
+        # Detector backend (haar, lbp, yunet, ssd), see DetectorLib. The
+        # default is the Haar frontal-face cascade from the Raspberry Pi OS
+        # packages; a config "scale" overrides detect_scale. scale_factor and
+        # min_neighbors go to the cascade backends unless the config sets
+        # them too.
+        detector_config = dict(detector_config or {"backend": "haar"})
+        if detector_config.get("backend", "haar") in ("haar", "lbp"):
+            if scale_factor is not None:
+                detector_config.setdefault("scale_factor", scale_factor)
+            if min_neighbors is not None:
+                detector_config.setdefault("min_neighbors", min_neighbors)
+        detect_scale = detector_config.get("scale", detect_scale)
+
+        # Multi-resolution detection: run the cascade on the gray image
+        # shrunk by `detect_scale` (e.g. 0.5 or 0.25) and map boxes back to
+        # full resolution. `refine` re-detects at full resolution inside
+        # each coarse box to recover precision.
+        if not 0 < detect_scale <= 1.0:
+            raise ValueError("detect_scale must be in (0, 1]")
+        self.detect_scale = detect_scale
+        self.refine = refine
+
+        # Everything that can reject its arguments is checked or built
+        # before the metrics server, camera and servo start, so a bad value
+        # never leaves them running.
+        if display not in ("window", "mjpeg", None):
+            raise ValueError("display must be 'window', 'mjpeg' or None")
+        width, height = 640, 480
+
+        # Multi-face tracking: keep IDs across frames, run the detector only
+        # every `detect_every` frames and predict positions in between. The
+        # servo follows the track picked by `target_policy` ("largest",
+        # "center" or "first") instead of whichever face came first.
+        self.tracker = None
+        if track_faces:
+            self.tracker = FaceTracker(frame_size=(width, height),
+                                       detect_every=detect_every, policy=target_policy)
+
+        # Stage timings, FPS and glass-to-servo latency. metrics_port serves
+        # /metrics and /metrics.json on localhost, metrics_log appends a
+        # JSON line every 10 s.
+        self.metrics = Metrics()
+        if metrics_port:
+            self.metrics.serve(port=metrics_port)
+        if metrics_log:
+            self.metrics.start_jsonl(metrics_log)
+        self.frame_timestamp = None
+        self._held = (None, None, None)   # buffers of the last process_frame()
+
+        # Camera, servo and detector do not depend on each other, so they
+        # start on threads at the same time (see _start_parts); `startup`
+        # holds the seconds each phase took.
+        self.startup = {}
+        self._init_start = time.perf_counter()
+        self._first_frame_done = False
+        phases = {
+            "camera": lambda: self._start_camera(width, height, stream, luma, lores_size,
+                                                 buffer_pool, source),
+            "servo": lambda: self._start_servo(servo_backend, async_servo),
+        }
+        # With parallel detection the pool has its own detectors; this
+        # process only needs one to refine coarse boxes at full resolution.
+        if parallel_workers is None or (refine and detect_scale < 1.0):
+            phases["detector"] = lambda: make_detector(detector_config)
+        parts = self._start_parts(
+            parallel_config=dict(detector_config, scale=detect_scale),
+            parallel_workers=parallel_workers, parallel_mode=parallel_mode, **phases)
+        self.cam = parts["camera"]
+        self.servo = parts["servo"]
+        self.detector = parts.get("detector")
+
+        # Parallel detection on a pool of `parallel_workers` processes (0
+        # runs inline), see ParallelDetectLib. "tiles" splits every frame
+        # across the workers; "frames" keeps several frames in flight and
+        # only pays off in track_pipelined().
+        self.parallel = parts.get("parallel")
+
+        # ROI search: look only around the last face and rescan the full
+        # frame every `rescan_interval` frames or when the face is lost.
+        # `roi_margin` is the fraction of the face size added on each side.
+        self.roi_search = roi_search
+        self.roi_margin = roi_margin
+        self.rescan_interval = rescan_interval
+        self._last_face = None
+        self._frames_since_rescan = 0
+        self.pixels_scanned = 0
+        self.detect_stats = {"frames": 0, "full_scans": 0, "roi_scans": 0, "pixels": 0,
+                             "skipped": 0}
+
+        # Motion gate: when the downscaled scene has not changed since the
+        # last detection, reuse those faces and skip the detector.
+        # motion_threshold is the share of its pixels that must change.
+        self.motion_gate = MotionGate(threshold=motion_threshold) if motion_gate else None
+        self._last_faces = ()
+
+        # Display: "window" shows every frame with cv2.imshow, "mjpeg" serves
+        # a reduced-rate annotated stream on `stream_port` (see StreamLib)
+        # for headless units, None shows nothing. The stream only listens on
+        # localhost unless `stream_host` is e.g. "0.0.0.0".
+        self.display = display
+        self.streamer = None
+        if display == "mjpeg":
+            try:
+                self.streamer = MjpegServer(port=stream_port, host=stream_host,
+                                            fps=stream_fps, size=stream_size)
+            except Exception:
+                # e.g. the port is taken: stop what _start_parts started
+                self._close_parts(parts)
+                raise
+        self.last_key = 0xFF
+
+        # Pipelined tracking state (see track_pipelined)
+        self._stop_event = None
+        self._last_seq = 0
+
+        self.startup["init_total"] = time.perf_counter() - self._init_start
+        self.print_startup()
+
+    # -------------------------
+    # Startup
+    # -------------------------
+    def _timed(self, name, func):
+        start = time.perf_counter()
+        result = func()
+        self.startup[name] = time.perf_counter() - start
+        self.metrics.record("startup_" + name, self.startup[name])
+        return result
+
+    def _start_camera(self, width, height, stream, luma, lores_size, buffer_pool, source):
         # Camera. 180==true because Pi Camera is mounted upside down...
-        self.cam = CameraLib(width=640, height=480, rotate_180=True)
+        # luma=True detects on the YUV420 Y plane instead of converting RGB.
+        # buffer_pool=True recycles frame and work buffers so the steady
+        # state loop allocates no frame-sized arrays (cam.buffers counts).
+        # `source` replays a clip instead (see FrameSourceLib).
+        cam = CameraLib(width=width, height=height, rotate_180=True,
+                        luma=luma, lores_size=lores_size, buffer_pool=buffer_pool,
+                        source=source)
 
-        # Servo
-        self.servo = ServoLib("face-servo", 18)
+        # Capture on a background thread so detection overlaps the next
+        # sensor readout instead of waiting for it.
+        try:
+            if stream:
+                cam.start_stream(buffers=3)
+        except Exception:
+            cam.close()
+            raise
+        return cam
 
-        # Correct Haar path for Raspberry Pi OS packages
-        haar_path = "/usr/share/opencv4/haarcascades/haarcascade_frontalface_default.xml"
+    def _start_servo(self, servo_backend, async_servo):
+        # Servo. With the motion controller running set_angle() returns
+        # at once and only the newest target is followed. servo_backend
+        # None runs without one, e.g. for benchmarks.
+        if servo_backend is None:
+            return None
+        servo = ServoLib("face-servo", 18, backend=servo_backend)
+        if async_servo:
+            servo.start_controller(max_speed=300.0, accel=1500.0)
+        return servo
 
-        self.detector = cv2.CascadeClassifier(haar_path)
+    def _start_parts(self, parallel_config, parallel_workers, parallel_mode, **phases):
+        """Run the startup phases concurrently; returns {name: result}.
 
-        if self.detector.empty():
-            raise RuntimeError("Failed to load Haar cascade: " + haar_path)
+        cv2, picamera2 and gpiozero are imported lazily (see LazyLib), so
+        each thread also pays for its own imports in parallel. The
+        parallel detector pool is forked here on the calling thread,
+        before any startup thread runs, and is only waited on in a phase.
+        If any phase fails, whatever did start is closed and the first
+        error is raised.
+        """
+        parts = {}
+        if parallel_workers is not None:
+            start = time.perf_counter()
+            try:
+                parts["parallel"] = ParallelDetector(parallel_config, workers=parallel_workers,
+                                                     mode=parallel_mode, wait=False)
+            except Exception:
+                self._close_parts(parts)
+                raise
+            self.startup["parallel_spawn"] = time.perf_counter() - start
+            phases["parallel"] = lambda: parts["parallel"].wait_ready()
 
-    def process_frame(self, window_name="Facetrack"):
-        frame = self.cam.get_frame()
+        errors = []
+        with ThreadPoolExecutor(max_workers=len(phases), thread_name_prefix="startup") as pool:
+            futures = {name: pool.submit(self._timed, name, func)
+                       for name, func in phases.items()}
+        for name, future in futures.items():
+            try:
+                result = future.result()
+            except Exception as e:
+                errors.append((name, e))
+                continue
+            if name != "parallel":
+                parts[name] = result
+
+        if errors:
+            for name, error in errors:
+                print(f"Startup of {name} failed: {error}")
+            self._close_parts(parts)
+            raise errors[0][1]
+        return parts
+
+    def _close_parts(self, parts):
+        if "parallel" in parts:
+            parts["parallel"].close()
+        if "camera" in parts:
+            parts["camera"].close()
+        if parts.get("servo") is not None:
+            parts["servo"].stop_servo()
+        self.metrics.close()
+
+    def print_startup(self):
+        print("Startup (ms):", ", ".join(f"{name} {1000.0 * seconds:.0f}"
+                                         for name, seconds in self.startup.items()))
+        if import_times:
+            print("Lazy imports (ms):", ", ".join(f"{name} {1000.0 * seconds:.0f}"
+                                                for name, seconds in import_times.items()))
+
+    def _frame_tracked(self):
+        # Time from the constructor being called to the first frame with
+        # detection done, as seen by whoever restarted the service
+        if not self._first_frame_done:
+            self._first_frame_done = True
+            self.startup["first_frame"] = time.perf_counter() - self._init_start
+            self.metrics.record("startup_first_frame", self.startup["first_frame"])
+            print(f"First frame tracked {1000.0 * self.startup['first_frame']:.0f} ms"
+                  " after startup began")
+
+    def find_faces(self, frame):
+        """Faces in raw frame coordinates; with tracking on, the target is first."""
+        if self.tracker is None:
+            return self.detect(frame)
+        detections = self.detect(frame) if self.tracker.should_detect() else None
+        return self._track(detections)
+
+    def _track(self, detections):
+        with self.metrics.time("track"):
+            self.tracker.step(detections)
+            return self.tracker.boxes()
+
+    def detect(self, frame):
+        with self.metrics.time("gray"):
+            gray = self.cam.gray_view(frame)
+        with self.metrics.time("detect"):
+            faces = self.detect_gray(gray)
+        self.cam.buffers.release(gray)
+        return faces
+
+    def detect_gray(self, gray):
+        self.pixels_scanned = 0
+        faces = ()
+
+        if self.motion_gate is not None and not self.motion_gate.changed(gray):
+            self.detect_stats["frames"] += 1
+            self.detect_stats["skipped"] += 1
+            return self._last_faces
+
+        full_scan = (not self.roi_search or self._last_face is None
+                     or self._frames_since_rescan >= self.rescan_interval)
+
+        if not full_scan:
+            x0, y0, x1, y1 = self._search_region(gray.shape)
+            roi = gray[y0:y1, x0:x1]
+            faces = self._run_detector(roi)
+            self.detect_stats["roi_scans"] += 1
+            if len(faces) > 0:
+                faces = faces + (x0, y0, 0, 0)
+                self._frames_since_rescan += 1
+            else:
+                # Lost it: fall back to the whole frame right away
+                full_scan = True
+
+        if full_scan:
+            faces = self._run_detector(gray)
+            self.detect_stats["full_scans"] += 1
+            self._frames_since_rescan = 0
+
+        self._last_face = tuple(faces[0]) if len(faces) > 0 else None
+        self._last_faces = faces
+        self.detect_stats["frames"] += 1
+        self.detect_stats["pixels"] += self.pixels_scanned
+        return faces
+
+    def _run_detector(self, gray):
+        """Run the detector at detect_scale; boxes come back in gray's coordinates."""
+        if self.parallel is not None:
+            # The workers do the downscaling
+            self.pixels_scanned += int(gray.size * self.detect_scale ** 2)
+            faces = self.parallel.detect(gray)
+            if self.refine and self.detect_scale < 1.0 and len(faces) > 0:
+                faces = np.array([self._refine_box(gray, box) for box in faces], dtype=np.int32)
+            return faces
+
+        if self.detect_scale >= 1.0:
+            self.pixels_scanned += gray.size
+            return self.detector.detect(gray)
+
+        size = (int(gray.shape[1] * self.detect_scale + 0.5),
+                int(gray.shape[0] * self.detect_scale + 0.5))
+        dst, buf = self._small_buffer(size)
+        small = self.cam.buffers.track(
+            cv2.resize(gray, size, dst=dst, interpolation=cv2.INTER_AREA), dst)
+        self.pixels_scanned += small.size
+        faces = self.detector.detect(small)
+        self.cam.buffers.release(buf)
+        if len(faces) == 0:
+            return faces
+
+        faces = np.round(faces / self.detect_scale).astype(np.int32)
+        if self.refine:
+            faces = np.array([self._refine_box(gray, box) for box in faces], dtype=np.int32)
+        return faces
+
+    def _small_buffer(self, size):
+        # One full-frame sized buffer; ROI scans use its top-left corner so
+        # changing ROI sizes do not force a new allocation. Returns the
+        # view to resize into (None if it does not fit) and the buffer to
+        # release afterwards.
+        full = (int(self.cam.height * self.detect_scale + 0.5),
+                int(self.cam.width * self.detect_scale + 0.5))
+        buf = self.cam.buffers.acquire("small", full)
+        if buf is None or size[0] > full[1] or size[1] > full[0]:
+            return None, buf
+        return buf[:size[1], :size[0]], buf
+
+    def _refine_box(self, gray, box, pad=0.25):
+        """Re-detect at full resolution in a padded window around a coarse box."""
+        height, width = gray.shape[:2]
+        x, y, w, h = box
+        px = int(w * pad)
+        py = int(h * pad)
+        x0 = max(0, x - px)
+        y0 = max(0, y - py)
+        x1 = min(width, x + w + px)
+        y1 = min(height, y + h + py)
+        window = gray[y0:y1, x0:x1]
+        self.pixels_scanned += window.size
 
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = self.detector.detectMultiScale(gray, 1.3, 5)
+        # Cascades step the pyramid finely here; the window is small
+        kwargs = {"scale_factor": 1.1} if isinstance(self.detector, CascadeDetector) else {}
+        found = self.detector.detect(
+            window,
+            min_size=(int(w * 0.7), int(h * 0.7)),
+            max_size=(x1 - x0, y1 - y0), **kwargs)
+        if len(found) == 0:
+            return box
+        # Keep the biggest candidate; small ones are usually eyes or noise
+        fx, fy, fw, fh = max(found, key=lambda f: f[2] * f[3])
+        return (fx + x0, fy + y0, fw, fh)
 
+    def _search_region(self, shape):
+        """Last face box grown by roi_margin on each side, clipped to the frame."""
+        height, width = shape[:2]
+        x, y, w, h = self._last_face
+        mx = int(w * self.roi_margin)
+        my = int(h * self.roi_margin)
+        x0 = max(0, x - mx)
+        y0 = max(0, y - my)
+        x1 = min(width, x + w + mx)
+        y1 = min(height, y + h + my)
+        return x0, y0, x1, y1
+
+    def get_alloc_stats(self):
+        """Frame-sized allocations per frame, see BufferLib.WorkBuffers."""
+        return self.cam.buffers.get_stats()
+
+    def get_detect_stats(self):
+        stats = dict(self.detect_stats)
+        frames = stats["frames"]
+        stats["pixels_last"] = self.pixels_scanned
+        stats["pixels_per_frame"] = stats["pixels"] / frames if frames else 0.0
+        stats["skip_ratio"] = stats["skipped"] / frames if frames else 0.0
+        return stats
+
+    def draw(self, frame, faces):
+        # Boxes are in full-resolution coordinates; the display frame may
+        # come from the smaller lores stream.
+        s = frame.shape[1] / self.cam.width
         for (x, y, w, h) in faces:
+            if s != 1:
+                x, y, w, h = int(x*s), int(y*s), int(w*s), int(h*s)
             cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+        return frame
+
+    def target_angle(self, frame, faces):
+        """Servo angle that centers faces[0], or None if there is no face."""
+        if len(faces) == 0:
+            return None
+        (x, y, w, h) = faces[0]
+
+        face_center = x + w/2
+        frame_center = self.cam.width / 2
+
+        error = (face_center - frame_center) / frame_center
+        return 90 + error * 40
+
+    def process_frame(self, window_name="Facetrack"):
+        """Capture, detect and show one frame; returns (colour frame or None, faces).
+
+        In buffer-pool mode the frame is only valid until the next call.
+        """
+        # Detect on the frame as the sensor delivered it and rotate only
+        # the boxes and the displayed image.
+        self._release_held()
+        with self.metrics.time("capture"):
+            raw, lores = self.cam.get_raw_frames()
+        self.frame_timestamp = self.cam.frame_timestamp
 
-        # Show frame
-        cv2.imshow(window_name, frame)
-        cv2.waitKey(1)
+        faces = self.cam.upright_boxes(self.find_faces(raw), (self.cam.height, self.cam.width))
+        frame = self.show(raw, lores, faces, window_name)
+        self._held = (raw, lores, frame)
 
+        self.metrics.frame_done()
+        self.cam.buffers.frame_done()
+        self._frame_tracked()
         return frame, faces
 
+    def _release_held(self):
+        # Buffers from the last process_frame(), which the caller may have
+        # used until now; raw and frame can be the same array.
+        raw, lores, frame = self._held
+        self._held = (None, None, None)
+        self.cam.buffers.release(raw, lores)
+        if frame is not raw:
+            self.cam.buffers.release(frame)
+
+    def _release_item(self, item):
+        # Give back the buffers of a pipeline queue item
+        self.cam.buffers.release(*(x for x in item if isinstance(x, np.ndarray)))
+
+    def show(self, raw, lores, faces, window_name="Facetrack"):
+        """Display one frame; returns the colour frame, or None if none was made.
+
+        In window mode the pressed key is left in `last_key`. In mjpeg mode
+        frames are only converted when the stream wants one, and not into
+        a pooled buffer as the stream's thread keeps them.
+        """
+        if self.display == "mjpeg":
+            if not self.streamer.wants_frame():
+                return None
+            with self.metrics.time("to_color"):
+                frame = self.cam.to_color(raw, lores, pooled=False)
+                if frame is raw:
+                    # No conversion was needed, but raw goes back to the
+                    # pool or ring while the stream thread still encodes it
+                    frame = raw.copy()
+                    self.cam.buffers.count()
+            label = f"{self.metrics.fps.fps:.1f} fps"
+            self.streamer.publish(frame, faces, source_width=self.cam.width, label=label)
+            return frame
+        if self.display != "window":
+            return None
+
+        with self.metrics.time("to_color"):
+            frame = self.cam.to_color(raw, lores)
+        with self.metrics.time("draw"):
+            self.draw(frame, faces)
+        with self.metrics.time("display"):
+            cv2.imshow(window_name, frame)
+            self.last_key = cv2.waitKey(1) & 0xFF
+        return frame
+
+    def actuate(self, frame, faces, timestamp):
+        """Point the servo at the target face of a frame captured at `timestamp`."""
+        target_angle = self.target_angle(frame, faces)
+        if target_angle is None or self.servo is None:
+            return
+        self.metrics.latency_since("glass_to_servo_command", timestamp)
+        with self.metrics.time("servo_command"):
+            move = self.servo.set_angle(target_angle, steps=3)
+        if move is None:
+            # Blocking move: the servo is already at the target.
+            self.metrics.latency_since("glass_to_servo_arrival", timestamp)
+        else:
+            # The motion controller finishes the move later; a superseded
+            # target is cancelled and never arrives.
+            move.add_done_callback(lambda done: done.cancelled() or
+                                   self.metrics.latency_since("glass_to_servo_arrival", timestamp))
+
+    def snapshot(self, filename=None):
+        """Save the current view in the background; None if the encoder is busy."""
+        if filename is None:
+            filename = time.strftime("snapshot_%Y%m%d_%H%M%S.jpg")
+        future = self.cam.capture_async(filename, block=False)
+        if future is None:
+            print("Snapshot skipped, encoder busy")
+        return future
+
     def track(self):
         print("Tracking started. Press CTRL+C to stop.")
 
-        while True:
-            frame, faces = self.process_frame()
+        try:
+            while True:
+                frame, faces = self.process_frame()
+                self.actuate(frame, faces, self.frame_timestamp)
 
-            if len(faces) > 0:
-                (x, y, w, h) = faces[0]
+                # Key from the waitKey() in show(); window mode only
+                if self.last_key == ord('s'):
+                    self.snapshot()
+                elif self.last_key == ord('q'):
+                    break
+                self.last_key = 0xFF
+        except KeyboardInterrupt:
+            print("Interrupted.")
+        except EOFError:
+            print("End of frame source.")
 
-                face_center = x + w/2
-                frame_center = frame.shape[1] / 2
+        self.cleanup()
 
-                error = (face_center - frame_center) / frame_center
-                target_angle = 90 + error * 40
+    # -------------------------
+    # Pipelined tracking
+    # -------------------------
+    def track_pipelined(self, window_name="Facetrack", show=True):
+        """Run capture, detection and servo control on separate threads.
 
-                self.servo.set_angle(target_angle, steps=3)
+        Stages are joined by single-slot latest-wins queues, so each stage
+        always works on the newest data and drops anything it fell behind
+        on. Display stays on the calling thread because HighGUI is not
+        thread safe.
+        """
+        print("Pipelined tracking started. Press 's' to save a snapshot, 'q' or CTRL+C to stop.")
 
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
+        self._stop_event = threading.Event()
+        # Frames are shared by the detect and display queues; whoever is
+        # last done with one (or drops it) gives its buffers back.
+        self._frame_q = LatestQueue(maxsize=1, on_drop=self._release_item)
+        self._detect_q = LatestQueue(maxsize=1, on_drop=self._release_item)
+        self._display_q = LatestQueue(maxsize=1, on_drop=self._release_item)
+
+        detect_stage = self._detect_stage
+        if self.parallel is not None and self.parallel.mode == "frames":
+            detect_stage = self._parallel_detect_stage
+        self._stages = [
+            Stage("capture", self._capture_stage, self._stop_event),
+            Stage("detect", detect_stage, self._stop_event),
+            Stage("actuate", self._actuate_stage, self._stop_event),
+        ]
+        for stage in self._stages:
+            stage.start()
+
+        try:
+            while not self._stop_event.is_set():
+                item = self._display_q.get(timeout=0.1)
+                if item is None:
+                    continue
+                if not show:
+                    self._release_item(item)
+                    continue
+                seq, timestamp, raw, lores, faces = item
+                frame = self.show(raw, lores, faces, window_name)
+                if frame is not raw and frame is not lores:
+                    self.cam.buffers.release(frame)
+                self._release_item(item)
+                if self.last_key == ord('s'):
+                    self.snapshot()
+                elif self.last_key == ord('q'):
+                    break
+                self.last_key = 0xFF
+        except KeyboardInterrupt:
+            print("Interrupted.")
+        finally:
+            self.stop_pipeline()
+
+    def _capture_stage(self):
+        start = time.perf_counter()
+        if self.cam.is_streaming():
+            try:
+                frame, lores, seq, timestamp = self.cam.get_latest(
+                    wait_new=True, timeout=0.1, with_lores=True, consumer="pipeline")
+            except RuntimeError:
+                # No first frame yet (sensor start-up, slow frame source);
+                # that is no work this round, not a reason to stop
+                return False
+            if seq == self._last_seq:
+                return False
+            self._last_seq = seq
+            # Later stages hold on to the frame, so take it out of the ring
+            frame = self.cam.owned_copy(frame, "pipeline")
+            if lores is not None:
+                lores = self.cam.owned_copy(lores, "pipeline_lores")
+        else:
+            frame, lores = self.cam.get_raw_frames()
+            timestamp = self.cam.frame_timestamp
+            self._last_seq += 1
+            seq = self._last_seq
+        self.metrics.record("capture", time.perf_counter() - start)
+        self._put(self._frame_q, (seq, timestamp, frame, lores))
+        return True
+
+    def _put(self, queue, item):
+        if not queue.put(item):
+            self._release_item(item)
+
+    def _pass_on(self, seq, timestamp, frame, lores, faces):
+        # The frame goes to both queues, so it gets a second holder
+        self._put(self._detect_q, (seq, timestamp, self.cam.buffers.retain(frame), faces))
+        self._put(self._display_q, (seq, timestamp, frame, lores, faces))
+
+    def _detect_stage(self):
+        item = self._frame_q.get(timeout=0.1)
+        if item is None:
+            return False
+        seq, timestamp, frame, lores = item
+        faces = self.cam.upright_boxes(self.find_faces(frame), (self.cam.height, self.cam.width))
+        self._pass_on(seq, timestamp, frame, lores, faces)
+        self.metrics.frame_done()
+        self.cam.buffers.frame_done()
+        self._frame_tracked()
+        return True
+
+    def _parallel_detect_stage(self):
+        # Keep the worker pool fed and pass results on in frame order.
+        # ROI search and the motion gate are per-frame serial state, so
+        # they are not used here.
+        item = self._frame_q.get(timeout=0.01)
+        if item is not None:
+            with self.metrics.time("gray"):
+                gray = self.cam.gray_view(item[2])
+            self.parallel.submit(gray, payload=(item, gray))
 
+        done = self.parallel.collect()
+        for _, ((seq, timestamp, frame, lores), gray), faces in done:
+            self.cam.buffers.release(gray)
+            if self.tracker is not None:
+                faces = self._track(faces)
+            faces = self.cam.upright_boxes(faces, (self.cam.height, self.cam.width))
+            self.metrics.latency_since("capture_to_detect", timestamp)
+            self._pass_on(seq, timestamp, frame, lores, faces)
+            self.metrics.frame_done()
+            self.cam.buffers.frame_done()
+            self._frame_tracked()
+        return item is not None or len(done) > 0
+
+    def _actuate_stage(self):
+        item = self._detect_q.get(timeout=0.1)
+        if item is None:
+            return False
+        seq, timestamp, frame, faces = item
+        self.actuate(frame, faces, timestamp)
+        self._release_item(item)
+        return True
+
+    def stop_pipeline(self):
+        """Stop all pipeline stages, then release the camera and servo."""
+        if self._stop_event is None:
+            return
+        self._stop_event.set()
+        for q in (self._frame_q, self._detect_q, self._display_q):
+            q.close()
+        for stage in self._stages:
+            if not stage.join(timeout=2.0):
+                print(f"Warning: stage '{stage.name}' did not stop within timeout.")
+        for stage in self._stages:
+            print(f"{stage.name}: {stage.get_stats()}")
+        print("dropped frames:", self._frame_q.drop_count,
+              "dropped detections:", self._detect_q.drop_count)
+        self._stop_event = None
         self.cleanup()
 
     def cleanup(self):
         print("Cleaning up...")
+        self._release_held()
+        print("frame allocations:", self.get_alloc_stats())
+        self.metrics.close()
+        if self.parallel is not None:
+            print("parallel detection:", self.parallel.get_stats())
+            self.parallel.close()
+        if self.streamer is not None:
+            self.streamer.close()
         self.cam.close()
-        self.servo.stop_servo()
-        cv2.destroyAllWindows()
+        if self.servo is not None:
+            self.servo.stop_servo()
+        if self.display == "window":
+            cv2.destroyAllWindows()
+
+
+
+def benchmark_tracking(source, frames=None, warmup=10, **kwargs):
+    """Run Facetrack over a frame source and report FPS and latency percentiles.
+
+    Runs without a servo or display unless `kwargs` ask for them (e.g.
+    servo_backend="sim"); other keyword arguments go to Facetrack. Stops after `frames` frames or at
+    the end of a non-looping source. "frame" is the time for a whole
+    process_frame() call, "capture_to_faces" the time from a frame's
+    capture to its faces being known. For a SyntheticSource the share of
+    frames whose true face was found is reported too.
+    """
+    kwargs.setdefault("servo_backend", None)
+    kwargs.setdefault("display", None)
+    kwargs.setdefault("stream", False)
+    ft = Facetrack(source=source, **kwargs)
+    truth = getattr(source, "truth", None) is not None and not ft.cam.is_streaming()
+    count = 0
+    found = 0
+    try:
+        for _ in range(warmup):
+            ft.process_frame()
+        ft.metrics.reset()
+        start = time.perf_counter()
+        while frames is None or count < frames:
+            frame_start = time.perf_counter()
+            try:
+                frame, faces = ft.process_frame()
+            except EOFError:
+                break
+            ft.actuate(frame, faces, ft.frame_timestamp)
+            ft.metrics.record("frame", time.perf_counter() - frame_start)
+            ft.metrics.latency_since("capture_to_faces", ft.frame_timestamp)
+            if truth and any(iou(face, box) >= 0.5 for face in faces for box in source.truth):
+                found += 1
+            count += 1
+        elapsed = time.perf_counter() - start
+    finally:
+        ft.cleanup()
+
+    stages = ft.metrics.snapshot()["stages"]
+    results = {"frames": count, "seconds": elapsed,
+               "fps": count / elapsed if elapsed > 0 else 0.0,
+               "source": source.get_stats(), "stages": stages}
+    if truth:
+        results["found"] = found / count if count else 0.0
 
+    print(f"{count} frames in {elapsed:.2f} s: {results['fps']:.1f} fps")
+    if truth:
+        print(f"true face found in {100.0 * results['found']:.1f}% of frames")
+    print(f"{'stage':22s} {'mean':>7s} {'p50':>7s} {'p95':>7s} {'p99':>7s} {'max':>7s}  (ms)")
+    for name, s in stages.items():
+        if name.startswith("startup_"):
+            continue
+        print(f"{name:22s} {1000 * s['mean']:7.2f} {1000 * s['p50']:7.2f} {1000 * s['p95']:7.2f}"
+              f" {1000 * s['p99']:7.2f} {1000 * s['max']:7.2f}")
+    return results
 
 if __name__ == "__main__":
-    ft = Facetrack()
-    ft.track()
+    import argparse
+    parser = argparse.ArgumentParser(description="Track faces, or benchmark tracking over a clip")
+    parser.add_argument("--benchmark", metavar="SOURCE",
+                        help="video file, image directory, .raw dump or 'synthetic'")
+    parser.add_argument("--frames", type=int)
+    parser.add_argument("--realtime", action="store_true", help="pace the clip at its fps")
+    parser.add_argument("--fps", type=float)
+    parser.add_argument("--cache", action="store_true", help="keep decoded frames in memory")
+    parser.add_argument("--backend", default="haar")
+    parser.add_argument("--detect-scale", type=float, default=1.0)
+    parser.add_argument("--luma", action="store_true")
+    parser.add_argument("--track-faces", action="store_true")
+    parser.add_argument("--detect-every", type=int, default=1)
+    parser.add_argument("--buffer-pool", action="store_true")
+    parser.add_argument("--servo", help="servo backend for the benchmark, e.g. 'sim'")
+    args = parser.parse_args()
+    if args.benchmark:
+        source = make_source(args.benchmark, realtime=args.realtime, fps=args.fps,
+                             cache=args.cache, loop=False)
+        benchmark_tracking(source, frames=args.frames,
+                           detector_config={"backend": args.backend, "scale": args.detect_scale},
+                           luma=args.luma, track_faces=args.track_faces,
+                           detect_every=args.detect_every, buffer_pool=args.buffer_pool,
+                           servo_backend=args.servo)
+    else:
+        ft = Facetrack()
+        ft.track()
@@ -0,0 +1,373 @@
+import os
+import sys
+import time
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+# Shared memory layout:
+#   header   16 x uint64 (see _H_* below)
+#   slots    slots x 4 x uint64: seq_begin, seq_end, timestamp (float64), spare
+#   frames   slots x frame_nbytes, each starting on a 64 byte boundary
+MAGIC = 0x46524D42   # "FRMB"
+VERSION = 1
+MAX_DIMS = 4
+_HEADER_WORDS = 16
+_SLOT_WORDS = 4
+_H_MAGIC, _H_VERSION, _H_SLOTS, _H_NDIM = 0, 1, 2, 3
+_H_SHAPE = 4          # MAX_DIMS words
+_H_DTYPE = 8
+_H_NBYTES = 9
+_H_STRIDE = 10
+_H_LATEST = 11
+_H_PID = 12           # writer's process id, to tell a live bus from a stale one
+
+
+def _align(n, to=64):
+    return (n + to - 1) // to * to
+
+
+def _attach(name):
+    """Open an existing segment without handing it to the resource tracker.
+
+    Before Python 3.13 every process that opens a segment registers it and
+    unlinks it on exit, which would pull the bus out from under the writer.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # Older Pythons always register, so undo it. A forked reader shares
+    # the writer's tracker, so this also drops the writer's registration;
+    # the segment is then only cleaned up by close() or by the next
+    # writer finding it stale, not by the tracker after a crash.
+    shm = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def _unlink(shm):
+    """Unlink a segment opened by _attach or created by a writer."""
+    if sys.version_info < (3, 13):
+        # unlink() also unregisters it, and a reader sharing our tracker
+        # may already have done that; registering is idempotent.
+        resource_tracker.register(shm._name, "shared_memory")
+    shm.unlink()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class _Bus:
+    """Numpy views over one shared-memory segment."""
+    def _map(self, shm, slots, shape, dtype, stride):
+        buf = shm.buf
+        self._header = np.ndarray((_HEADER_WORDS,), np.uint64, buf)
+        self._slots = np.ndarray((slots, _SLOT_WORDS), np.uint64, buf,
+                                 offset=_HEADER_WORDS * 8)
+        self._slot_ts = self._slots.view(np.float64)[:, 2]
+        base = _align((_HEADER_WORDS + slots * _SLOT_WORDS) * 8)
+        self._frames = [np.ndarray(shape, dtype, buf, offset=base + i * stride)
+                        for i in range(slots)]
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+    def _unmap(self):
+        # Views must go before the segment can be closed
+        self._header = None
+        self._slots = None
+        self._slot_ts = None
+        self._frames = []
+
+    def latest_seq(self):
+        return int(self._header[_H_LATEST])
+
+
+class FrameBusWriter(_Bus):
+    """Publish frames into a shared-memory ring for other processes.
+
+    Each slot carries a sequence number written before and after the frame
+    data (a seqlock), so readers can tell a complete frame from one that is
+    being overwritten. There is a single writer; readers never block it.
+    """
+    def __init__(self, name, shape, dtype=np.uint8, slots=4):
+        if slots < 2:
+            raise ValueError("FrameBus needs at least 2 slots")
+        if len(shape) > MAX_DIMS:
+            raise ValueError(f"FrameBus frames can have at most {MAX_DIMS} dimensions")
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        stride = _align(nbytes)
+        size = _align((_HEADER_WORDS + slots * _SLOT_WORDS) * 8) + slots * stride
+
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a writer that crashed; nobody else may write it
+            stale = _attach(name)
+            pid = 0
+            if stale.size >= _HEADER_WORDS * 8:
+                header = np.ndarray((_HEADER_WORDS,), np.uint64, stale.buf)
+                if header[_H_MAGIC] == MAGIC:
+                    pid = int(header[_H_PID])
+                del header
+            stale.close()
+            if pid and pid != os.getpid() and _alive(pid):
+                raise FileExistsError(f"FrameBus {name!r} is in use by process {pid}")
+            _unlink(stale)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.name = name
+        self._unlinked = False
+        self._map(self.shm, slots, shape, dtype, stride)
+
+        header = self._header
+        header[:] = 0
+        self._slots[:] = 0
+        header[_H_VERSION] = VERSION
+        header[_H_SLOTS] = slots
+        header[_H_NDIM] = len(shape)
+        header[_H_SHAPE:_H_SHAPE + len(shape)] = shape
+        header[_H_DTYPE:_H_DTYPE + 1] = np.frombuffer(dtype.str.encode().ljust(8, b"\0"), np.uint64)
+        header[_H_NBYTES] = nbytes
+        header[_H_STRIDE] = stride
+        header[_H_PID] = os.getpid()
+        header[_H_MAGIC] = MAGIC   # last, so readers never see a half-written header
+
+        self._seq = 0
+        self.frames_written = 0
+
+    def begin(self):
+        """Slot buffer for the next frame; fill it, then call commit()."""
+        seq = self._seq + 1
+        slot = (seq - 1) % self.slots
+        self._slots[slot, 0] = seq
+        return self._frames[slot]
+
+    def commit(self, timestamp=None):
+        """Publish the frame written into the buffer from begin(); returns its seq."""
+        seq = self._seq + 1
+        slot = (seq - 1) % self.slots
+        self._slot_ts[slot] = time.monotonic() if timestamp is None else timestamp
+        self._slots[slot, 1] = seq
+        self._header[_H_LATEST] = seq
+        self._seq = seq
+        self.frames_written += 1
+        return seq
+
+    def write(self, frame, timestamp=None):
+        """Copy one frame into the ring; returns its sequence number."""
+        np.copyto(self.begin(), frame)
+        return self.commit(timestamp)
+
+    def get_stats(self):
+        return {
+            "name": self.name,
+            "slots": self.slots,
+            "frame_bytes": int(self._header[_H_NBYTES]),
+            "written": self.frames_written,
+        }
+
+    def unlink(self):
+        """Remove the bus name so no new reader can attach; frames stay mapped."""
+        if self.shm is None or self._unlinked:
+            return
+        self._unlinked = True
+        try:
+            _unlink(self.shm)
+        except FileNotFoundError:
+            pass
+
+    def close(self, unlink=True):
+        if self.shm is None:
+            return
+        self._unmap()
+        self.shm.close()
+        if unlink:
+            self.unlink()
+        self.shm = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class FrameBusReader(_Bus):
+    """Attach to a FrameBusWriter's ring by name and read frames.
+
+    read() returns views into shared memory, so there is no copy and no
+    pickling. A view stays valid until `slots - 1` newer frames have been
+    written; check valid(seq) after using it, or pass copy=True.
+    """
+    def __init__(self, name, timeout=5.0, poll_interval=0.001):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.shm = _attach(name)
+                header = np.ndarray((_HEADER_WORDS,), np.uint64, self.shm.buf)
+                if int(header[_H_MAGIC]) == MAGIC:
+                    break
+                del header
+                self.shm.close()
+            except FileNotFoundError:
+                pass
+            if time.monotonic() >= deadline:
+                raise RuntimeError("No frame bus named " + name)
+            time.sleep(0.01)
+
+        if int(header[_H_VERSION]) != VERSION:
+            raise RuntimeError(f"Frame bus {name} has version {int(header[_H_VERSION])}")
+        ndim = int(header[_H_NDIM])
+        shape = tuple(int(v) for v in header[_H_SHAPE:_H_SHAPE + ndim])
+        dtype = header[_H_DTYPE:_H_DTYPE + 1].tobytes().rstrip(b"\0").decode()
+        slots = int(header[_H_SLOTS])
+        stride = int(header[_H_STRIDE])
+        del header
+        self.name = name
+        self.poll_interval = poll_interval
+        self._map(self.shm, slots, shape, dtype, stride)
+
+        self._last_seq = 0
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.torn_reads = 0
+        self.max_lag = 0
+        self.last_age = 0.0
+
+    def lag(self):
+        """Frames the writer has published since our last read."""
+        return self.latest_seq() - self._last_seq
+
+    def read(self, wait_new=True, timeout=1.0, copy=False, latest=True):
+        """Return (frame, seq, timestamp), or None if nothing new arrives in time.
+
+        With `latest` the newest frame is returned and anything older is
+        counted as dropped. Otherwise frames come in order, skipping only
+        those that were overwritten before we got to them (for recorders).
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            newest = self.latest_seq()
+            if newest == 0 or (wait_new and newest <= self._last_seq):
+                if time.monotonic() >= deadline:
+                    return None
+                time.sleep(self.poll_interval)
+                continue
+
+            if latest or self._last_seq == 0:
+                seq = newest
+            else:
+                # The slot after `newest` may already be mid-write
+                oldest = max(1, newest - self.slots + 2)
+                seq = max(self._last_seq + 1, oldest) if newest > self._last_seq else newest
+            slot = (seq - 1) % self.slots
+            if int(self._slots[slot, 1]) != seq:
+                self.torn_reads += 1
+                continue
+
+            timestamp = float(self._slot_ts[slot])
+            frame = self._frames[slot]
+            if copy:
+                frame = frame.copy()
+                if int(self._slots[slot, 0]) != seq:
+                    self.torn_reads += 1
+                    continue
+
+            if seq > self._last_seq:
+                self.max_lag = max(self.max_lag, newest - self._last_seq)
+                if self._last_seq:
+                    self.frames_dropped += seq - self._last_seq - 1
+                self.frames_read += 1
+                self._last_seq = seq
+            self.last_age = time.monotonic() - timestamp
+            return frame, seq, timestamp
+
+    def get(self, seq):
+        """Zero-copy view of frame `seq`, or None if it is no longer in the ring.
+
+        Check valid(seq) once done with it, as the writer may have reused
+        the slot meanwhile.
+        """
+        slot = (seq - 1) % self.slots
+        if int(self._slots[slot, 1]) != seq:
+            return None
+        return self._frames[slot]
+
+    def valid(self, seq):
+        """True if the zero-copy frame for `seq` has not been overwritten."""
+        return int(self._slots[(seq - 1) % self.slots, 0]) == seq
+
+    def get_stats(self):
+        return {
+            "name": self.name,
+            "read": self.frames_read,
+            "dropped": self.frames_dropped,
+            "torn": self.torn_reads,
+            "lag": self.lag(),
+            "max_lag": self.max_lag,
+            "last_age_ms": 1000.0 * self.last_age,
+        }
+
+    def close(self):
+        if self.shm is None:
+            return
+        self._unmap()
+        self.shm.close()
+        self.shm = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+def _reader_main(name, seconds, results):
+    reader = FrameBusReader(name)
+    end = time.monotonic() + seconds
+    checksum = 0
+    while time.monotonic() < end:
+        item = reader.read(timeout=0.1)
+        if item is None:
+            continue
+        frame, seq, _ = item
+        checksum += int(frame[0, 0, 0])
+        time.sleep(0.02)   # simulate a slow consumer
+    results.put(reader.get_stats())
+    reader.close()
+
+
+def test_bus(seconds=3.0, readers=2, shape=(480, 640, 3), fps=30):
+    """Publish synthetic frames and read them from other processes."""
+    import multiprocessing as mp
+    name = "framebus_test"
+    writer = FrameBusWriter(name, shape, np.uint8, slots=4)
+    results = mp.Queue()
+    procs = [mp.Process(target=_reader_main, args=(name, seconds, results))
+             for _ in range(readers)]
+    for p in procs:
+        p.start()
+
+    frame = np.zeros(shape, np.uint8)
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        frame[:] = writer.frames_written % 256
+        writer.write(frame)
+        time.sleep(1.0 / fps)
+
+    for _ in procs:
+        print("reader:", results.get())
+    for p in procs:
+        p.join()
+    print("writer:", writer.get_stats())
+    writer.close()
+
+
+if __name__ == "__main__":
+    test_bus()
@@ -0,0 +1,474 @@
+import json
+import math
+import os
+import time
+import numpy as np
+from LazyLib import lazy_import
+
+cv2 = lazy_import("cv2")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class _Request:
+    def __init__(self, arrays, metadata):
+        self.arrays = arrays
+        self.metadata = metadata
+
+    def get_metadata(self):
+        return self.metadata
+
+    def release(self):
+        pass
+
+
+class MappedArray:
+    """Same use as picamera2.MappedArray, for requests from a FrameSource."""
+    def __init__(self, request, stream):
+        self.array = request.arrays[stream]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FrameSource:
+    """Recorded or generated frames behind the Picamera2 calls CameraLib uses.
+
+    Pass one as CameraLib(source=...) and streaming, luma mode, buffer
+    pools and capture all work unchanged, with no camera attached.
+    Subclasses implement _frame(index), returning the BGR (or grayscale,
+    or I420 when `frame_format` is "YUV420") image at position `index` of
+    the clip, or None past its end. Images
+    are resized and converted to the configured format (RGB888 or YUV420,
+    plus a YUV420 lores stream) on delivery; with `cache` the converted
+    frames are kept so replaying a short clip costs only the copy.
+
+    `realtime` paces delivery at `fps` like a live sensor: a caller that
+    keeps up waits for the next frame, one that falls behind gets the
+    current frame and the ones in between are skipped. Otherwise frames
+    come as fast as they are asked for. At the end of the clip the source
+    starts over when `loop` is set and raises EOFError when not.
+    """
+    # True if frames are upside down and need the same 180 degree turn as
+    # an unflipped sensor (see CameraLib.needs_rotation)
+    upside_down = False
+    # Pixel format of 2-D frames from _frame(): "YUV420" for I420, "GRAY",
+    # or None to take an I420-shaped frame of the configured size as I420
+    frame_format = None
+
+    def __init__(self, fps=30.0, realtime=False, loop=True, cache=False):
+        self.fps = fps
+        self.realtime = realtime
+        self.loop = loop
+        self.cache = cache
+        self.size = None
+        self.format = None
+        self.lores_size = None
+        self._arrays = {}
+        self._cache = {}
+        self._started_at = None
+        self._delivered_at = None
+        self.position = 0
+        self.frames = 0
+        self.skipped = 0
+        self.loops = 0
+
+    def _frame(self, index):
+        raise NotImplementedError
+
+    # -------------------------
+    # Picamera2 subset
+    # -------------------------
+    def create_preview_configuration(self, main=None, lores=None, transform=None, **kwargs):
+        if transform is not None:
+            raise ValueError("Frame sources do not support sensor transforms")
+        return {"main": dict(main or {"format": "RGB888", "size": (640, 480)}),
+                "lores": dict(lores) if lores else None}
+
+    def configure(self, config):
+        self.size = tuple(config["main"]["size"])
+        self.format = config["main"].get("format", "RGB888")
+        if self.format not in ("RGB888", "YUV420"):
+            raise ValueError("Unsupported frame source format: " + self.format)
+        lores = config.get("lores")
+        self.lores_size = tuple(lores["size"]) if lores else None
+        width, height = self.size
+        if self.format == "YUV420":
+            self._arrays = {"main": np.empty((height * 3 // 2, width), np.uint8)}
+        else:
+            self._arrays = {"main": np.empty((height, width, 3), np.uint8)}
+        if self.lores_size is not None:
+            lores_width, lores_height = self.lores_size
+            self._arrays["lores"] = np.empty((lores_height * 3 // 2, lores_width), np.uint8)
+        self._cache = {}
+
+    def start(self):
+        self._started_at = None
+
+    def stop(self):
+        pass
+
+    def close(self):
+        self._cache = {}
+
+    def capture_array(self, name="main"):
+        self._next()
+        return self._arrays[name].copy()
+
+    def capture_arrays(self, names):
+        self._next()
+        return [self._arrays[name].copy() for name in names], self._metadata()
+
+    def capture_request(self):
+        """Request whose arrays stay valid until the next capture."""
+        self._next()
+        return _Request(self._arrays, self._metadata())
+
+    def _metadata(self):
+        # A frame counts as exposed when it is delivered
+        return {"SensorTimestamp": int(self._delivered_at * 1e9)}
+
+    # -------------------------
+    # Delivery
+    # -------------------------
+    def _pace(self):
+        # Frames are due at fps from the first capture; returns how many
+        # of them the caller was too late for
+        now = time.monotonic()
+        due = self.frames + self.skipped
+        current = int((now - self._started_at) * self.fps)
+        if current < due:
+            time.sleep(self._started_at + due / self.fps - now)
+            return 0
+        return current - due
+
+    def _next(self):
+        if self._started_at is None:
+            self._started_at = time.monotonic() - self.frames / self.fps
+        skip = self._pace() if self.realtime else 0
+        self.skipped += skip
+        self.position += skip
+        image = self._load(self.position)
+        if image is None and self.position > 0 and self.loop:
+            self.loops += 1
+            self.position = 0
+            image = self._load(0)
+        if image is None:
+            raise EOFError("End of frame source")
+        self.position += 1
+        self.frames += 1
+        self._delivered_at = time.monotonic()
+
+    def _load(self, index):
+        cached = self._cache.get(index)
+        if cached is not None:
+            for name, array in cached.items():
+                np.copyto(self._arrays[name], array)
+            return cached
+        image = self._frame(index)
+        if image is None:
+            return None
+        self._convert(image)
+        if self.cache:
+            self._cache[index] = {name: array.copy() for name, array in self._arrays.items()}
+        return image
+
+    def _convert(self, image):
+        main = self._arrays["main"]
+        if image.shape == main.shape and image.dtype == main.dtype and "lores" not in self._arrays:
+            # Already in the configured format, e.g. a raw dump
+            np.copyto(main, image)
+            return
+        width, height = self.size
+        if image.ndim == 2 and (self.frame_format == "YUV420" or (
+                self.frame_format is None and image.shape == (height * 3 // 2, width))):
+            # Whatever format we deliver, e.g. a luma-mode dump replayed as RGB888
+            image = cv2.cvtColor(image, cv2.COLOR_YUV2BGR_I420)
+        elif image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        if image.shape[:2] != (height, width):
+            image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+        if self.format == "YUV420":
+            cv2.cvtColor(image, cv2.COLOR_BGR2YUV_I420, dst=main)
+        else:
+            np.copyto(main, image)
+        if self.lores_size is not None:
+            small = cv2.resize(image, self.lores_size, interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(small, cv2.COLOR_BGR2YUV_I420, dst=self._arrays["lores"])
+
+    def get_stats(self):
+        elapsed = (self._delivered_at - self._started_at
+                   if self._started_at is not None and self._delivered_at else 0.0)
+        return {
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "loops": self.loops,
+            "position": self.position,
+            "fps": self.frames / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+class VideoSource(FrameSource):
+    """Frames from a video file; `fps` defaults to the file's own rate."""
+    def __init__(self, path, fps=None, **kwargs):
+        self.path = path
+        self._capture = cv2.VideoCapture(path)
+        if not self._capture.isOpened():
+            raise RuntimeError("Failed to open video: " + path)
+        if fps is None:
+            fps = self._capture.get(cv2.CAP_PROP_FPS) or 30.0
+        super().__init__(fps=fps, **kwargs)
+        self._next_index = 0
+
+    def _frame(self, index):
+        if index < self._next_index:
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            self._next_index = 0
+        # Skipped frames are only grabbed, not decoded
+        while self._next_index < index:
+            if not self._capture.grab():
+                return None
+            self._next_index += 1
+        ok, image = self._capture.read()
+        if not ok:
+            return None
+        self._next_index += 1
+        return image
+
+    def close(self):
+        super().close()
+        self._capture.release()
+
+
+class ImageDirSource(FrameSource):
+    """Images from a directory in name order; `preload` decodes them all up front."""
+    def __init__(self, path, preload=False, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.names = sorted(n for n in os.listdir(path) if n.lower().endswith(IMAGE_EXTENSIONS))
+        if not self.names:
+            raise RuntimeError("No images found in " + path)
+        self._images = None
+        if preload:
+            self._images = [self._read(n) for n in self.names]
+
+    def _read(self, name):
+        image = cv2.imread(os.path.join(self.path, name), cv2.IMREAD_COLOR)
+        if image is None:
+            raise RuntimeError("Failed to read image: " + name)
+        return image
+
+    def _frame(self, index):
+        if index >= len(self.names):
+            return None
+        if self._images is not None:
+            return self._images[index]
+        return self._read(self.names[index])
+
+
+class MemmapSource(FrameSource):
+    """Raw frames memory-mapped from a dump written by save_raw().
+
+    Frames are used as stored, with no decoding; when their shape matches
+    the camera configuration (same size and format, no lores stream) they
+    are only copied. Shape, dtype, fps, orientation and pixel format come
+    from the .json file next to the dump unless given.
+    """
+    def __init__(self, path, shape=None, dtype=np.uint8, fps=None, **kwargs):
+        info = {}
+        if os.path.exists(path + ".json"):
+            with open(path + ".json") as f:
+                info = json.load(f)
+        if shape is None:
+            if "shape" not in info:
+                raise ValueError("Frame shape not given and no " + path + ".json")
+            shape = info["shape"]
+            dtype = info.get("dtype", "uint8")
+        super().__init__(fps=fps or info.get("fps", 30.0), **kwargs)
+        self.path = path
+        self.upside_down = info.get("upside_down", False)
+        self.frame_format = info.get("format")
+        frame_bytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        count = os.path.getsize(path) // frame_bytes
+        if count == 0:
+            raise RuntimeError("No frames in " + path)
+        self._frames = np.memmap(path, dtype=dtype, mode="r", shape=(count,) + tuple(shape))
+
+    def __len__(self):
+        return len(self._frames)
+
+    def _frame(self, index):
+        if index >= len(self._frames):
+            return None
+        return self._frames[index]
+
+    def close(self):
+        super().close()
+        self._frames = None
+
+
+def _face_sprite(size):
+    # Cartoon face: a cascade sees the same eye/brow/nose/mouth contrasts
+    # as on a real one, so detectors find it. Returns gray levels, 0 = none.
+    s = size
+    face = np.zeros((s, s), np.uint8)
+    cv2.ellipse(face, (s // 2, s // 2), (int(s * 0.38), int(s * 0.48)), 0, 0, 360, 200, -1)
+    for ex in (0.32, 0.68):
+        cv2.ellipse(face, (int(s * ex), int(s * 0.40)), (int(s * 0.09), int(s * 0.05)),
+                    0, 0, 360, 40, -1)
+        cv2.line(face, (int(s * (ex - 0.11)), int(s * 0.30)), (int(s * (ex + 0.11)), int(s * 0.30)),
+                 70, max(1, s // 30))
+    cv2.line(face, (s // 2, int(s * 0.45)), (s // 2, int(s * 0.62)), 150, max(1, s // 40))
+    cv2.ellipse(face, (s // 2, int(s * 0.75)), (int(s * 0.15), int(s * 0.05)), 0, 0, 360, 60, -1)
+    return cv2.GaussianBlur(face, (0, 0), s / 60.0)
+
+
+class SyntheticSource(FrameSource):
+    """Generated frames with faces moving on smooth, repeatable paths.
+
+    Faces drift across the frame and slowly change size between
+    `min_size` and `max_size` pixels; positions depend only on the frame
+    index, so every run sees the same clip. `length` frames make up the
+    clip (None: endless). `truth` holds the (x, y, w, h) boxes of the last
+    delivered frame in frame coordinates, for checking detections.
+    `noise` adds sensor-like grain so frames are never identical.
+    """
+    def __init__(self, faces=1, min_size=70, max_size=140, length=300, period=6.0,
+                 noise=3, seed=0, **kwargs):
+        super().__init__(**kwargs)
+        self.faces = faces
+        self.min_size = min_size
+        self.max_size = max_size
+        self.length = length
+        self.period = period
+        self.noise = noise
+        self.seed = seed
+        self.truth = []
+        self._backgrounds = None
+        self._sprites = {}
+        rng = np.random.default_rng(seed)
+        self._phases = rng.uniform(0, 2 * math.pi, (faces, 3))
+
+    def _make_backgrounds(self, width, height):
+        # A few grainy copies of a soft gradient, cycled frame to frame
+        rng = np.random.default_rng(self.seed)
+        ramp = np.linspace(70, 130, width, dtype=np.float32)
+        base = np.repeat(ramp[None, :], height, axis=0)
+        base = np.dstack([base * 0.9, base, base * 1.1])
+        backgrounds = []
+        for _ in range(4):
+            grain = rng.normal(0, self.noise, base.shape) if self.noise else 0
+            backgrounds.append(np.clip(base + grain, 0, 255).astype(np.uint8))
+        return backgrounds
+
+    def _boxes(self, index):
+        width, height = self.size
+        t = index / self.fps
+        boxes = []
+        for i in range(self.faces):
+            px, py, ps = self._phases[i]
+            w = 2 * math.pi * t / self.period
+            size = int(self.min_size + (self.max_size - self.min_size)
+                       * 0.5 * (1 + math.sin(0.37 * w + ps)))
+            size -= size % 2
+            cx = width / 2 + (width / 2 - size / 2 - 1) * math.sin(w + px)
+            cy = height / 2 + (height / 2 - size / 2 - 1) * math.sin(0.71 * w + py)
+            boxes.append((int(cx - size / 2), int(cy - size / 2), size, size))
+        return boxes
+
+    def _load(self, index):
+        # Set here rather than in _frame() so cached frames update it too
+        image = super()._load(index)
+        if image is not None:
+            self.truth = self._boxes(index)
+        return image
+
+    def _frame(self, index):
+        if self.length is not None and index >= self.length:
+            return None
+        width, height = self.size
+        if self._backgrounds is None or self._backgrounds[0].shape[:2] != (height, width):
+            self._backgrounds = self._make_backgrounds(width, height)
+        frame = self._backgrounds[index % len(self._backgrounds)].copy()
+        for (x, y, w, h) in self._boxes(index):
+            sprite = self._sprites.get(w)
+            if sprite is None:
+                sprite = self._sprites[w] = _face_sprite(w)
+            roi = frame[y:y + h, x:x + w]
+            mask = sprite > 0
+            for c, tint in enumerate((0.8, 0.9, 1.0)):
+                roi[..., c][mask] = (sprite[mask] * tint).astype(np.uint8)
+        return frame
+
+
+def make_source(spec, **kwargs):
+    """Frame source from a string: "synthetic", an image directory, a raw
+    dump (.raw) or a video file. Keyword arguments go to the source."""
+    kwargs = {k: v for k, v in kwargs.items() if v is not None}
+    if spec == "synthetic":
+        return SyntheticSource(**kwargs)
+    if os.path.isdir(spec):
+        return ImageDirSource(spec, **kwargs)
+    if spec.endswith(".raw"):
+        return MemmapSource(spec, **kwargs)
+    return VideoSource(spec, **kwargs)
+
+
+def save_raw(path, frames, fps=30.0, upside_down=False, format=None):
+    """Write frames to a raw dump for MemmapSource; returns the frame count.
+
+    `format` ("RGB888", "YUV420" or "GRAY") tells MemmapSource how to
+    convert the frames when replaying them into another configuration.
+    """
+    count = 0
+    first = None
+    with open(path, "wb") as f:
+        for frame in frames:
+            if first is None:
+                first = frame
+            elif frame.shape != first.shape or frame.dtype != first.dtype:
+                raise ValueError("All frames in a raw dump must have the same shape")
+            f.write(np.ascontiguousarray(frame).tobytes())
+            count += 1
+    if first is None:
+        raise ValueError("No frames to save")
+    with open(path + ".json", "w") as f:
+        json.dump({"shape": list(first.shape), "dtype": str(first.dtype), "fps": fps,
+                   "count": count, "upside_down": upside_down, "format": format}, f)
+    return count
+
+
+def record_raw(path, frames=300, fps=30.0, **camera_kwargs):
+    """Record `frames` raw camera frames, as get_raw_frame() returns them."""
+    from CameraLib import CameraLib
+    cam = CameraLib(**camera_kwargs)
+    try:
+        count = save_raw(path, (cam.get_raw_frame() for _ in range(frames)), fps=fps,
+                         upside_down=cam.needs_rotation,
+                         format="YUV420" if cam.luma else "RGB888")
+    finally:
+        cam.close()
+    print(f"Saved {count} frames to {path}")
+    return count
+
+
+def test_sources(path=None, frames=60):
+    """Read a source through CameraLib in both pacing modes."""
+    from CameraLib import CameraLib
+    for realtime in (False, True):
+        source = make_source(path or "synthetic", realtime=realtime)
+        cam = CameraLib(source=source)
+        start = time.perf_counter()
+        for _ in range(frames):
+            cam.get_frame()
+        elapsed = time.perf_counter() - start
+        print(f"realtime={realtime}: {frames / elapsed:.1f} fps, source {source.get_stats()}")
+        cam.close()
+
+
+if __name__ == "__main__":
+    import sys
+    test_sources(sys.argv[1] if len(sys.argv) > 1 else None)
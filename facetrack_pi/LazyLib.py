@@ -0,0 +1,49 @@
+import importlib
+import sys
+import threading
+import time
+
+# Seconds spent importing each lazily loaded module, for startup reports
+import_times = {}
+_lock = threading.Lock()
+
+
+class LazyModule:
+    """Module stand-in that does the real import on first attribute access.
+
+    cv2, picamera2 and gpiozero each take a noticeable part of a second
+    to import on a Pi; deferring them keeps `import FacetrackLib` cheap and
+    lets the startup threads import them in parallel. Attributes are
+    cached on first use, so later lookups cost the same as on a module.
+    """
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            # Only count a real import, not one already done elsewhere
+            # (e.g. a parent package pulled in by its submodule)
+            fresh = self._name not in sys.modules
+            start = time.perf_counter()
+            module = importlib.import_module(self._name)
+            if fresh:
+                with _lock:
+                    import_times.setdefault(self._name, time.perf_counter() - start)
+            self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        value = getattr(self._load(), attr)
+        self.__dict__[attr] = value
+        return value
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name):
+    return LazyModule(name)
+
@@ -0,0 +1,220 @@
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StreamingHistogram:
+    """Constant-memory latency histogram with log-spaced buckets.
+
+    record() is O(1); percentiles are accurate to about half a bucket
+    (`ratio` - 1 relative error). Values are in seconds.
+    """
+    def __init__(self, min_value=1e-6, max_value=100.0, ratio=1.1):
+        self.min_value = min_value
+        self._log_ratio = math.log(ratio)
+        self._ratio = ratio
+        self._buckets = [0] * (int(math.log(max_value / min_value) / self._log_ratio) + 2)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        if value <= self.min_value:
+            index = 0
+        else:
+            index = min(len(self._buckets) - 1,
+                        int(math.log(value / self.min_value) / self._log_ratio) + 1)
+        with self._lock:
+            self._buckets[index] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, p):
+        with self._lock:
+            if self.count == 0:
+                return 0.0
+            rank = p / 100.0 * self.count
+            seen = 0
+            for index, n in enumerate(self._buckets):
+                seen += n
+                if seen >= rank and n:
+                    break
+            if index == 0:
+                return self.min_value
+            # Geometric middle of the bucket, never above the observed max
+            upper = self.min_value * self._ratio ** index
+            return min(self.max, upper / math.sqrt(self._ratio))
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class FpsCounter:
+    """Frames per second over a sliding window of `window` seconds."""
+    def __init__(self, window=2.0):
+        self.window = window
+        self.frames = 0
+        self._window_start = time.monotonic()
+        self._window_frames = 0
+        self.fps = 0.0
+
+    def tick(self):
+        self.frames += 1
+        self._window_frames += 1
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed >= self.window:
+            self.fps = self._window_frames / elapsed
+            self._window_start = now
+            self._window_frames = 0
+
+
+class Metrics:
+    """Per-stage timings, FPS and end-to-end latency for the tracking loop.
+
+    Cheap enough to leave on: timing a stage costs two perf_counter()
+    calls and one histogram update.
+    """
+    def __init__(self, prefix="facetrack"):
+        self.prefix = prefix
+        self.stages = {}
+        self.fps = FpsCounter()
+        self._lock = threading.Lock()
+        self._server = None
+        self._jsonl_thread = None
+        self._jsonl_stop = threading.Event()
+
+    def histogram(self, name):
+        hist = self.stages.get(name)
+        if hist is None:
+            with self._lock:
+                hist = self.stages.setdefault(name, StreamingHistogram())
+        return hist
+
+    def record(self, name, seconds):
+        self.histogram(name).record(seconds)
+
+    @contextmanager
+    def time(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram(name).record(time.perf_counter() - start)
+
+    def frame_done(self):
+        self.fps.tick()
+
+    def latency_since(self, name, timestamp):
+        """Record time.monotonic() - timestamp, e.g. glass-to-servo latency."""
+        self.histogram(name).record(time.monotonic() - timestamp)
+
+    def snapshot(self):
+        return {
+            "time": time.time(),
+            "fps": self.fps.fps,
+            "frames": self.fps.frames,
+            "stages": {name: hist.summary() for name, hist in list(self.stages.items())},
+        }
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+        self.fps = FpsCounter(self.fps.window)
+
+    # -------------------------
+    # Export
+    # -------------------------
+    def to_json(self):
+        return json.dumps(self.snapshot())
+
+    def write_jsonl(self, path):
+        with open(path, "a") as f:
+            f.write(self.to_json() + "\n")
+
+    def start_jsonl(self, path, interval=10.0):
+        """Append a snapshot line to `path` every `interval` seconds."""
+        if self._jsonl_thread is not None:
+            return
+        self._jsonl_stop.clear()
+
+        def loop():
+            while not self._jsonl_stop.wait(interval):
+                self.write_jsonl(path)
+
+        self._jsonl_thread = threading.Thread(target=loop, daemon=True)
+        self._jsonl_thread.start()
+
+    def prometheus_text(self):
+        p = self.prefix
+        snap = self.snapshot()
+        lines = [
+            f"# TYPE {p}_stage_seconds summary",
+        ]
+        for name, s in snap["stages"].items():
+            for q, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                lines.append(f'{p}_stage_seconds{{stage="{name}",quantile="{q}"}} {s[key]:.6f}')
+            lines.append(f'{p}_stage_seconds_sum{{stage="{name}"}} {s["mean"] * s["count"]:.6f}')
+            lines.append(f'{p}_stage_seconds_count{{stage="{name}"}} {s["count"]}')
+        lines.append(f"# TYPE {p}_stage_max_seconds gauge")
+        for name, s in snap["stages"].items():
+            lines.append(f'{p}_stage_max_seconds{{stage="{name}"}} {s["max"]:.6f}')
+        lines.append(f"# TYPE {p}_fps gauge")
+        lines.append(f"{p}_fps {snap['fps']:.2f}")
+        lines.append(f"# TYPE {p}_frames_total counter")
+        lines.append(f"{p}_frames_total {snap['frames']}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=9100, host="127.0.0.1"):
+        """Serve /metrics (Prometheus text) and /metrics.json locally."""
+        if self._server is not None:
+            return self._server
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = metrics.prometheus_text().encode()
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body = metrics.to_json().encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._jsonl_thread is not None:
+            self._jsonl_stop.set()
+            self._jsonl_thread.join(timeout=1.0)
+            self._jsonl_thread = None
@@ -0,0 +1,357 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+import numpy as np
+from DetectorLib import make_detector, iou, load_frames
+from FrameBusLib import FrameBusReader, FrameBusWriter
+from LazyLib import lazy_import
+
+cv2 = lazy_import("cv2")
+
+MODES = ("frames", "tiles")
+
+# Per-process detector, loaded once by _init_worker
+_detector = None
+_scale = 1.0
+_buses = {}
+
+
+def _init_worker(config, single_thread=True):
+    global _detector, _scale
+    if single_thread:
+        # One OpenCV thread per worker so the pool does not oversubscribe
+        # the cores OpenCV would otherwise spread detectMultiScale over.
+        cv2.setNumThreads(1)
+    _scale = config.get("scale", 1.0)
+    _detector = make_detector(config)
+
+
+def _ping(delay):
+    time.sleep(delay)
+    return os.getpid()
+
+
+def _bus_job(name, seq, size, rows):
+    """Detect in rows y0:y1 of frame `seq` on the pool's FrameBus.
+
+    Only the frame number crosses the process boundary; the pixels are
+    read in place from shared memory. `size` is the (height, width) the
+    frame was written with, in the top-left corner of the slot.
+    """
+    reader = _buses.get(name)
+    if reader is None:
+        reader = _buses[name] = FrameBusReader(name)
+    frame = reader.get(seq)
+    if frame is None:
+        raise RuntimeError(f"frame {seq} was overwritten before detection")
+    y0, y1 = rows
+    faces = _detect_job(frame[y0:y1, :size[1]], y0)
+    if not reader.valid(seq):
+        raise RuntimeError(f"frame {seq} was overwritten during detection")
+    return faces
+
+
+def _detect_job(gray, y_offset):
+    """Detect in one frame or tile; boxes come back in frame coordinates."""
+    if _scale < 1.0:
+        small = cv2.resize(gray, None, fx=_scale, fy=_scale, interpolation=cv2.INTER_AREA)
+        faces = _detector.detect(small)
+        faces = [tuple(int(round(v / _scale)) for v in f) for f in faces]
+    else:
+        faces = [tuple(int(v) for v in f) for f in _detector.detect(gray)]
+    return [(x, y + y_offset, w, h) for (x, y, w, h) in faces]
+
+
+def _overlap_of_smaller(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    smaller = min(aw * ah, bw * bh)
+    return ix * iy / smaller if smaller > 0 else 0.0
+
+
+def merge_boxes(boxes, iou_threshold=0.3, contain_threshold=0.7):
+    """Drop duplicates of the same face found in two overlapping tiles.
+
+    Boxes are kept largest first; a box is a duplicate if it overlaps a
+    kept one by `iou_threshold` IoU, or if most of it lies inside it (a
+    face cut by a seam shows up as a smaller box inside the full one).
+    """
+    kept = []
+    for box in sorted(boxes, key=lambda b: b[2] * b[3], reverse=True):
+        if any(iou(box, k) >= iou_threshold or _overlap_of_smaller(box, k) >= contain_threshold
+               for k in kept):
+            continue
+        kept.append(box)
+    return kept
+
+
+def split_tiles(height, tiles, overlap):
+    """(y0, y1) of `tiles` horizontal strips, each grown by `overlap` rows."""
+    step = height / tiles
+    spans = []
+    for i in range(tiles):
+        y0 = max(0, int(i * step) - overlap)
+        y1 = min(height, int((i + 1) * step) + overlap)
+        spans.append((y0, y1))
+    return spans
+
+
+class ParallelDetector:
+    """Face detection spread over a pool of worker processes.
+
+    Each worker loads its own detector from `detector_config` (see
+    DetectorLib.make_detector; "scale" shrinks frames inside the worker).
+
+    mode "frames": whole frames go to the next free worker. Throughput
+    scales with workers while submit()/collect() keep several frames in
+    flight; collect() hands results back in submission order.
+
+    mode "tiles": every frame is cut into horizontal strips, one per
+    worker, that overlap by `overlap` (fraction of the frame height) so a
+    face on a seam is whole in at least one strip. This cuts per-frame
+    latency; faces taller than the overlap may be missed.
+
+    `workers=0` runs detection inline in the calling process, for single
+    core boards and for comparison. At most `max_pending` frames are in
+    flight; submit() blocks on the oldest once that many are unfinished.
+
+    With workers, frames are not pickled to them: submit() copies each
+    one into a FrameBus ring (see FrameBusLib) sized to the first frame,
+    with a slot per frame that can be in flight, and the workers detect
+    in place. Frames larger than the first one are sent pickled.
+
+    The constructor waits until every worker has loaded its detector;
+    with `wait=False` it returns once the workers are started and
+    wait_ready() does the waiting, so the caller can do other setup
+    meanwhile.
+    """
+    def __init__(self, detector_config=None, workers=None, mode="frames", tiles=None,
+                 overlap=0.25, max_pending=None, wait=True):
+        if mode not in MODES:
+            raise ValueError("mode must be one of " + ", ".join(MODES))
+        self.config = dict(detector_config or {"backend": "haar"})
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.mode = mode
+        if mode == "tiles":
+            self.tiles = tiles or max(1, self.workers)
+        else:
+            self.tiles = 1
+        self.overlap = overlap
+        self.max_pending = max_pending or 2 * max(1, self.workers)
+
+        if self.workers > 0:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             initializer=_init_worker,
+                                             initargs=(self.config,))
+            # Start every worker and load its cascade before timing anything
+            self._warmup = [self._pool.submit(_ping, 0.1) for _ in range(self.workers)]
+        else:
+            self._pool = None
+            self._warmup = []
+            _init_worker(self.config, single_thread=False)
+
+        self._bus = None
+        self._pending = deque()
+        self._next_id = 0
+        self._started_at = None
+        self.submitted = 0
+        self.completed = 0
+        self.merged = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        if wait:
+            self.wait_ready()
+
+    def wait_ready(self):
+        """Block until every worker is up; re-raises a worker startup error."""
+        for future in self._warmup:
+            future.result()
+        self._warmup = []
+
+    def _run(self, gray, y_offset):
+        if self._pool is not None:
+            return self._pool.submit(_detect_job, gray, y_offset)
+        future = Future()
+        future.set_result(_detect_job(gray, y_offset))
+        return future
+
+    def _publish(self, gray):
+        """Copy a frame onto the bus; returns its seq, or None if it does not fit."""
+        if self._bus is None:
+            name = f"pdetect_{os.getpid()}_{id(self) & 0xffffff:x}"
+            # submit() keeps fewer than max_pending frames in flight when
+            # it publishes, so no slot is reused while a worker reads it
+            self._bus = FrameBusWriter(name, gray.shape, gray.dtype, slots=self.max_pending + 1)
+        if (gray.ndim != len(self._bus.shape) or gray.dtype != self._bus.dtype
+                or any(n > m for n, m in zip(gray.shape, self._bus.shape))):
+            return None
+        buf = self._bus.begin()
+        buf[:gray.shape[0], :gray.shape[1]] = gray
+        return self._bus.commit()
+
+    def submit(self, gray, payload=None):
+        """Queue a grayscale frame; returns its frame id.
+
+        `payload` stays in this process and is handed back by collect(),
+        e.g. the colour frame and timestamp that go with the detections.
+        """
+        while True:
+            in_flight = [entry for entry in self._pending if entry[4] is None]
+            if len(in_flight) < self.max_pending:
+                break
+            wait(in_flight[0][2])
+            self._finish_ready()
+
+        submitted_at = time.monotonic()
+        if self._started_at is None:
+            self._started_at = submitted_at
+        if self.tiles > 1:
+            overlap = int(self.overlap * gray.shape[0])
+            spans = split_tiles(gray.shape[0], self.tiles, overlap)
+        else:
+            spans = [(0, gray.shape[0])]
+        seq = self._publish(gray) if self._pool is not None else None
+        if seq is not None:
+            futures = [self._pool.submit(_bus_job, self._bus.name, seq, gray.shape[:2], span)
+                       for span in spans]
+        else:
+            futures = [self._run(gray[y0:y1], y0) for y0, y1 in spans]
+
+        frame_id = self._next_id
+        self._next_id += 1
+        self._pending.append([frame_id, payload, futures, submitted_at, None])
+        self.submitted += 1
+        return frame_id
+
+    def _finish_ready(self):
+        # Fill in results for any frame whose jobs are all done
+        for entry in self._pending:
+            if entry[4] is None and all(f.done() for f in entry[2]):
+                faces = []
+                for f in entry[2]:
+                    faces.extend(f.result())
+                if len(entry[2]) > 1:
+                    merged = merge_boxes(faces)
+                    self.merged += len(faces) - len(merged)
+                    faces = merged
+                entry[4] = np.array(faces, dtype=np.int32).reshape(-1, 4)
+                latency = time.monotonic() - entry[3]
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+
+    def collect(self, timeout=0.0):
+        """Finished (frame_id, payload, faces), oldest first.
+
+        Only returns a frame once every frame submitted before it is also
+        done, so results are always in order. Waits up to `timeout` for
+        the oldest frame.
+        """
+        if self._pending and timeout:
+            wait(self._pending[0][2], timeout)
+        self._finish_ready()
+        done = []
+        while self._pending and self._pending[0][4] is not None:
+            frame_id, payload, _, _, faces = self._pending.popleft()
+            self.completed += 1
+            done.append((frame_id, payload, faces))
+        return done
+
+    def detect(self, gray):
+        """Detect in one frame and wait for it; drops anything else in flight."""
+        frame_id = self.submit(gray)
+        while True:
+            for done_id, _, faces in self.collect(timeout=1.0):
+                if done_id == frame_id:
+                    return faces
+
+    def pending(self):
+        return len(self._pending)
+
+    def get_stats(self):
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        return {
+            "workers": self.workers,
+            "mode": self.mode,
+            "tiles": self.tiles,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "pending": len(self._pending),
+            "seam_duplicates": self.merged,
+            "fps": self.completed / elapsed if elapsed > 0 else 0.0,
+            "avg_latency_ms": 1000.0 * self.total_latency / self.completed if self.completed else 0.0,
+            "max_latency_ms": 1000.0 * self.max_latency,
+        }
+
+    def close(self):
+        self._pending.clear()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        if self._bus is not None:
+            self._bus.close()
+            self._bus = None
+
+
+def benchmark_parallel(frames_dir=None, worker_counts=None, modes=MODES, frames=120,
+                       detector_config=None):
+    """Frames/sec against worker count for each mode.
+
+    Uses a directory of recorded frames when given, otherwise random
+    noise frames (useful for timing only).
+    """
+    if frames_dir:
+        images = [gray for _, gray in load_frames(frames_dir)]
+        if not images:
+            raise RuntimeError("No images found in " + frames_dir)
+    else:
+        rng = np.random.default_rng(0)
+        images = [rng.integers(0, 256, (480, 640), dtype=np.uint8) for _ in range(8)]
+    if worker_counts is None:
+        worker_counts = [0] + list(range(1, (os.cpu_count() or 1) + 1))
+
+    results = []
+    for mode in modes:
+        for workers in worker_counts:
+            detector = ParallelDetector(detector_config, workers=workers, mode=mode)
+            start = time.perf_counter()
+            if mode == "frames":
+                for i in range(frames):
+                    detector.submit(images[i % len(images)])
+                    detector.collect()
+                while detector.pending():
+                    detector.collect(timeout=1.0)
+            else:
+                for i in range(frames):
+                    detector.detect(images[i % len(images)])
+            elapsed = time.perf_counter() - start
+            stats = detector.get_stats()
+            detector.close()
+            results.append({"mode": mode, "workers": workers, "fps": frames / elapsed,
+                            "avg_latency_ms": stats["avg_latency_ms"]})
+
+    print(f"{'mode':7s} {'workers':>7s} {'fps':>8s} {'speedup':>8s} {'latency ms':>11s}")
+    for mode in modes:
+        rows = [r for r in results if r["mode"] == mode]
+        base = rows[0]["fps"] if rows else 0.0
+        for r in rows:
+            speedup = r["fps"] / base if base else 0.0
+            print(f"{mode:7s} {r['workers']:7d} {r['fps']:8.1f} {speedup:8.2f}"
+                  f" {r['avg_latency_ms']:11.1f}")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark parallel face detection")
+    parser.add_argument("frames_dir", nargs="?")
+    parser.add_argument("--workers", type=int, nargs="+")
+    parser.add_argument("--modes", nargs="+", default=list(MODES))
+    parser.add_argument("--frames", type=int, default=120)
+    parser.add_argument("--backend", default="haar")
+    parser.add_argument("--scale", type=float, default=1.0)
+    args = parser.parse_args()
+    benchmark_parallel(args.frames_dir, args.workers, args.modes, args.frames,
+                       {"backend": args.backend, "scale": args.scale})
@@ -0,0 +1,148 @@
+import random
+import threading
+import time
+
+
+class PigpioSim:
+    """Local stand-in for a pigpio.pi() daemon connection.
+
+    Implements the calls the servo drivers use, records every command with
+    its timestamp, and can add a per-command latency (`latency` plus up to
+    `jitter` seconds at random) to mimic the socket round-trip to pigpiod.
+
+    With `slew_rate` (pulse width microseconds per second) each servo
+    moves towards its commanded width at that speed instead of jumping
+    there, e.g. about 6000 for an SG90 (0.1 s per 60 degrees);
+    servo_position() and arrival_time() tell where it is and when it gets
+    there. All times are time.monotonic().
+    """
+    def __init__(self, latency=0.0, jitter=0.0, slew_rate=None, seed=None):
+        self.connected = True
+        self.latency = latency
+        self.jitter = jitter
+        self.slew_rate = slew_rate
+        self.pulsewidths = {}
+        self.commands = []      # (time, command, args)
+        self.servo_log = []     # (time, gpio, pulsewidth) as applied
+        self.round_trips = 0
+        self._motion = {}       # gpio -> (start time, start width, target width)
+        self._random = random.Random(seed)
+        self._scripts = {}
+        self._next_script = 0
+        self._lock = threading.Lock()
+
+    def _command(self, name, *args):
+        if not self.connected:
+            raise ConnectionError("pigpio connection closed")
+        delay = self.latency
+        if self.jitter > 0:
+            delay += self._random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        with self._lock:
+            self.round_trips += 1
+            self.commands.append((time.monotonic(), name, args))
+
+    def _apply(self, gpio, pulsewidth):
+        # Pulse width 0 stops the pulses; the servo stays where it is
+        now = time.monotonic()
+        with self._lock:
+            self.pulsewidths[gpio] = pulsewidth
+            self.servo_log.append((now, gpio, pulsewidth))
+            if pulsewidth:
+                self._motion[gpio] = (now, self._position(gpio, now) or pulsewidth, pulsewidth)
+
+    def _position(self, gpio, t):
+        motion = self._motion.get(gpio)
+        if motion is None:
+            return None
+        start, width, target = motion
+        if self.slew_rate is None:
+            return target
+        step = self.slew_rate * max(0.0, t - start)
+        if abs(target - width) <= step:
+            return target
+        return width + step if target > width else width - step
+
+    def servo_position(self, gpio, t=None):
+        """Simulated pulse width the servo horn is at now (or at time `t`)."""
+        with self._lock:
+            return self._position(gpio, time.monotonic() if t is None else t)
+
+    def arrival_time(self, gpio):
+        """When the servo reaches its last commanded width (None if never driven)."""
+        with self._lock:
+            motion = self._motion.get(gpio)
+            if motion is None:
+                return None
+            start, width, target = motion
+            if self.slew_rate is None:
+                return start
+            return start + abs(target - width) / self.slew_rate
+
+    def command_times(self, name=None):
+        """Timestamps of every recorded command, or only those called `name`."""
+        with self._lock:
+            return [t for t, command, _ in self.commands if name is None or command == name]
+
+    def reset_logs(self):
+        with self._lock:
+            self.commands = []
+            self.servo_log = []
+            self.round_trips = 0
+
+    def set_servo_pulsewidth(self, gpio, pulsewidth):
+        self._command("servo", gpio, pulsewidth)
+        if pulsewidth != 0 and not 500 <= pulsewidth <= 2500:
+            return -8   # PI_BAD_PULSEWIDTH
+        self._apply(gpio, pulsewidth)
+        return 0
+
+    def get_servo_pulsewidth(self, gpio):
+        self._command("gpw", gpio)
+        return self.pulsewidths.get(gpio, 0)
+
+    def store_script(self, script):
+        self._command("proc", script)
+        tokens = script.decode().split()
+        # Only "servo pN pM" sequences are understood, which is all the
+        # batched servo driver stores.
+        if not tokens or len(tokens) % 3:
+            return -47  # PI_BAD_SCRIPT
+        program = []
+        for i in range(0, len(tokens), 3):
+            cmd, gpio, width = tokens[i:i + 3]
+            if cmd.lower() != "servo":
+                return -110  # PI_BAD_SCRIPT_CMD
+            try:
+                program.append((int(gpio[1:]), int(width[1:])))
+            except ValueError:
+                return -47  # PI_BAD_SCRIPT
+        script_id = self._next_script
+        self._next_script += 1
+        self._scripts[script_id] = program
+        return script_id
+
+    def script_status(self, script_id):
+        self._command("procp", script_id)
+        if script_id not in self._scripts:
+            return -48, ()  # PI_BAD_SCRIPT_ID
+        return 1, ()  # PI_SCRIPT_HALTED, i.e. ready to run
+
+    def run_script(self, script_id, params=None):
+        self._command("procr", script_id, tuple(params or ()))
+        program = self._scripts.get(script_id)
+        if program is None:
+            return -48
+        params = list(params or ()) + [0] * 10
+        for gpio_param, width_param in program:
+            self._apply(params[gpio_param], params[width_param])
+        return 0
+
+    def delete_script(self, script_id):
+        self._command("procd", script_id)
+        self._scripts.pop(script_id, None)
+        return 0
+
+    def stop(self):
+        self.connected = False
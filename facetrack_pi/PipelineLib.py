@@ -0,0 +1,99 @@
+import threading
+import time
+
+
+class LatestQueue:
+    """Bounded queue where a put on a full queue drops the oldest item.
+
+    Consumers always see the freshest items, and a slow consumer never
+    makes a producer wait or builds up a backlog of stale work.
+    `on_drop(item)` is called for every item dropped that way, e.g. to
+    give its buffers back.
+    """
+    def __init__(self, maxsize=1, on_drop=None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.on_drop = on_drop
+        self._items = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self.put_count = 0
+        self.drop_count = 0
+
+    def put(self, item):
+        """Queue `item`; returns False (and keeps nothing) once closed."""
+        dropped = None
+        with self._cond:
+            if self._closed:
+                return False
+            if len(self._items) >= self.maxsize:
+                dropped = self._items.pop(0)
+                self.drop_count += 1
+            self._items.append(item)
+            self.put_count += 1
+            self._cond.notify()
+        if dropped is not None and self.on_drop is not None:
+            self.on_drop(dropped)
+        return True
+
+    def get(self, timeout=None):
+        """Return the oldest queued item, or None on timeout or close."""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait_for(lambda: self._items or self._closed, timeout)
+            if not self._items:
+                return None
+            return self._items.pop(0)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+
+class Stage:
+    """Worker thread that runs `func` until the pipeline stop event is set.
+
+    `func` is called repeatedly and is expected to block on its input
+    queue (with a timeout) so the stop event is checked regularly.
+    """
+    def __init__(self, name, func, stop_event):
+        self.name = name
+        self._func = func
+        self._stop_event = stop_event
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.iterations = 0
+        self.busy_time = 0.0
+        self.error = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            start = time.perf_counter()
+            try:
+                did_work = self._func()
+            except Exception as e:
+                print(f"Pipeline stage '{self.name}' failed: {e}")
+                self.error = e
+                self._stop_event.set()
+                break
+            if did_work:
+                self.iterations += 1
+                self.busy_time += time.perf_counter() - start
+
+    def start(self):
+        self._thread.start()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def get_stats(self):
+        return {
+            "iterations": self.iterations,
+            "avg_ms": 1000.0 * self.busy_time / self.iterations if self.iterations else 0.0,
+        }
@@ -1,10 +1,16 @@
 import sys
 import select
 import time
+import math
+import threading
+from concurrent.futures import Future
 
-from gpiozero import Servo
-from gpiozero.pins.pigpio import PiGPIOFactory
-import pigpio
+from LazyLib import lazy_import
+
+# Imported on first use; gpiozero alone takes a good part of a second
+gpiozero = lazy_import("gpiozero")
+gpiozero_pigpio = lazy_import("gpiozero.pins.pigpio")
+pigpio = lazy_import("pigpio")
 
 #must call sudo pipgiod daemon ?
 
@@ -14,28 +20,230 @@ import pigpio
 def kbhit():
     return select.select([sys.stdin], [], [], 0)[0]
  
+# -------------------------
+# Shared pigpio daemon connections
+# -------------------------
+_pi_pool = {}
+_pi_pool_lock = threading.Lock()
+
+def acquire_pi(host="localhost", port=8888):
+	"""Return a pigpio connection shared by every user of host:port."""
+	with _pi_pool_lock:
+		entry = _pi_pool.get((host, port))
+		if entry is None:
+			pi = pigpio.pi(host, port)
+			if not pi.connected:
+				raise RuntimeError("Cannot connect to pigpio daemon. Run 'sudo pigpiod'")
+			entry = [pi, 0]
+			_pi_pool[(host, port)] = entry
+		entry[1] += 1
+		return entry[0]
+
+def release_pi(pi):
+	"""Drop one reference; the connection is closed by the last user."""
+	with _pi_pool_lock:
+		for key, entry in list(_pi_pool.items()):
+			if entry[0] is pi:
+				entry[1] -= 1
+				if entry[1] <= 0:
+					del _pi_pool[key]
+					pi.stop()
+				return
+
+# -------------------------
+# Direct pigpio servo driver
+# -------------------------
+
+class ServoBank:
+	"""Several servos (e.g. a pan-tilt head) on one pigpio connection.
+
+	Pulse widths are written straight to pigpiod. update() sends every
+	changed servo in a single stored-script run, i.e. one socket round
+	trip per control tick for up to 5 servos.
+	"""
+	MAX_PER_SCRIPT = 5   # pigpio scripts take 10 parameters
+
+	def __init__(self, pins, pi=None, min_pulse_width=500, max_pulse_width=2500):
+		self.pins = list(pins)
+		self.min_pulse_width = min_pulse_width
+		self.max_pulse_width = max_pulse_width
+		self._owns_pi = pi is None
+		self.pi = pi if pi is not None else acquire_pi()
+
+		self._pending = {}
+		self._sent = {}
+		self._scripts = {}
+		self._lock = threading.Lock()
+
+		self.commands = 0
+		self.round_trips = 0
+		self.total_latency = 0.0
+		self.max_latency = 0.0
+
+	def angle_to_pulsewidth(self, angle):
+		angle = max(0.0, min(180.0, angle))
+		span = self.max_pulse_width - self.min_pulse_width
+		return int(round(self.min_pulse_width + span * angle / 180.0))
+
+	def set_angle(self, pin, angle, flush=True):
+		self.set_pulsewidth(pin, self.angle_to_pulsewidth(angle), flush)
+
+	def set_pulsewidth(self, pin, pulsewidth, flush=True):
+		with self._lock:
+			self._pending[pin] = pulsewidth
+		if flush:
+			self.update()
+
+	def set_angles(self, angles):
+		"""Queue {pin: angle} for all axes and send them in one batch."""
+		with self._lock:
+			for pin, angle in angles.items():
+				self._pending[pin] = self.angle_to_pulsewidth(angle)
+		self.update()
+
+	def update(self):
+		"""Send every changed pulse width; returns the number of servos written."""
+		with self._lock:
+			changes = [(pin, pw) for pin, pw in self._pending.items()
+					   if self._sent.get(pin) != pw]
+			self._pending.clear()
+			if not changes:
+				return 0
+
+			start = time.perf_counter()
+			for i in range(0, len(changes), self.MAX_PER_SCRIPT):
+				self._send(changes[i:i + self.MAX_PER_SCRIPT])
+			latency = time.perf_counter() - start
+
+			for pin, pw in changes:
+				self._sent[pin] = pw
+			self.commands += 1
+			self.total_latency += latency
+			self.max_latency = max(self.max_latency, latency)
+			return len(changes)
+
+	def _send(self, changes):
+		if len(changes) > 1:
+			script_id = self._script_for(len(changes))
+			if script_id is not None:
+				params = [v for change in changes for v in change]
+				if self.pi.run_script(script_id, params) >= 0:
+					self.round_trips += 1
+					return
+		for pin, pw in changes:
+			self.pi.set_servo_pulsewidth(pin, pw)
+			self.round_trips += 1
+
+	def _script_for(self, count):
+		"""Stored script setting `count` servos from parameters, or None."""
+		if count in self._scripts:
+			return self._scripts[count]
+		text = " ".join(f"servo p{2*i} p{2*i+1}" for i in range(count))
+		script_id = self.pi.store_script(text.encode())
+		if script_id < 0:
+			script_id = None
+		else:
+			# Scripts are compiled asynchronously by the daemon
+			for _ in range(100):
+				status, _ = self.pi.script_status(script_id)
+				if status != 0:   # PI_SCRIPT_INITING
+					break
+				time.sleep(0.001)
+		self._scripts[count] = script_id
+		return script_id
+
+	def get_stats(self):
+		return {
+			"commands": self.commands,
+			"round_trips": self.round_trips,
+			"avg_latency_ms": 1000.0 * self.total_latency / self.commands if self.commands else 0.0,
+			"max_latency_ms": 1000.0 * self.max_latency,
+		}
+
+	def detach(self):
+		"""Stop sending pulses and release the shared connection."""
+		with self._lock:
+			try:
+				for pin in self.pins:
+					self.pi.set_servo_pulsewidth(pin, 0)
+				for script_id in self._scripts.values():
+					if script_id is not None:
+						self.pi.delete_script(script_id)
+			except Exception:
+				pass
+			self._scripts.clear()
+			self._sent.clear()
+		if self._owns_pi:
+			release_pi(self.pi)
+			self._owns_pi = False
+
 # -------------------------
 # Servo using gpiozero + pigpio backend
 # -------------------------
 
 class ServoLib:
-	def __init__(self, name, servo_pin):
+	def __init__(self, name, servo_pin, backend="gpiozero", bank=None, pi=None,
+				 pin_factory=None):
+		"""backend is "gpiozero", "pigpio" (direct pulse widths through a
+		ServoBank) or "sim" (the pigpio driver on a PigpioSim, no hardware).
+		Pass `bank` to share one ServoBank between several axes.
+
+		The hardware is pluggable: `pi` replaces the pigpio daemon
+		connection of the pigpio/sim backends (e.g. a PigpioSim with
+		latency and slew), `pin_factory` the PiGPIOFactory of the gpiozero
+		backend (e.g. gpiozero's MockFactory).
 
-		self.pi = pigpio.pi()
-		if not self.pi.connected:
-			raise RuntimeError("Cannot connect to pigpio daemon. Run 'sudo pigpiod'")
+		`pi` is kept as self.pi, the connection commands go out on. It is
+		None for a pin factory that has no pigpio connection (MockFactory,
+		the RPi.GPIO and lgpio factories); nothing in this class needs it
+		with the gpiozero backend, so check it before using it there."""
 
 		self.servo_pin = servo_pin
-		self.factory = PiGPIOFactory()
-
-		self.servo = Servo(
-			servo_pin,
-			pin_factory=self.factory,
-			min_pulse_width=0.0005,   # 500 µs
-			max_pulse_width=0.0025    # 2500 µs
-		)
+		self.backend = backend
+		self.bank = None
+		self.servo = None
+
+		if backend == "sim" and pi is None and bank is None:
+			from PigpioSim import PigpioSim
+			pi = PigpioSim()
+		if backend in ("pigpio", "sim"):
+			self._owns_bank = bank is None
+			self.bank = bank if bank is not None else ServoBank([servo_pin], pi=pi)
+			self.pi = self.bank.pi
+		elif backend == "gpiozero":
+			# Reuse the factory's daemon connection rather than opening a
+			# second one.
+			self._owns_factory = pin_factory is None
+			if pin_factory is None:
+				try:
+					pin_factory = gpiozero_pigpio.PiGPIOFactory()
+				except (IOError, OSError):
+					raise RuntimeError("Cannot connect to pigpio daemon. Run 'sudo pigpiod'")
+			self.factory = pin_factory
+			# None unless the factory talks to pigpiod
+			self.pi = getattr(pin_factory, "connection", None)
+
+			self.servo = gpiozero.Servo(
+				servo_pin,
+				pin_factory=self.factory,
+				min_pulse_width=0.0005,   # 500 µs
+				max_pulse_width=0.0025    # 2500 µs
+			)
+		else:
+			raise ValueError("Unknown servo backend: " + str(backend))
 		self.current_angle = 90
-		self.set_angle(90)
+
+		# Asynchronous motion controller (see start_controller)
+		self._ctrl_thread = None
+		self._ctrl_stop = threading.Event()
+		self._ctrl_cond = threading.Condition()
+		self._target = None
+		self._target_future = None
+		self._velocity = 0.0
+
+		# Already at 90 as far as we know; one write centres it without
+		# the 200 ms ramp
+		self.set_angle(90, steps=1, delay=0)
 		return
 		
 	def angle_to_value(self, angle):
@@ -44,9 +252,17 @@ class ServoLib:
 		return max(-1, min(1,value))
 	
 	def set_angle(self, target_angle, steps=20, delay=0.01):
+		"""Move to target_angle.
+
+		Blocks for steps*delay seconds, unless the motion controller is
+		running: then it returns a Future at once (steps/delay are ignored).
+		"""
 		if not 0 <= target_angle <= 180:
 			raise ValueError("Angle must be between 0 and 180")
 
+		if self.controller_running():
+			return self._set_target(target_angle)
+
 		if steps < 1:
 			steps = 1
 
@@ -54,16 +270,124 @@ class ServoLib:
 
 		for step in range(steps):
 			self.current_angle += step_angle
-			self.servo.value = self.angle_to_value(self.current_angle)
+			self._write(self.current_angle)
 			time.sleep(delay)
 
 		self.current_angle = target_angle
-		self.servo.value = self.angle_to_value(target_angle)
+		self._write(target_angle)
 		return
 
+	def _write(self, angle):
+		if self.bank is not None:
+			self.bank.set_angle(self.servo_pin, angle)
+		else:
+			self.servo.value = self.angle_to_value(angle)
+
+	# -------------------------
+	# Asynchronous motion controller
+	# -------------------------
+	def start_controller(self, max_speed=300.0, accel=None, rate=100.0):
+		"""Drive the servo from a background thread.
+
+		max_speed is in degrees/s. With accel (degrees/s^2) moves follow a
+		trapezoidal velocity profile, otherwise they are only rate limited.
+		A new target replaces the pending one instead of queueing behind it.
+		"""
+		if self.controller_running():
+			return
+		self.max_speed = max_speed
+		self.accel = accel
+		self._period = 1.0 / rate
+		self._velocity = 0.0
+		self._ctrl_stop.clear()
+		self._ctrl_thread = threading.Thread(target=self._controller_loop, daemon=True)
+		self._ctrl_thread.start()
+
+	def controller_running(self):
+		return self._ctrl_thread is not None and not self._ctrl_stop.is_set()
+
+	def _set_target(self, target_angle):
+		"""Replace the current target; the superseded Future is cancelled."""
+		future = Future()
+		with self._ctrl_cond:
+			if self._target_future is not None:
+				self._target_future.cancel()
+			self._target = float(target_angle)
+			self._target_future = future
+			self._ctrl_cond.notify()
+		return future
+
+	def _controller_loop(self):
+		dt = self._period
+		next_tick = time.monotonic()
+		while not self._ctrl_stop.is_set():
+			with self._ctrl_cond:
+				if self._target is None:
+					self._ctrl_cond.wait(0.1)
+					next_tick = time.monotonic()
+					continue
+				target = self._target
+
+			error = target - self.current_angle
+			direction = 1.0 if error >= 0 else -1.0
+			if self.accel:
+				# Fastest speed that can still stop at the target
+				v_limit = min(self.max_speed, math.sqrt(2.0 * self.accel * abs(error)))
+				dv = direction * v_limit - self._velocity
+				max_dv = self.accel * dt
+				self._velocity += max(-max_dv, min(max_dv, dv))
+			else:
+				self._velocity = direction * min(self.max_speed, abs(error) / dt)
+
+			step = self._velocity * dt
+			if abs(step) >= abs(error):
+				angle = target
+			else:
+				angle = self.current_angle + step
+			self.current_angle = angle
+			self._write(angle)
+
+			if angle == target:
+				self._velocity = 0.0
+				with self._ctrl_cond:
+					if self._target == target:
+						self._target = None
+						if self._target_future is not None:
+							self._target_future.set_result(True)
+							self._target_future = None
+
+			next_tick += dt
+			delay = next_tick - time.monotonic()
+			if delay > 0:
+				time.sleep(delay)
+			else:
+				next_tick = time.monotonic()
+
+	def stop_controller(self):
+		if self._ctrl_thread is None:
+			return
+		self._ctrl_stop.set()
+		self._ctrl_thread.join(timeout=1.0)
+		self._ctrl_thread = None
+		with self._ctrl_cond:
+			if self._target_future is not None:
+				self._target_future.cancel()
+				self._target_future = None
+			self._target = None
+
 	def stop_servo(self):
-		self.servo.detach()
-		self.pi.stop()
+		self.stop_controller()
+		if self.bank is not None:
+			if self._owns_bank:
+				self.bank.detach()
+			else:
+				self.bank.set_pulsewidth(self.servo_pin, 0)
+			self.bank = None
+		elif self.servo is not None:
+			self.servo.detach()
+			if self._owns_factory:
+				self.factory.close()
+			self.servo = None
 		
 	def __del__(self):
 		self.stop_servo()
@@ -78,6 +402,98 @@ def test():
 	s.stop_servo()
 	return
 
+def test_controller():
+	s = ServoLib("tester", 18)
+	s.start_controller(max_speed=180.0, accel=720.0)
+
+	# Each call returns at once; the later target replaces the earlier one
+	s.set_angle(30)
+	done = s.set_angle(150)
+	done.result(timeout=5)
+	print("arrived at", s.current_angle)
+
+	s.stop_servo()
+	return
+
+def test_bank(sim=False):
+	# Pan-tilt head on one shared connection, both axes per tick.
+	# sim=True runs against PigpioSim with a 0.5 ms round trip.
+	pi = None
+	if sim:
+		from PigpioSim import PigpioSim
+		pi = PigpioSim(latency=0.0005)
+	bank = ServoBank([18, 19], pi=pi)
+	for angle in range(60, 121, 5):
+		bank.set_angles({18: angle, 19: 180 - angle})
+		time.sleep(0.02)
+	print("bank stats:", bank.get_stats())
+	bank.detach()
+	return
+
+def benchmark_servo(commands=500, latency=0.0002, jitter=0.0, hardware=False):
+	"""Servo command throughput for each driver path.
+
+	Runs against PigpioSim with `latency` (+ up to `jitter`) seconds per
+	round trip unless `hardware` is set, in which case the gpiozero and
+	pigpio backends drive pin 18 (and 19 for the two-axis runs) through
+	pigpiod. Reports commands/s, round trips and CPU time per command.
+	"""
+	from PigpioSim import PigpioSim
+
+	def connection():
+		return None if hardware else PigpioSim(latency=latency, jitter=jitter)
+
+	def single(backend):
+		servo = ServoLib("bench", 18, backend=backend, pi=connection())
+		return servo, lambda angle: servo.set_angle(angle, steps=1, delay=0), servo.stop_servo
+
+	def bank(batched):
+		b = ServoBank([18, 19], pi=connection())
+		if batched:
+			move = lambda angle: b.set_angles({18: angle, 19: 180 - angle})
+		else:
+			def move(angle):
+				b.set_angle(18, angle)
+				b.set_angle(19, 180 - angle)
+		return b, move, b.detach
+
+	runs = [("pigpio" if hardware else "sim", lambda: single("pigpio" if hardware else "sim")),
+			("bank x2", lambda: bank(False)),
+			("bank x2 batched", lambda: bank(True))]
+	if hardware:
+		runs.insert(0, ("gpiozero", lambda: single("gpiozero")))
+
+	results = {}
+	for name, make in runs:
+		driver, move, close = make()
+		pi = driver.pi
+		trips_before = getattr(pi, "round_trips", 0)
+		worst = 0.0
+		cpu = time.process_time()
+		start = time.perf_counter()
+		for i in range(commands):
+			t = time.perf_counter()
+			move(60 + i % 60)
+			worst = max(worst, time.perf_counter() - t)
+		elapsed = time.perf_counter() - start
+		cpu = time.process_time() - cpu
+		trips = getattr(pi, "round_trips", trips_before) - trips_before
+		close()
+		results[name] = {
+			"commands_per_s": commands / elapsed,
+			"avg_ms": 1000.0 * elapsed / commands,
+			"max_ms": 1000.0 * worst,
+			"round_trips_per_command": trips / commands if trips else None,
+			"cpu_us_per_command": 1e6 * cpu / commands,
+		}
+
+	print(f"{'driver':16s} {'cmd/s':>8s} {'avg ms':>7s} {'max ms':>7s} {'trips':>6s} {'cpu us':>7s}")
+	for name, r in results.items():
+		trips = f"{r['round_trips_per_command']:6.1f}" if r["round_trips_per_command"] else "     -"
+		print(f"{name:16s} {r['commands_per_s']:8.0f} {r['avg_ms']:7.3f} {r['max_ms']:7.3f}"
+			  f" {trips} {r['cpu_us_per_command']:7.1f}")
+	return results
+
 def test2():
 	#initialization
 	angle = 100
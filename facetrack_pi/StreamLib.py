@@ -0,0 +1,233 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from EncoderLib import encode_params
+from PipelineLib import LatestQueue
+from LazyLib import lazy_import
+
+cv2 = lazy_import("cv2")
+
+BOUNDARY = "frame"
+
+PAGE = b"""<html><head><title>Facetrack</title></head>
+<body style="margin:0;background:#000"><img src="/stream.mjpg" style="width:100%"></body></html>
+"""
+
+
+class MjpegServer:
+    """Annotated MJPEG preview served over HTTP, off the tracking loop.
+
+    The loop calls wants_frame() each iteration; it is True only when a
+    client is watching and `fps` allows another frame, so with nobody
+    connected nothing is converted, drawn or encoded. publish() hands the
+    frame to a publisher thread that shrinks it to `size`, draws the
+    boxes and encodes the JPEG.
+
+    Open http://<host>:<port>/ in a browser, or /stream.mjpg directly;
+    /snapshot.jpg returns one frame.
+    """
+    def __init__(self, port=8080, host="127.0.0.1", fps=10.0, size=(320, 240), quality=70):
+        self.fps = fps
+        self.size = size
+        self.quality = quality
+        self.host = host
+        self.port = port
+
+        self._queue = LatestQueue(maxsize=1)
+        self._cond = threading.Condition()
+        self._jpeg = None
+        self._jpeg_seq = 0
+        self._clients = 0
+        self._snapshot_waiters = 0
+        self._next_due = 0.0
+        self._stop = threading.Event()
+
+        self.published = 0
+        self.encoded = 0
+        self.skipped_idle = 0
+        self.skipped_rate = 0
+        self.bytes_sent = 0
+        self.encode_time = 0.0
+
+        # Bind first, so a taken port leaves no publisher thread behind
+        self._server = self._serve()
+        self._thread = threading.Thread(target=self._publish_loop, daemon=True)
+        self._thread.start()
+
+    # -------------------------
+    # Tracking loop side
+    # -------------------------
+    def wants_frame(self):
+        """True if a frame published now would be sent to someone."""
+        if not self._clients and not self._snapshot_waiters:
+            self.skipped_idle += 1
+            return False
+        if time.monotonic() < self._next_due:
+            self.skipped_rate += 1
+            return False
+        return True
+
+    def publish(self, frame, faces=(), source_width=None, label=None):
+        """Queue a BGR frame for the stream; the caller must not modify it afterwards.
+
+        `faces` are (x, y, w, h) boxes in coordinates of an image
+        `source_width` pixels wide (default: the frame's own width).
+        """
+        self._next_due = time.monotonic() + 1.0 / self.fps
+        self.published += 1
+        self._queue.put((frame, faces, source_width or frame.shape[1], label))
+
+    def _publish_loop(self):
+        params = encode_params("jpg", self.quality)
+        while not self._stop.is_set():
+            item = self._queue.get(timeout=0.5)
+            if item is None:
+                continue
+            frame, faces, source_width, label = item
+            start = time.perf_counter()
+            if self.size is not None and (frame.shape[1], frame.shape[0]) != tuple(self.size):
+                frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+            else:
+                frame = frame.copy()
+            # Overlays go on the small published copy only
+            s = frame.shape[1] / source_width
+            for (x, y, w, h) in faces:
+                x, y, w, h = int(x*s), int(y*s), int(w*s), int(h*s)
+                cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+            if label:
+                cv2.putText(frame, label, (5, 15), cv2.FONT_HERSHEY_SIMPLEX, 0.45,
+                            (0, 255, 0), 1, cv2.LINE_AA)
+            ok, data = cv2.imencode(".jpg", frame, params)
+            if not ok:
+                continue
+            self.encode_time += time.perf_counter() - start
+            self.encoded += 1
+            with self._cond:
+                self._jpeg = data.tobytes()
+                self._jpeg_seq += 1
+                self._cond.notify_all()
+
+    # -------------------------
+    # HTTP side
+    # -------------------------
+    def _wait_jpeg(self, after_seq, timeout=1.0):
+        with self._cond:
+            self._cond.wait_for(lambda: self._jpeg_seq > after_seq or self._stop.is_set(),
+                                timeout)
+            return self._jpeg, self._jpeg_seq
+
+    def _serve(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path in ("/", "/index.html"):
+                    self._send(PAGE, "text/html")
+                elif self.path == "/snapshot.jpg":
+                    with server._cond:
+                        server._snapshot_waiters += 1
+                    try:
+                        jpeg, _ = server._wait_jpeg(server._jpeg_seq, timeout=2.0)
+                    finally:
+                        with server._cond:
+                            server._snapshot_waiters -= 1
+                    if jpeg is None:
+                        self.send_error(503, "No frame available")
+                        return
+                    self._send(jpeg, "image/jpeg")
+                elif self.path == "/stream.mjpg":
+                    self._stream()
+                else:
+                    self.send_error(404)
+
+            def _send(self, body, content_type):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream(self):
+                self.send_response(200)
+                self.send_header("Cache-Control", "no-cache, private")
+                self.send_header("Pragma", "no-cache")
+                self.send_header("Content-Type",
+                                 "multipart/x-mixed-replace; boundary=" + BOUNDARY)
+                self.end_headers()
+                with server._cond:
+                    server._clients += 1
+                seq = 0
+                try:
+                    while not server._stop.is_set():
+                        jpeg, new_seq = server._wait_jpeg(seq)
+                        if new_seq == seq or jpeg is None:
+                            continue
+                        seq = new_seq
+                        self.wfile.write(b"--" + BOUNDARY.encode() + b"\r\n")
+                        self.wfile.write(b"Content-Type: image/jpeg\r\n")
+                        self.wfile.write(b"Content-Length: %d\r\n\r\n" % len(jpeg))
+                        self.wfile.write(jpeg)
+                        self.wfile.write(b"\r\n")
+                        server.bytes_sent += len(jpeg)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with server._cond:
+                        server._clients -= 1
+
+            def log_message(self, format, *args):
+                pass
+
+        httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        httpd.daemon_threads = True
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        return httpd
+
+    def clients(self):
+        return self._clients
+
+    def get_stats(self):
+        return {
+            "clients": self._clients,
+            "published": self.published,
+            "encoded": self.encoded,
+            "skipped_idle": self.skipped_idle,
+            "skipped_rate": self.skipped_rate,
+            "bytes_sent": self.bytes_sent,
+            "avg_encode_ms": 1000.0 * self.encode_time / self.encoded if self.encoded else 0.0,
+        }
+
+    def close(self):
+        self._stop.set()
+        self._queue.close()
+        with self._cond:
+            self._cond.notify_all()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self._thread.join(timeout=1.0)
+
+
+def test_stream_camera(port=8080, seconds=60, host="127.0.0.1"):
+    """Headless camera preview: browse to http://<pi>:<port>/.
+
+    Pass host="0.0.0.0" to watch from another machine.
+    """
+    from CameraLib import CameraLib
+    cam = CameraLib(width=640, height=480, rotate_180=True)
+    cam.start_stream(buffers=3)
+    server = MjpegServer(port=port, host=host)
+    print(f"Streaming on port {port} for {seconds} s...")
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        frame, seq, timestamp = cam.get_latest(wait_new=True)
+        if server.wants_frame():
+            server.publish(cam.upright(frame).copy(), label=f"#{seq}")
+    print("Stats:", server.get_stats())
+    server.close()
+    cam.close()
+
+
+if __name__ == "__main__":
+    test_stream_camera()
@@ -0,0 +1,170 @@
+import math
+from DetectorLib import iou
+
+TARGET_POLICIES = ("largest", "center", "first")
+
+
+class Track:
+    """One face followed across frames with a constant-velocity model.
+
+    State is the box center and size plus the center velocity in pixels
+    per frame. Updates use a fixed-gain alpha-beta filter, the
+    steady-state form of a constant-velocity Kalman filter.
+    """
+    def __init__(self, track_id, box, frame_index):
+        x, y, w, h = box
+        self.id = track_id
+        self.cx = x + w / 2.0
+        self.cy = y + h / 2.0
+        self.w = float(w)
+        self.h = float(h)
+        self.vx = 0.0
+        self.vy = 0.0
+        self.first_seen = frame_index
+        self.last_seen = frame_index
+        self.hits = 1
+        self.misses = 0
+
+    def predict(self):
+        self.cx += self.vx
+        self.cy += self.vy
+
+    def update(self, box, frame_index, alpha, beta):
+        x, y, w, h = box
+        mx = x + w / 2.0
+        my = y + h / 2.0
+        # Velocity gain is per frame since the last measurement
+        frames = max(1, frame_index - self.last_seen)
+        rx = mx - self.cx
+        ry = my - self.cy
+        self.cx += alpha * rx
+        self.cy += alpha * ry
+        self.vx += beta * rx / frames
+        self.vy += beta * ry / frames
+        self.w += alpha * (w - self.w)
+        self.h += alpha * (h - self.h)
+        self.last_seen = frame_index
+        self.hits += 1
+        self.misses = 0
+
+    def box(self):
+        return (int(round(self.cx - self.w / 2.0)), int(round(self.cy - self.h / 2.0)),
+                int(round(self.w)), int(round(self.h)))
+
+
+class FaceTracker:
+    """Associate detections across frames and keep stable track IDs.
+
+    Detections are matched to predicted tracks greedily by IoU, falling
+    back to center distance (within `max_jump` face widths) for fast
+    movers. With `detect_every` = k the detector only needs to run on
+    every k-th frame; step(None) advances the predictions in between.
+
+    The servo target is chosen by `policy` ("largest", "center" or
+    "first" seen) and then kept for as long as its track lives, so the
+    head does not jump between people when detection order changes.
+    """
+    def __init__(self, frame_size=(640, 480), detect_every=1, policy="largest",
+                 iou_threshold=0.3, max_jump=1.0, max_misses=10, alpha=0.6, beta=0.2):
+        if policy not in TARGET_POLICIES:
+            raise ValueError("policy must be one of " + ", ".join(TARGET_POLICIES))
+        self.frame_size = frame_size
+        self.detect_every = max(1, detect_every)
+        self.policy = policy
+        self.iou_threshold = iou_threshold
+        self.max_jump = max_jump
+        self.max_misses = max_misses
+        self.alpha = alpha
+        self.beta = beta
+
+        self.tracks = []
+        self.target_id = None
+        self.frame_index = 0
+        self._next_id = 1
+        self.detections_run = 0
+
+    def should_detect(self):
+        """True if the detector should run on the next frame."""
+        return not self.tracks or self.frame_index % self.detect_every == 0
+
+    def step(self, detections=None):
+        """Advance one frame; `detections` is None on frames without detection."""
+        self.frame_index += 1
+        for track in self.tracks:
+            track.predict()
+
+        if detections is not None:
+            self.detections_run += 1
+            self._associate([tuple(int(v) for v in d) for d in detections])
+            self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+        self._update_target()
+        return self.tracks
+
+    def _associate(self, detections):
+        pairs = []
+        for ti, track in enumerate(self.tracks):
+            predicted = track.box()
+            for di, det in enumerate(detections):
+                overlap = iou(predicted, det)
+                if overlap >= self.iou_threshold:
+                    pairs.append((overlap, ti, di))
+                else:
+                    # Fast movers may not overlap their prediction at all
+                    dx = det[0] + det[2] / 2.0 - track.cx
+                    dy = det[1] + det[3] / 2.0 - track.cy
+                    if math.hypot(dx, dy) <= self.max_jump * track.w:
+                        pairs.append((overlap - 1.0, ti, di))   # rank below any IoU match
+        pairs.sort(reverse=True)
+
+        used_tracks = set()
+        used_dets = set()
+        for _, ti, di in pairs:
+            if ti in used_tracks or di in used_dets:
+                continue
+            self.tracks[ti].update(detections[di], self.frame_index, self.alpha, self.beta)
+            used_tracks.add(ti)
+            used_dets.add(di)
+
+        for ti, track in enumerate(self.tracks):
+            if ti not in used_tracks:
+                track.misses += 1
+        for di, det in enumerate(detections):
+            if di not in used_dets:
+                self.tracks.append(Track(self._next_id, det, self.frame_index))
+                self._next_id += 1
+
+    def _update_target(self):
+        if any(t.id == self.target_id for t in self.tracks):
+            return
+        self.target_id = None
+        if not self.tracks:
+            return
+        if self.policy == "largest":
+            best = max(self.tracks, key=lambda t: t.w * t.h)
+        elif self.policy == "center":
+            fx = self.frame_size[0] / 2.0
+            fy = self.frame_size[1] / 2.0
+            best = min(self.tracks, key=lambda t: math.hypot(t.cx - fx, t.cy - fy))
+        else:
+            best = min(self.tracks, key=lambda t: (t.first_seen, t.id))
+        self.target_id = best.id
+
+    def target(self):
+        for track in self.tracks:
+            if track.id == self.target_id:
+                return track
+        return None
+
+    def boxes(self):
+        """Predicted boxes for all live tracks, target first."""
+        ordered = sorted(self.tracks, key=lambda t: t.id != self.target_id)
+        return [t.box() for t in ordered]
+
+    def get_stats(self):
+        return {
+            "frames": self.frame_index,
+            "detections_run": self.detections_run,
+            "tracks": len(self.tracks),
+            "target_id": self.target_id,
+        }
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The libraries are flat modules imported by name, as the demos run them
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ("facetrack_pi", "ultrasound"):
+    sys.path.insert(0, os.path.join(ROOT, folder))
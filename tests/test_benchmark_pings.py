@@ -0,0 +1,44 @@
+from SimGPIO import SimGPIO, sine_profile
+from UltrasoundLib import MIN_PING_INTERVAL, benchmark_pings
+
+
+def test_fixed_distance_reports_error():
+    results = benchmark_pings(seconds=0.5, distance=100.0)
+    for r in results.values():
+        assert r["valid"] > 0.8
+        assert r["error_cm"] is not None
+    # Polling shares the GIL with the simulator thread, so one late sample
+    # can be off by tens of cm
+    assert results["rpigpio"]["error_cm"] < 1.0
+    assert results["polling"]["error_cm"] < 5.0
+
+
+def test_profile_has_no_error():
+    results = benchmark_pings(seconds=0.3, distance=sine_profile(100.0, 20.0, 1.0),
+                              edge_backends=("rpigpio",))
+    assert results["rpigpio"]["error_cm"] is None
+
+
+def test_default_interval_keeps_datasheet_rate():
+    results = benchmark_pings(seconds=0.5, edge_backends=("rpigpio",))
+    # One ping at the start, and the last one may be sent after the end
+    assert results["rpigpio"]["pings"] <= 0.5 / MIN_PING_INTERVAL + 2
+
+
+def test_simulator_may_ping_faster():
+    results = benchmark_pings(seconds=0.5, edge_backends=("rpigpio",), ping_interval=0.01)
+    assert results["rpigpio"]["pings_per_s"] > 1.5 / MIN_PING_INTERVAL
+
+
+def test_real_gpio_is_held_to_datasheet_interval():
+    # A gpio passed in is treated as hardware, so the minimum applies
+    gpio = SimGPIO()
+    gpio.attach_sensor(23, 24, 100.0)
+    try:
+        results = benchmark_pings(seconds=0.5, edge_backends=("rpigpio",),
+                                  ping_interval=0.01, gpio=gpio)
+        intervals = gpio.ping_intervals(23)
+    finally:
+        gpio.close()
+    assert min(intervals) >= MIN_PING_INTERVAL
+    assert results["rpigpio"]["error_cm"] is None
@@ -0,0 +1,41 @@
+import random
+
+from FilterLib import DistanceFilter
+
+
+def test_step_change_gets_through():
+    f = DistanceFilter()
+    for _ in range(9):
+        f.push(200.0)
+    for _ in range(4):
+        f.push(50.0)
+    assert f.median == 50.0
+
+
+def test_scattered_outliers_are_rejected():
+    rng = random.Random(1)
+    f = DistanceFilter()
+    for _ in range(9):
+        f.push(100.0)
+    for i in range(40):
+        f.push(100.0 + rng.uniform(-0.5, 0.5) if i % 2 else rng.uniform(20.0, 380.0))
+    assert abs(f.median - 100.0) < 1.0
+
+
+def test_ramp_target_is_tracked():
+    # 1 m/s towards the sensor at one ping every 60 ms: 6 cm per ping
+    rng = random.Random(2)
+    f = DistanceFilter()
+    for _ in range(9):
+        f.push(200.0 + rng.uniform(-0.5, 0.5))
+    truth = 200.0
+    errors = []
+    while truth > 36.0:
+        truth = max(36.0, truth - 6.0)
+        f.push(truth + rng.uniform(-0.5, 0.5))
+        errors.append(abs(f.median - truth))
+    for _ in range(9):
+        f.push(36.0 + rng.uniform(-0.5, 0.5))
+    # The median lags a moving target by half a window, never more
+    assert max(errors[8:]) <= 5 * 6.0
+    assert abs(f.median - 36.0) < 1.0
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+from FrameSourceLib import MemmapSource, save_raw
+
+
+def scene():
+    image = np.zeros((480, 640, 3), np.uint8)
+    image[:, :, 0] = np.linspace(40, 200, 640, dtype=np.uint8)[None, :]
+    image[:, :, 2] = np.linspace(200, 40, 480, dtype=np.uint8)[:, None]
+    cv2.rectangle(image, (200, 150), (400, 330), (30, 180, 90), -1)
+    return image
+
+
+@pytest.mark.parametrize("format", ["YUV420", None])
+def test_i420_dump_replays_as_rgb(tmp_path, format):
+    # A luma-mode dump (I420) replayed into the default RGB888 config
+    image = scene()
+    path = str(tmp_path / "clip.raw")
+    save_raw(path, [cv2.cvtColor(image, cv2.COLOR_BGR2YUV_I420)] * 2, format=format)
+    source = MemmapSource(path)
+    source.configure(source.create_preview_configuration())
+    frame = source.capture_array()
+    assert frame.shape == image.shape
+    assert np.abs(frame.astype(int) - image).mean() < 3
+
+
+def test_gray_dump_stays_gray(tmp_path):
+    # I420-shaped, but the sidecar says it is a plain gray image
+    gray = cv2.resize(cv2.cvtColor(scene(), cv2.COLOR_BGR2GRAY), (640, 720))
+    path = str(tmp_path / "gray.raw")
+    save_raw(path, [gray], format="GRAY")
+    source = MemmapSource(path)
+    source.configure(source.create_preview_configuration())
+    frame = source.capture_array()
+    expected = cv2.resize(gray, (640, 480), interpolation=cv2.INTER_AREA)
+    assert np.array_equal(frame[:, :, 0], expected)
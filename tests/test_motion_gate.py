@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+from DetectorLib import MotionGate
+
+
+def scene(x, seed, size=70):
+    """Grainy gradient with a face-sized sprite at (x, 200)."""
+    rng = np.random.default_rng(seed)
+    ramp = np.linspace(70, 130, 640, dtype=np.float32)
+    image = np.repeat(ramp[None, :], 480, axis=0) + rng.normal(0, 3, (480, 640))
+    image[200:200 + size, x:x + size] = 200
+    image[220:230, x + 15:x + 25] = 40
+    image[220:230, x + 45:x + 55] = 40
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def test_still_scene_is_skipped():
+    gate = MotionGate()
+    assert gate.changed(scene(100, 0))
+    for seed in range(1, 10):
+        assert not gate.changed(scene(100, seed))
+
+
+@pytest.mark.parametrize("shift", [10, 30, 70, 140])
+def test_moving_sprite_is_detected(shift):
+    gate = MotionGate()
+    gate.changed(scene(100, 0))
+    assert gate.changed(scene(100 + shift, 1))
+
+
+def test_detection_is_forced_after_max_skip():
+    gate = MotionGate(max_skip=3)
+    results = [gate.changed(scene(100, seed)) for seed in range(6)]
+    assert results == [True, False, False, False, True, False]
@@ -0,0 +1,116 @@
+import threading
+from collections import deque
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+class CallbackDispatcher:
+    """Run callbacks on their own thread, fed through a bounded queue.
+
+    The producer (e.g. a sampling thread) only pays for an append. When the
+    queue is full, `overflow` decides what happens:
+    "drop_oldest" - discard the oldest queued item (consumers see fresh data)
+    "drop_newest" - discard the item being submitted
+    "block"       - wait up to `block_timeout` for space, then drop it
+    """
+    def __init__(self, maxsize=32, overflow="drop_oldest", block_timeout=0.1):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("overflow must be one of " + ", ".join(OVERFLOW_POLICIES))
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.callbacks = []
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._busy = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+        self.submitted = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+
+    def add(self, callback):
+        with self._cond:
+            self.callbacks.append(callback)
+
+    def set(self, callback):
+        """Replace all callbacks with `callback` (or none if None)."""
+        with self._cond:
+            self.callbacks = [callback] if callback else []
+
+    def submit(self, item):
+        """Queue `item` for every callback; returns False if it was dropped."""
+        with self._cond:
+            if self._closed or not self.callbacks:
+                return False
+            self.submitted += 1
+            if len(self._queue) >= self.maxsize:
+                if self.overflow == "drop_oldest":
+                    self._queue.popleft()
+                    self.dropped += 1
+                elif self.overflow == "drop_newest":
+                    self.dropped += 1
+                    return False
+                else:
+                    self._cond.wait_for(lambda: len(self._queue) < self.maxsize or self._closed,
+                                        self.block_timeout)
+                    if len(self._queue) >= self.maxsize or self._closed:
+                        self.dropped += 1
+                        return False
+            self._queue.append(item)
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self._cond.notify_all()
+            return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+                self._cond.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return
+                item = self._queue.popleft()
+                callbacks = list(self.callbacks)
+                self._busy = True
+                self._cond.notify_all()
+            errors = 0
+            for callback in callbacks:
+                try:
+                    callback(item)
+                except Exception as e:
+                    errors += 1
+                    print("Callback failed:", e)
+            with self._cond:
+                self.errors += errors
+                self.delivered += 1
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far has been delivered."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queue and not self._busy, timeout)
+
+    def close(self, drain=True, timeout=1.0):
+        if drain:
+            self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._queue.clear()
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def get_stats(self):
+        with self._cond:
+            return {
+                "depth": len(self._queue),
+                "max_depth": self.max_depth,
+                "submitted": self.submitted,
+                "delivered": self.delivered,
+                "dropped": self.dropped,
+                "errors": self.errors,
+            }
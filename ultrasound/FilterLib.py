@@ -0,0 +1,141 @@
+import threading
+import time
+from array import array
+
+
+class DistanceFilter:
+    """Ring buffer of raw distance readings with filters updated on push.
+
+    The ring is a fixed array('d'), so pushing never allocates. Each push
+    refreshes the rolling median, the EMA and the outlier state, and the
+    results are cached so every read is O(1).
+
+    Outliers are rejected with a Hampel test: a reading further than
+    `hampel_k` scaled MADs from the window median is dropped. After
+    `max_rejects` rejections in a row the window is restarted from the
+    rejected readings if they are all on the same side of the window
+    median and lie on a straight line (within `hampel_k` times `min_mad`),
+    so a step change (something walked in front of the sensor) or a
+    target moving at a steady speed gets through within a few pings.
+    Scattered outliers never restart it; the oldest one is dropped instead.
+    """
+    def __init__(self, size=9, ema_alpha=0.3, hampel_k=3.0, min_mad=1.0, max_rejects=3):
+        if size < 3:
+            raise ValueError("size must be at least 3")
+        self.size = size
+        self.ema_alpha = ema_alpha
+        self.hampel_k = hampel_k
+        self.min_mad = min_mad
+        self.max_rejects = max_rejects
+
+        self._buf = array('d', [0.0] * size)
+        self._head = 0
+        self._count = 0
+        self._rejected = []
+        self._lock = threading.Lock()
+
+        self.last = None
+        self.median = None
+        self.ema = None
+        self.timestamp = None
+        self.accepted = 0
+        self.outliers = 0
+        self.invalid = 0
+
+    def _window_median(self):
+        values = sorted(self._buf[:self._count]) if self._count < self.size else sorted(self._buf)
+        n = len(values)
+        mid = n // 2
+        if n % 2:
+            return values[mid], values
+        return (values[mid - 1] + values[mid]) / 2.0, values
+
+    def _is_outlier(self, value):
+        if self._count < 3:
+            return False
+        median, values = self._window_median()
+        deviations = sorted(abs(v - median) for v in values)
+        mad = max(self.min_mad, 1.4826 * deviations[len(deviations) // 2])
+        return abs(value - median) > self.hampel_k * mad
+
+    def _consistent(self, values):
+        # One side of the window and on a line: a still or moving target
+        if not (all(v > self.median for v in values) or all(v < self.median for v in values)):
+            return False
+        n = len(values)
+        mean_i = (n - 1) / 2.0
+        mean_v = sum(values) / n
+        slope = (sum((i - mean_i) * (v - mean_v) for i, v in enumerate(values))
+                 / sum((i - mean_i) ** 2 for i in range(n)))
+        limit = self.hampel_k * self.min_mad
+        return all(abs(v - mean_v - slope * (i - mean_i)) <= limit for i, v in enumerate(values))
+
+    def push(self, value, timestamp=None):
+        """Add a raw reading; None counts as an invalid ping. Returns True if accepted."""
+        with self._lock:
+            if value is None:
+                self.invalid += 1
+                return False
+            if self._is_outlier(value):
+                if len(self._rejected) < self.max_rejects:
+                    self.outliers += 1
+                    self._rejected.append(value)
+                    return False
+                if not self._consistent(self._rejected + [value]):
+                    # Noise, not a new scene: keep the window
+                    self.outliers += 1
+                    self._rejected.pop(0)
+                    self._rejected.append(value)
+                    return False
+                # Consistently "wrong" for too long: the scene changed
+                self._head = 0
+                self._count = 0
+                self.ema = None
+                for v in self._rejected:
+                    self._append(v)
+            self._rejected = []
+
+            self._append(value)
+
+            self.last = value
+            self.median = self._window_median()[0]
+            if self.ema is None:
+                self.ema = value
+            else:
+                self.ema += self.ema_alpha * (value - self.ema)
+            self.timestamp = timestamp if timestamp is not None else time.monotonic()
+            self.accepted += 1
+            return True
+
+    def _append(self, value):
+        self._buf[self._head] = value
+        self._head = (self._head + 1) % self.size
+        if self._count < self.size:
+            self._count += 1
+
+    def value(self, kind="median"):
+        """Current filtered value: "median", "ema" or "last" (None until the first reading)."""
+        return getattr(self, kind)
+
+    def values(self):
+        """Readings in the ring, oldest first."""
+        with self._lock:
+            if self._count < self.size:
+                return list(self._buf[:self._count])
+            return list(self._buf[self._head:]) + list(self._buf[:self._head])
+
+    def reset(self):
+        with self._lock:
+            self._head = 0
+            self._count = 0
+            self._rejected = []
+            self.last = self.median = self.ema = self.timestamp = None
+
+    def get_stats(self):
+        return {
+            "accepted": self.accepted,
+            "outliers": self.outliers,
+            "invalid": self.invalid,
+            "median": self.median,
+            "ema": self.ema,
+        }
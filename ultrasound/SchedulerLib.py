@@ -0,0 +1,242 @@
+import threading
+import time
+from FilterLib import DistanceFilter
+
+# Same constants as UltrasoundLib
+CM_PER_SECOND = 17150
+MAX_DISTANCE_CM = 400
+MIN_PING_INTERVAL = 0.06
+
+
+class SensorChannel:
+    """One trig/echo pair managed by UltrasoundScheduler."""
+    def __init__(self, name, trig_pin, echo_pin, group, filter_size=9):
+        self.name = name
+        self.trig_pin = trig_pin
+        self.echo_pin = echo_pin
+        self.group = group
+        self.filter = DistanceFilter(size=filter_size)
+        self.next_ping_at = 0.0
+        self.rise = None
+        self.fall = None
+        self.armed = False
+        self.readings = 0
+        self.invalid = 0
+        self.timeouts = 0
+
+    def get_stats(self):
+        stats = {
+            "readings": self.readings,
+            "invalid": self.invalid,
+            "timeouts": self.timeouts,
+        }
+        stats.update(self.filter.get_stats())
+        return stats
+
+
+class UltrasoundScheduler:
+    """Drive several ultrasonic sensors from one thread.
+
+    Sensors in the same crosstalk `group` can hear each other, so they are
+    pinged one at a time in round-robin order. Sensors in different groups
+    are triggered together, so each ping cycle reads one sensor from every
+    group. Each sensor still keeps at least `ping_interval` between its own
+    pings, and a group waits `settle` seconds after an echo before its
+    next ping so reverberation dies down.
+
+    `gpio` is the RPi.GPIO module by default; pass a SimGPIO to run
+    without hardware.
+    """
+    def __init__(self, gpio=None, echo_timeout=0.03, ping_interval=MIN_PING_INTERVAL, settle=0.01):
+        if gpio is None:
+            import RPi.GPIO as gpio
+        self.gpio = gpio
+        self.echo_timeout = echo_timeout
+        self.ping_interval = max(ping_interval, MIN_PING_INTERVAL)
+        self.settle = settle
+
+        self.channels = {}
+        self._by_echo = {}
+        self._groups = {}
+        self._group_next = {}
+        self._group_ready_at = {}
+
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._started_at = None
+        self.cycles = 0
+
+    def add_sensor(self, name, trig_pin, echo_pin, group="default", filter_size=9):
+        if self._thread is not None:
+            raise RuntimeError("Add sensors before starting the scheduler")
+        channel = SensorChannel(name, trig_pin, echo_pin, group, filter_size)
+        self.channels[name] = channel
+        self._by_echo[echo_pin] = channel
+        self._groups.setdefault(group, []).append(channel)
+        self._group_next.setdefault(group, 0)
+        self._group_ready_at.setdefault(group, 0.0)
+        return channel
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if not self.channels:
+            raise ValueError("No sensors added; call add_sensor() before start()")
+        gpio = self.gpio
+        gpio.setmode(gpio.BCM)
+        for channel in self.channels.values():
+            gpio.setup(channel.trig_pin, gpio.OUT)
+            gpio.setup(channel.echo_pin, gpio.IN)
+            gpio.output(channel.trig_pin, False)
+            gpio.add_event_detect(channel.echo_pin, gpio.BOTH, callback=self._on_edge)
+        self._stop.clear()
+        self._started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        self._thread.join(timeout=1.0)
+        self._thread = None
+        pins = []
+        for channel in self.channels.values():
+            self.gpio.remove_event_detect(channel.echo_pin)
+            pins += [channel.trig_pin, channel.echo_pin]
+        # Only release our own pins; other GPIO users are left alone
+        self.gpio.cleanup(pins)
+
+    def _on_edge(self, pin):
+        # RPi.GPIO does not pass the edge direction, so read the pin. A
+        # fall with no rise before it is left over from an earlier ping.
+        now = time.monotonic()
+        channel = self._by_echo.get(pin)
+        if channel is None or not channel.armed:
+            return
+        level = self.gpio.input(pin)
+        with self._cond:
+            if level:
+                if channel.fall is None:
+                    channel.rise = now
+            elif channel.rise is not None and channel.fall is None:
+                channel.fall = now
+                self._cond.notify_all()
+
+    def _next_batch(self, now):
+        """One ready sensor per group, or an empty list and the next wake-up time."""
+        batch = []
+        wake_at = None
+        for group, channels in self._groups.items():
+            channel = channels[self._group_next[group]]
+            ready_at = max(self._group_ready_at[group], channel.next_ping_at)
+            if ready_at <= now:
+                batch.append(channel)
+                self._group_next[group] = (self._group_next[group] + 1) % len(channels)
+            elif wake_at is None or ready_at < wake_at:
+                wake_at = ready_at
+        return batch, wake_at
+
+    def _loop(self):
+        gpio = self.gpio
+        while not self._stop.is_set():
+            now = time.monotonic()
+            batch, wake_at = self._next_batch(now)
+            if not batch:
+                self._stop.wait(max(0.0, wake_at - now))
+                continue
+
+            with self._cond:
+                for channel in batch:
+                    channel.rise = None
+                    channel.fall = None
+                    channel.armed = True
+            for channel in batch:
+                gpio.output(channel.trig_pin, True)
+            time.sleep(0.00001)  # 10 microseconds
+            for channel in batch:
+                gpio.output(channel.trig_pin, False)
+            triggered_at = time.monotonic()
+
+            deadline = triggered_at + self.echo_timeout
+            with self._cond:
+                while not self._stop.is_set():
+                    if all(c.fall is not None for c in batch):
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                for channel in batch:
+                    channel.armed = False
+            done_at = time.monotonic()
+
+            for channel in batch:
+                self._finish(channel)
+                channel.next_ping_at = triggered_at + self.ping_interval
+                self._group_ready_at[channel.group] = done_at + self.settle
+            self.cycles += 1
+
+    def _finish(self, channel):
+        channel.readings += 1
+        distance = None
+        if channel.rise is None or channel.fall is None:
+            channel.timeouts += 1
+        else:
+            distance = round((channel.fall - channel.rise) * CM_PER_SECOND, 2)
+            if not 0 < distance <= MAX_DISTANCE_CM:
+                distance = None
+        if distance is None:
+            channel.invalid += 1
+        channel.filter.push(distance)
+
+    # -------------------------
+    # Readings
+    # -------------------------
+    def get_distance(self, name, kind="median"):
+        """Filtered distance in cm for one sensor, O(1)."""
+        return self.channels[name].filter.value(kind)
+
+    def get_distances(self, kind="median"):
+        return {name: c.filter.value(kind) for name, c in self.channels.items()}
+
+    def get_stats(self):
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        total = sum(c.readings for c in self.channels.values())
+        return {
+            "cycles": self.cycles,
+            "readings": total,
+            "readings_per_second": total / elapsed if elapsed > 0 else 0.0,
+            "sensors": {name: c.get_stats() for name, c in self.channels.items()},
+        }
+
+
+def test_scheduler_sim():
+    from SimGPIO import SimGPIO
+    gpio = SimGPIO()
+    # Front pair can hear each other, rear pair too; front and rear cannot
+    gpio.attach_sensor(5, 6, 50.0, group="front")
+    gpio.attach_sensor(13, 19, 120.0, group="front")
+    gpio.attach_sensor(20, 21, 80.0, group="rear")
+    gpio.attach_sensor(23, 24, 200.0, group="rear")
+
+    scheduler = UltrasoundScheduler(gpio=gpio)
+    scheduler.add_sensor("front_left", 5, 6, group="front")
+    scheduler.add_sensor("front_right", 13, 19, group="front")
+    scheduler.add_sensor("rear_left", 20, 21, group="rear")
+    scheduler.add_sensor("rear_right", 23, 24, group="rear")
+    scheduler.start()
+    time.sleep(2.0)
+    scheduler.stop()
+
+    print("distances:", scheduler.get_distances())
+    print("stats:", scheduler.get_stats())
+    print("crosstalk events:", gpio.crosstalk_events)
+    gpio.close()
+
+
+if __name__ == "__main__":
+    test_scheduler_sim()
@@ -0,0 +1,296 @@
+import heapq
+import math
+import random
+import threading
+import time
+
+
+# -------------------------
+# Distance profiles: functions of seconds since the sim started, for
+# attach_sensor(). None means no echo comes back.
+# -------------------------
+def step_profile(points):
+    """Piecewise constant distance from [(time, distance), ...] in time order."""
+    points = sorted(points)
+
+    def profile(t):
+        distance = points[0][1]
+        for start, value in points:
+            if t < start:
+                break
+            distance = value
+        return distance
+    return profile
+
+
+def ramp_profile(start, end, duration, repeat=False):
+    """Distance moving linearly from `start` to `end` cm over `duration` s."""
+    def profile(t):
+        if repeat:
+            t = t % duration
+        return start + (end - start) * min(1.0, t / duration)
+    return profile
+
+
+def sine_profile(mean, amplitude, period):
+    """Distance swinging `amplitude` cm around `mean` every `period` s."""
+    def profile(t):
+        return mean + amplitude * math.sin(2 * math.pi * t / period)
+    return profile
+
+
+def recorded_profile(distances, interval):
+    """Replay recorded distances (None for a missed echo) `interval` s apart, looping."""
+    distances = list(distances)
+
+    def profile(t):
+        return distances[int(t / interval) % len(distances)]
+    return profile
+
+
+def with_dropouts(profile, rate, seed=0):
+    """`profile` with a fraction `rate` of echoes lost at random."""
+    rng = random.Random(seed)
+
+    def dropped(t):
+        if rng.random() < rate:
+            return None
+        return profile(t) if callable(profile) else profile
+    return dropped
+
+
+class SimSensor:
+    """One simulated HC-SR04 wired to a trig/echo pin pair."""
+    def __init__(self, trig_pin, echo_pin, distance, group=None):
+        self.trig_pin = trig_pin
+        self.echo_pin = echo_pin
+        # Distance in cm, or a function of time since the sim started.
+        # None (or a function returning None) means the echo never comes.
+        self.distance = distance
+        self.group = group
+        self.pending_fall = None
+        self.generation = 0
+        self.pings = 0
+
+    def distance_at(self, t):
+        if callable(self.distance):
+            return self.distance(t)
+        return self.distance
+
+
+class SimGPIO:
+    """Stand-in for the RPi.GPIO module with simulated ultrasonic sensors.
+
+    Supports the calls the ultrasound code uses (setmode, setup, output,
+    input, add_event_detect, remove_event_detect, cleanup). Ending a
+    trigger pulse schedules the echo pulse of the attached SimSensor, and
+    edge callbacks run on a timer thread at the simulated edge times.
+
+    Sensors attached with the same `group` hear each other: a ping from
+    one ends the echo pulse of any other sensor in the group that is still
+    listening, which is the crosstalk the scheduler has to avoid.
+    """
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self, speed_of_sound=34300.0, echo_delay=0.00045):
+        self.speed_of_sound = speed_of_sound
+        self.echo_delay = echo_delay
+        self.mode = None
+        self._start = time.monotonic()
+        self._levels = {}
+        self._pin_modes = {}
+        self._callbacks = {}
+        self._sensors_by_trig = {}
+        self._events = []
+        self._event_seq = 0
+        self._cond = threading.Condition()
+        self._running = True
+        self.crosstalk_events = 0
+        self.trigger_log = []     # (time, trig_pin)
+        self.edge_log = []        # (time, pin, level)
+        self._thread = threading.Thread(target=self._event_loop, daemon=True)
+        self._thread.start()
+
+    # -------------------------
+    # Simulation setup
+    # -------------------------
+    def attach_sensor(self, trig_pin, echo_pin, distance, group=None):
+        sensor = SimSensor(trig_pin, echo_pin, distance, group)
+        with self._cond:
+            self._sensors_by_trig[trig_pin] = sensor
+            self._levels.setdefault(echo_pin, 0)
+        return sensor
+
+    def now(self):
+        return time.monotonic() - self._start
+
+    # -------------------------
+    # Recorded timings (time.monotonic())
+    # -------------------------
+    def trigger_times(self, trig_pin=None):
+        with self._cond:
+            return [t for t, pin in self.trigger_log if trig_pin is None or pin == trig_pin]
+
+    def ping_intervals(self, trig_pin=None):
+        """Seconds between consecutive triggers."""
+        times = self.trigger_times(trig_pin)
+        return [b - a for a, b in zip(times, times[1:])]
+
+    def echo_pulses(self, echo_pin):
+        """(rise time, width) of every complete echo pulse seen on `echo_pin`."""
+        with self._cond:
+            edges = [(t, level) for t, pin, level in self.edge_log if pin == echo_pin]
+        pulses = []
+        rise = None
+        for t, level in edges:
+            if level == 1:
+                rise = t
+            elif rise is not None:
+                pulses.append((rise, t - rise))
+                rise = None
+        return pulses
+
+    def reset_logs(self):
+        with self._cond:
+            self.trigger_log = []
+            self.edge_log = []
+            self.crosstalk_events = 0
+
+    # -------------------------
+    # RPi.GPIO API
+    # -------------------------
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, direction, initial=None, pull_up_down=None):
+        with self._cond:
+            self._pin_modes[pin] = direction
+            self._levels.setdefault(pin, 0)
+            if initial is not None:
+                self._levels[pin] = int(initial)
+
+    def output(self, pin, value):
+        value = int(bool(value))
+        with self._cond:
+            old = self._levels.get(pin, 0)
+            self._levels[pin] = value
+            sensor = self._sensors_by_trig.get(pin)
+            if sensor is not None and old == 1 and value == 0:
+                self._schedule_echo(sensor)
+
+    def input(self, pin):
+        with self._cond:
+            return self._levels.get(pin, 0)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        with self._cond:
+            self._callbacks[pin] = (edge, callback)
+
+    def remove_event_detect(self, pin):
+        with self._cond:
+            self._callbacks.pop(pin, None)
+
+    def cleanup(self, pins=None):
+        with self._cond:
+            if pins is None:
+                pins = list(self._pin_modes)
+            elif isinstance(pins, int):
+                pins = [pins]
+            for pin in pins:
+                self._pin_modes.pop(pin, None)
+                self._callbacks.pop(pin, None)
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(timeout=1.0)
+
+    # -------------------------
+    # Echo timing
+    # -------------------------
+    def _push_event(self, when, pin, level, sensor=None):
+        self._event_seq += 1
+        generation = sensor.generation if sensor is not None else None
+        heapq.heappush(self._events, (when, self._event_seq, pin, level, sensor, generation))
+        self._cond.notify()
+
+    def _schedule_echo(self, sensor):
+        now = time.monotonic()
+        self.trigger_log.append((now, sensor.trig_pin))
+        sensor.pings += 1
+        sensor.generation += 1
+        distance = sensor.distance_at(now - self._start)
+        if distance is None:
+            sensor.pending_fall = None
+            return
+
+        rise = now + self.echo_delay
+        fall = rise + 2.0 * distance / self.speed_of_sound
+        sensor.pending_fall = fall
+        self._push_event(rise, sensor.echo_pin, 1, sensor)
+        self._push_event(fall, sensor.echo_pin, 0, sensor)
+
+        # Anyone in the same acoustic group still listening hears this ping
+        if sensor.group is None:
+            return
+        for other in self._sensors_by_trig.values():
+            if other is sensor or other.group != sensor.group:
+                continue
+            if other.pending_fall is not None and other.pending_fall > fall:
+                self.crosstalk_events += 1
+                other.pending_fall = fall
+                self._push_event(fall, other.echo_pin, 0, other)
+
+    def _event_loop(self):
+        while True:
+            with self._cond:
+                while self._running and not self._events:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                when = self._events[0][0]
+                remaining = when - time.monotonic()
+                if remaining > 0.0005:
+                    # Sleep most of the way, then spin for the last bit
+                    self._cond.wait(remaining - 0.0005)
+                    continue
+            while time.monotonic() < when:
+                pass
+
+            with self._cond:
+                if not self._events or self._events[0][0] != when:
+                    continue
+                _, _, pin, level, sensor, generation = heapq.heappop(self._events)
+                if sensor is not None:
+                    # Skip edges from an earlier ping or cut short by crosstalk
+                    if generation != sensor.generation:
+                        continue
+                    if level == 1 and (sensor.pending_fall is None or sensor.pending_fall <= when):
+                        continue
+                    if level == 0:
+                        if sensor.pending_fall != when:
+                            continue
+                        sensor.pending_fall = None
+                if self._levels.get(pin, 0) == level:
+                    continue
+                self._levels[pin] = level
+                stamp = time.monotonic()
+                self.edge_log.append((stamp, pin, level))
+                edge, callback = self._callbacks.get(pin, (None, None))
+
+            if callback is not None:
+                if edge == self.BOTH or (edge == self.RISING and level == 1) \
+                        or (edge == self.FALLING and level == 0):
+                    callback(pin)
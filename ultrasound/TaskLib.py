@@ -0,0 +1,201 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+
+class TaskTimeout(Exception):
+    """Raised from a task's result when it ran past its timeout."""
+
+
+class CancelToken:
+    """Per-task stop flag with an optional deadline.
+
+    Tasks poll is_set() or sleep with wait(); both report True once the
+    task is cancelled or its deadline has passed.
+    """
+    def __init__(self, deadline=None):
+        self._event = threading.Event()
+        self.deadline = deadline
+
+    def cancel(self):
+        self._event.set()
+
+    def cancelled(self):
+        return self._event.is_set()
+
+    def timed_out(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def is_set(self):
+        return self._event.is_set() or self.timed_out()
+
+    def wait(self, timeout=None):
+        """Sleep up to `timeout` seconds; returns True early if stopped."""
+        if self.deadline is not None:
+            remaining = max(0.0, self.deadline - time.monotonic())
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        self._event.wait(timeout)
+        return self.is_set()
+
+
+class TaskHandle:
+    """Future plus cancellation token for one submitted task.
+
+    join() and is_alive() mirror threading.Thread so code written against
+    per-call threads keeps working.
+    """
+    def __init__(self, future, token, name):
+        self.future = future
+        self.token = token
+        self.name = name
+
+    def cancel(self):
+        """Cancel the task: drop it if still queued, else signal its token."""
+        self.token.cancel()
+        return self.future.cancel()
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def join(self, timeout=None):
+        try:
+            self.future.exception(timeout)
+        except Exception:
+            pass
+
+    def is_alive(self):
+        return not self.future.done()
+
+
+class TaskManager:
+    """Persistent thread pool for short tasks.
+
+    Each task gets its own CancelToken (passed as the first argument),
+    optional timeout and completion callback, and its own Future, so
+    concurrent tasks never share a stop flag or a result slot.
+    """
+    def __init__(self, max_workers=4, name="task"):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.max_workers = max_workers
+        self.submitted = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.timed_out = 0
+        self.dequeued = 0
+        self.total_run_time = 0.0
+        self.max_run_time = 0.0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def submit(self, func, *args, timeout=None, callback=None, name=None, **kwargs):
+        """Run func(token, *args, **kwargs) on the pool and return a TaskHandle.
+
+        `timeout` is counted from submission and sets the token's deadline;
+        a task still queued at its deadline is not run. `callback(result)`
+        is called from the worker when the task succeeds.
+        """
+        submitted_at = time.monotonic()
+        deadline = submitted_at + timeout if timeout is not None else None
+        token = CancelToken(deadline)
+
+        def run():
+            started_at = time.monotonic()
+            with self._lock:
+                self.started += 1
+                wait = started_at - submitted_at
+                self.total_wait_time += wait
+                self.max_wait_time = max(self.max_wait_time, wait)
+            try:
+                if token.is_set():
+                    raise TaskTimeout() if token.timed_out() else CancelledError()
+                result = func(token, *args, **kwargs)
+                if token.cancelled():
+                    raise CancelledError()
+                if token.timed_out():
+                    raise TaskTimeout(f"task exceeded {timeout} s")
+            except TaskTimeout:
+                with self._lock:
+                    self.timed_out += 1
+                raise
+            except CancelledError:
+                with self._lock:
+                    self.cancelled += 1
+                raise
+            except Exception:
+                with self._lock:
+                    self.failed += 1
+                raise
+            finally:
+                run_time = time.monotonic() - started_at
+                with self._lock:
+                    self.total_run_time += run_time
+                    self.max_run_time = max(self.max_run_time, run_time)
+
+            with self._lock:
+                self.completed += 1
+            if callback is not None:
+                try:
+                    callback(result)
+                except Exception as e:
+                    print("Task callback failed:", e)
+            return result
+
+        with self._lock:
+            self.submitted += 1
+        future = self._executor.submit(run)
+        future.add_done_callback(self._note_done)
+        return TaskHandle(future, token, name or getattr(func, "__name__", "task"))
+
+    def _note_done(self, future):
+        # Done callbacks run once per future, so a task dropped from the
+        # queue (by TaskHandle.cancel or shutdown(cancel_pending=True)) is
+        # counted once however often it is cancelled; run() never sees it.
+        if future.cancelled():
+            with self._lock:
+                self.dequeued += 1
+                self.cancelled += 1
+
+    def queue_depth(self):
+        """Tasks submitted but not yet picked up by a worker."""
+        with self._lock:
+            return self.submitted - self.started - self.dequeued
+
+    def get_stats(self):
+        with self._lock:
+            finished = (self.completed + self.failed + self.timed_out
+                        + self.cancelled - self.dequeued)
+            return {
+                "workers": self.max_workers,
+                "submitted": self.submitted,
+                "queued": self.submitted - self.started - self.dequeued,
+                "running": self.started - finished,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "timed_out": self.timed_out,
+                "avg_run_ms": 1000.0 * self.total_run_time / self.started if self.started else 0.0,
+                "max_run_ms": 1000.0 * self.max_run_time,
+                "avg_wait_ms": 1000.0 * self.total_wait_time / self.started if self.started else 0.0,
+                "max_wait_ms": 1000.0 * self.max_wait_time,
+            }
+
+    def shutdown(self, wait=True, cancel_pending=False):
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_pending)
+
+
+_default_manager = None
+_default_lock = threading.Lock()
+
+def default_manager():
+    """Process-wide TaskManager shared by callers that don't bring their own."""
+    global _default_manager
+    with _default_lock:
+        if _default_manager is None:
+            _default_manager = TaskManager(max_workers=4)
+        return _default_manager
@@ -1,14 +1,86 @@
-import RPi.GPIO as GPIO
+import asyncio
 import time
 import threading
+from collections import namedtuple
+from FilterLib import DistanceFilter
+from DispatchLib import CallbackDispatcher
+
+
+# Speed of sound is 34300 cm/s, divide by 2 for the round trip
+CM_PER_SECOND = 17150
+MAX_DISTANCE_CM = 400   # HC-SR04 rated range
+MIN_PING_INTERVAL = 0.06   # HC-SR04 datasheet: at least 60 ms between pings
+
+# One continuous-sampling result: raw ping (None if invalid) and the
+# filtered values after it, stamped with time.monotonic().
+Reading = namedtuple("Reading", ["distance", "median", "ema", "timestamp"])
 
 
 class UltrasoundLib(threading.Thread):
-    def __init__(self, trig_pin, echo_pin, timeout=5):
+    def __init__(self, trig_pin, echo_pin, timeout=5, echo_timeout=0.03, edge_backend="rpigpio",
+                 ping_interval=MIN_PING_INTERVAL, filter_size=9,
+                 callback_queue_size=32, callback_overflow="drop_oldest", settle_time=2.0,
+                 gpio=None):
+        """edge_backend selects how the echo pulse is timed:
+        "rpigpio" - GPIO.add_event_detect callbacks on a monotonic clock
+        "pigpio"  - pigpiod edge callbacks with microsecond hardware ticks
+        None      - the old busy-wait polling loop
+        `echo_timeout` bounds each ping; a missed echo is reported as None.
+        Callbacks run on their own thread behind a bounded queue, see
+        DispatchLib.CallbackDispatcher for the overflow policies.
+        The sensor needs `settle_time` seconds after setup before its
+        readings are good; the constructor does not wait for it, the first
+        ping does (see is_ready/wait_ready).
+        `gpio` is the RPi.GPIO module by default; pass a SimGPIO to run
+        without a Pi.
+        """
+        start = time.perf_counter()
+        if gpio is None:
+            # Imported here so importing this module stays cheap
+            import RPi.GPIO as gpio
+        self.gpio = gpio
+        self.startup = {"import_gpio": time.perf_counter() - start}
+
         self.trig_pin = trig_pin
         self.echo_pin = echo_pin
-
+        self.echo_timeout = echo_timeout
+        self.edge_backend = edge_backend
+
+        # Edge timing state, reset before every trigger
+        self._edge_event = threading.Event()
+        self._rise = None
+        self._fall = None
+        self._pi = None
+        self._pi_callback = None
+        self.readings = 0
+        self.invalid_readings = 0
+        self.timeouts = 0
+
+        # Pings are spaced at least ping_interval apart so the previous
+        # echo has died down before the next trigger.
+        self.ping_interval = max(ping_interval, MIN_PING_INTERVAL)
+        self._next_ping_at = 0.0
+        self.settle_time = settle_time
+        self.ready_at = 0.0
+
+        # Continuous sampling (see start_sampling)
+        self.filter = DistanceFilter(size=filter_size)
+        self._sampling_thread = None
+        self._sampling_stop = threading.Event()
+
+        # Consumers: callbacks via the dispatchers, asyncio via
+        # call_soon_threadsafe. Neither can slow down the sampling thread.
+        # Task results (register_callback) and sampling Readings
+        # (add_reading_callback) go through separate dispatchers so each
+        # callback only ever sees one kind of item.
+        self._dispatcher = CallbackDispatcher(callback_queue_size, callback_overflow)
+        self._reading_dispatcher = CallbackDispatcher(callback_queue_size, callback_overflow)
+        self._subscribers = []
+        self._subscribers_lock = threading.Lock()
+
+        setup_start = time.perf_counter()
         self.initialize_device()
+        self.startup["initialize_device"] = time.perf_counter() - setup_start
         self.result = None
 
         self._event = threading.Event()  # Event flag for stopping the thread
@@ -24,72 +96,283 @@ class UltrasoundLib(threading.Thread):
         trig = self.trig_pin
         echo = self.echo_pin
         # Code to initialize the ultrasound device
-        GPIO.setmode(GPIO.BCM)
+        self.gpio.setmode(self.gpio.BCM)
         # Define the GPIO pins connected to the sensor
         # Trigger pin
         # Echo pin (input, through voltage divider)
 
         # Set up the GPIO pins
-        GPIO.setup(trig, GPIO.OUT)  # Trigger pin as output
-        GPIO.setup(echo, GPIO.IN)   # Echo pin as input
+        self.gpio.setup(trig, self.gpio.OUT)  # Trigger pin as output
+        self.gpio.setup(echo, self.gpio.IN)   # Echo pin as input
 
         # Ensure the trigger is initially off
-        GPIO.output(trig, False)
-        # Allow the sensor to settle
-        time.sleep(2)
+        self.gpio.output(trig, False)
+
+        if self.edge_backend == "rpigpio":
+            self.gpio.add_event_detect(echo, self.gpio.BOTH, callback=self._on_echo_edge)
+        elif self.edge_backend == "pigpio":
+            import pigpio
+            self._pi = pigpio.pi()
+            if not self._pi.connected:
+                raise RuntimeError("Cannot connect to pigpio daemon. Run 'sudo pigpiod'")
+            self._pi_callback = self._pi.callback(echo, pigpio.EITHER_EDGE, self._on_echo_tick)
+        elif self.edge_backend is not None:
+            raise ValueError("Unknown edge backend: " + str(self.edge_backend))
+        # Let the sensor settle without blocking: capture_distance already
+        # waits for _next_ping_at, so the first ping is held back instead
+        self.ready_at = time.monotonic() + self.settle_time
+        self._next_ping_at = max(self._next_ping_at, self.ready_at)
+
+    def is_ready(self):
+        """True once the sensor has had settle_time to settle."""
+        return time.monotonic() >= self.ready_at
+
+    def wait_ready(self, timeout=None):
+        """Sleep until the sensor has settled; False if `timeout` ran out first."""
+        delay = self.ready_at - time.monotonic()
+        if delay <= 0:
+            return True
+        if timeout is not None and timeout < delay:
+            time.sleep(timeout)
+            return False
+        time.sleep(delay)
+        return True
         
     def get_average_distance(self, samples=5):
+        """Average of the valid readings out of `samples`, or None if none were valid."""
         total_distance = 0
+        valid = 0
         for _ in range(samples):
             distance = self.capture_distance()
+            if distance is None:
+                continue
             total_distance += distance
-        average_distance = total_distance / samples
+            valid += 1
+        if valid == 0:
+            return None
+        average_distance = total_distance / valid
         return average_distance
 
+    def _on_echo_edge(self, channel):
+        # RPi.GPIO does not pass the edge direction, so read the pin. A
+        # fall with no rise before it is left over from the previous ping.
+        now = time.monotonic()
+        if self.gpio.input(channel):
+            if self._fall is None:
+                self._rise = now
+        elif self._rise is not None and self._fall is None:
+            self._fall = now
+            self._edge_event.set()
+
+    def _on_echo_tick(self, gpio, level, tick):
+        # pigpio ticks are microseconds sampled by the daemon at the edge
+        if level == 1:
+            if self._fall is None:
+                self._rise = tick
+        elif level == 0 and self._rise is not None and self._fall is None:
+            self._fall = tick
+            self._edge_event.set()
+
+    def _pulse_duration(self):
+        """Echo pulse length in seconds, or None if no complete pulse was seen."""
+        echo = self.echo_pin
+
+        if self.edge_backend is None:
+            # Busy-wait on the echo pin, bounded by echo_timeout
+            deadline = time.monotonic() + self.echo_timeout
+            pulse_start = pulse_end = None
+            while self.gpio.input(echo) == 0:
+                pulse_start = time.monotonic()
+                if pulse_start > deadline:
+                    return None
+            while self.gpio.input(echo) == 1:
+                pulse_end = time.monotonic()
+                if pulse_end > deadline:
+                    return None
+            if pulse_start is None or pulse_end is None:
+                return None
+            return pulse_end - pulse_start
+
+        self._edge_event.wait(self.echo_timeout)
+        if self._rise is None or self._fall is None:
+            return None
+        if self.edge_backend == "pigpio":
+            import pigpio
+            return pigpio.tickDiff(self._rise, self._fall) / 1e6
+        return self._fall - self._rise
+
     def capture_distance(self):
+        """Distance in cm, or None for a missed echo or out-of-range reading."""
         trig = self.trig_pin
-        echo = self.echo_pin
-        distance = 0
+
+        delay = self._next_ping_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        self._rise = None
+        self._fall = None
+        self._edge_event.clear()
 
         # Send a short pulse to the Trigger pin
-        GPIO.output(trig, True)
+        self.gpio.output(trig, True)
         time.sleep(0.00001)  # 10 microseconds
-        GPIO.output(trig, False)
+        self.gpio.output(trig, False)
+        # The burst starts on the falling edge, so space pings from there;
+        # the 10 us sleep can overrun by far more than 10 us
+        self._next_ping_at = time.monotonic() + self.ping_interval
 
         # Measure the time it takes for the Echo pin to go HIGH and then LOW
-        while GPIO.input(echo) == 0:
-            pulse_start = time.time()
-
-        while GPIO.input(echo) == 1:
-            pulse_end = time.time()
-
-        # Calculate the distance based on the time of flight of the sound wave
-        pulse_duration = pulse_end - pulse_start
-        distance = pulse_duration * 17150  # Speed of sound is 34300 cm/s, divide by 2
-        distance = round(distance, 2)  # Round to 2 decimal places
+        pulse_duration = self._pulse_duration()
+        self.readings += 1
+
+        distance = None
+        if pulse_duration is None:
+            self.timeouts += 1
+            self.invalid_readings += 1
+        else:
+            # Calculate the distance based on the time of flight of the sound wave
+            distance = round(pulse_duration * CM_PER_SECOND, 2)  # Round to 2 decimal places
+            if not 0 < distance <= MAX_DISTANCE_CM:
+                self.invalid_readings += 1
+                distance = None
 
         # Print the distance
        # print(f"Distance: {distance} cm")
-        # Sleep for a short time before measuring again
-        time.sleep(0.1)
 
         return distance
 
+    # -------------------------
+    # Continuous sampling
+    # -------------------------
+    def start_sampling(self):
+        """Ping continuously at ping_interval and feed self.filter.
+
+        Read the result at any time with get_distance(); it does not wait
+        for a new ping.
+        """
+        if self._sampling_thread is not None:
+            return
+        self._sampling_stop.clear()
+        self._sampling_thread = threading.Thread(target=self._sample_loop, daemon=True)
+        self._sampling_thread.start()
+
+    def _sample_loop(self):
+        while not self._sampling_stop.is_set():
+            distance = self.capture_distance()
+            self.filter.push(distance)
+            self._publish(Reading(distance, self.filter.median, self.filter.ema, time.monotonic()))
+
+    def _publish(self, reading):
+        self._reading_dispatcher.submit(reading)
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            loop, deliver = sub
+            try:
+                loop.call_soon_threadsafe(deliver, reading)
+            except RuntimeError:
+                # Event loop closed without unsubscribing
+                self._unsubscribe(sub)
+
+    def add_reading_callback(self, callback):
+        """Call `callback(reading)` with every continuous-sampling Reading.
+
+        Like register_callback it runs on a dispatcher thread; this does
+        not start sampling.
+        """
+        self._reading_dispatcher.add(callback)
+
+    def _subscribe(self, loop, deliver):
+        sub = (loop, deliver)
+        with self._subscribers_lock:
+            self._subscribers.append(sub)
+        self.start_sampling()
+        return sub
+
+    def _unsubscribe(self, sub):
+        with self._subscribers_lock:
+            if sub in self._subscribers:
+                self._subscribers.remove(sub)
+
+    # -------------------------
+    # asyncio interface
+    # -------------------------
+    async def stream(self, maxsize=16, overflow="drop_oldest"):
+        """Async iterator over continuous-sampling readings.
+
+        Starts sampling if needed. If the consumer falls `maxsize` readings
+        behind, the oldest ("drop_oldest") or newest ("drop_newest") one is
+        discarded; the sampling thread never waits.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize)
+
+        def deliver(reading):
+            if queue.full():
+                if overflow == "drop_newest":
+                    return
+                queue.get_nowait()
+            queue.put_nowait(reading)
+
+        sub = self._subscribe(loop, deliver)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._unsubscribe(sub)
+
+    async def next_reading(self, timeout=None):
+        """Wait for the next reading from continuous sampling."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def deliver(reading):
+            if not future.done():
+                future.set_result(reading)
+
+        sub = self._subscribe(loop, deliver)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._unsubscribe(sub)
+
+    def stop_sampling(self):
+        if self._sampling_thread is None:
+            return
+        self._sampling_stop.set()
+        self._sampling_thread.join(timeout=1.0)
+        self._sampling_thread = None
+
+    def get_distance(self, kind="median"):
+        """Latest filtered distance in cm ("median", "ema" or "last"), O(1)."""
+        return self.filter.value(kind)
+
     def uninitialize_device(self):
-        GPIO.cleanup()  # Clean up the GPIO pins on exit
+        self.stop_sampling()
+        self._dispatcher.close()
+        self._reading_dispatcher.close()
+        if self._pi_callback is not None:
+            self._pi_callback.cancel()
+            self._pi.stop()
+            self._pi_callback = None
+        elif self.edge_backend == "rpigpio":
+            self.gpio.remove_event_detect(self.echo_pin)
+        self.gpio.cleanup((self.trig_pin, self.echo_pin))  # Clean up our GPIO pins on exit
 
     def _taskA(self):
         start_time = time.time()
         while not self._event.is_set():
             # Get the average distance
             result = self.get_average_distance(samples=4)
-            print(f"Average distance: {result:.2f} cm")  # Print or store result
+            if result is None:
+                print("Average distance: no valid echo")
+            else:
+                print(f"Average distance: {result:.2f} cm")  # Print or store result
 
-            # Set result and trigger callback if ready
+            # Set result and hand it to the callback thread
             with self._lock:
                 self.result = result
-                if self._callback:
-                    self._callback(result)  # Call the callback with the result
+            self._dispatcher.submit(result)
 
             time.sleep(0.5)  # Delay between measurements
 
@@ -99,8 +382,7 @@ class UltrasoundLib(threading.Thread):
                     self.result = "Timeout reached after calculating distances"
                 print("Timeout occurred!")
                 self._event.set()  # Stop the thread on timeout
-                if self._callback:
-                    self._callback(self.result)  # Call the callback on timeout
+                self._dispatcher.submit(self.get_result())  # Report the timeout
                 break
 
     def start(self):
@@ -110,10 +392,17 @@ class UltrasoundLib(threading.Thread):
         """Stop the thread and automatically join it"""
         self._event.set()  # Trigger stop condition for the thread
         self._thread.join()  # Wait for the thread to finish execution
+        self._dispatcher.flush(timeout=1.0)  # Deliver pending callbacks
 
     def register_callback(self, callback):
-        """Register a callback function to be called when the thread ends"""
+        """Register a callback function to be called with each result.
+
+        It runs on the dispatcher thread, so a slow callback never delays
+        sampling; results it cannot keep up with are handled by the
+        overflow policy.
+        """
         self._callback = callback
+        self._dispatcher.set(callback)
 
     def get_result(self):
         """Thread-safe access to the result"""
@@ -152,6 +441,101 @@ def test_ultrasound():
     # Cleanup GPIO after the task is finished
     ultrasound_task.uninitialize_device()
 
+def test_sampling():
+    sensor = UltrasoundLib(trig_pin=23, echo_pin=24)
+    sensor.start_sampling()
+    try:
+        for _ in range(20):
+            time.sleep(0.25)
+            print(f"median {sensor.get_distance()}  ema {sensor.get_distance('ema')}")
+    finally:
+        print("Filter stats:", sensor.filter.get_stats())
+        sensor.uninitialize_device()
+
+def test_async():
+    async def main():
+        sensor = UltrasoundLib(trig_pin=23, echo_pin=24)
+        try:
+            first = await sensor.next_reading(timeout=1.0)
+            print("first reading:", first)
+            count = 0
+            async for reading in sensor.stream():
+                print(f"median {reading.median}  raw {reading.distance}")
+                count += 1
+                if count >= 20:
+                    break
+        finally:
+            sensor.uninitialize_device()
+    asyncio.run(main())
+
+def benchmark_pings(seconds=3.0, distance=100.0, edge_backends=("rpigpio", None),
+                    ping_interval=MIN_PING_INTERVAL, gpio=None):
+    """Ping rate, CPU per ping and accuracy for each edge backend.
+
+    Without `gpio` each backend runs against a SimGPIO with one sensor
+    on pins 23/24 at `distance` (cm, or a SimGPIO distance profile); pass
+    RPi.GPIO to measure a real sensor ("pigpio" also needs pigpiod).
+    `ping_interval` applies to both; a real sensor is held to the
+    datasheet minimum, while the simulator has no ringing, so there it
+    may go lower to time the driver itself. error_cm needs a fixed
+    simulated `distance` and is None otherwise.
+
+    cpu_ms is process CPU per ping, which in simulation includes the
+    simulator thread; caller_cpu_ms is only the pinging thread, i.e.
+    what the polling backend burns in its busy wait.
+    """
+    results = {}
+    for backend in edge_backends:
+        sim = None
+        pins = gpio
+        if pins is None:
+            from SimGPIO import SimGPIO
+            sim = pins = SimGPIO()
+            sim.attach_sensor(23, 24, distance)
+        sensor = UltrasoundLib(23, 24, edge_backend=backend, settle_time=0.0, gpio=pins,
+                               ping_interval=ping_interval)
+        if sim is not None:
+            sensor.ping_interval = ping_interval
+        known = sim is not None and not callable(distance)
+
+        pings = 0
+        valid = 0
+        error = 0.0
+        cpu = time.process_time()
+        caller_cpu = time.thread_time()
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            measured = sensor.capture_distance()
+            pings += 1
+            if measured is None:
+                continue
+            valid += 1
+            if known:
+                error += abs(measured - distance)
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+        caller_cpu = time.thread_time() - caller_cpu
+        sensor.uninitialize_device()
+        if sim is not None:
+            sim.close()
+
+        name = backend or "polling"
+        results[name] = {
+            "pings": pings,
+            "pings_per_s": pings / elapsed,
+            "valid": valid / pings if pings else 0.0,
+            "cpu_ms": 1000.0 * cpu / pings if pings else 0.0,
+            "caller_cpu_ms": 1000.0 * caller_cpu / pings if pings else 0.0,
+            "error_cm": error / valid if valid and known else None,
+        }
+
+    print(f"{'backend':9s} {'pings/s':>8s} {'valid':>6s} {'cpu ms':>7s} {'caller':>7s} {'err cm':>7s}")
+    for name, r in results.items():
+        err = f"{r['error_cm']:7.2f}" if r["error_cm"] is not None else "      -"
+        print(f"{name:9s} {r['pings_per_s']:8.1f} {100 * r['valid']:5.0f}% {r['cpu_ms']:7.3f}"
+              f" {r['caller_cpu_ms']:7.3f} {err}")
+    return results
+
 # Run the test
 if __name__ == "__main__":
     test_ultrasound()
\ No newline at end of file
@@ -1,64 +1,73 @@
 import threading
 import time
 
+from TaskLib import default_manager
+
 class MyThreadedClass:
-    def __init__(self):
+    def __init__(self, manager=None):
         self.result = None
         self._lock = threading.Lock()
-        self._stop_event = threading.Event()
-        self._thread = None
+        # Operations run on a shared, persistent worker pool instead of a
+        # new thread per call; each one gets its own handle and stop token.
+        self._manager = manager if manager is not None else default_manager()
+        self._tasks = []
 
-    def _threaded_task(self, data, callback_method):
+    def _threaded_task(self, token, data, callback_method):
         """
-        The actual task to be executed in a separate thread.
-        It takes data and a callback method as arguments.
+        The actual task to be executed on a pool worker.
+        It takes its cancel token, data and a callback method as arguments.
         """
         print(f"Thread started with data: {data}")
-        # Simulate cancellable work: check stop event periodically
+        # Simulate cancellable work: check stop token periodically
         total = 2.0
         interval = 0.1
         elapsed = 0.0
         while elapsed < total:
-            if self._stop_event.is_set():
+            if token.is_set():
                 print("Thread received stop signal. Exiting early.")
-                return
-            # Wait for interval or until stop event is set
-            self._stop_event.wait(interval)
+                return None
+            # Wait for interval or until the token is set
+            token.wait(interval)
             elapsed += interval
 
         processed = f"Processed: {data}"
         with self._lock:
             self.result = processed
-        print(f"Thread finished. Result: {self.result}")
+        print(f"Thread finished. Result: {processed}")
         if callback_method:
-            callback_method(self.result)
+            callback_method(processed)
+        return processed
 
-    def start_threaded_operation(self, data, callback_func=None):
+    def start_threaded_operation(self, data, callback_func=None, timeout=None):
         """
-        Starts a new thread to perform an operation and optionally calls a callback.
+        Starts an operation on the worker pool and optionally calls a callback.
+
+        Returns a TaskHandle: handle.result() gives this operation's own
+        result, and join()/is_alive() work like they did on the thread.
         """
-        # Create a thread, targeting the internal _threaded_task method.
-        # Pass the data and the provided callback function (or a default if none).
-        # Reset stop flag for this new run
-        self._stop_event.clear()
-        thread = threading.Thread(target=self._threaded_task, args=(data, callback_func))
-        thread.daemon = True  # may be killed mid-sleep if main dead
-        thread.start()
-        self._thread = thread
+        handle = self._manager.submit(self._threaded_task, data, callback_func, timeout=timeout)
+        with self._lock:
+            self._tasks = [t for t in self._tasks if not t.done()]
+            self._tasks.append(handle)
         print("Thread operation initiated.")
-        return thread
+        return handle
 
-    def stop_threaded_operation(self, wait=True, timeout=None):
-        """Signal the running thread to stop.
+    def stop_threaded_operation(self, wait=True, timeout=None, handle=None):
+        """Signal running operations to stop.
 
-        - `wait` (bool): if True, call `join()` on the thread after signalling.
-        - `timeout` (float|None): maximum seconds to wait in `join()`.
+        - `handle` (TaskHandle|None): stop only this operation; default is all.
+        - `wait` (bool): if True, wait for the operations after signalling.
+        - `timeout` (float|None): maximum seconds to wait for each one.
         """
-        self._stop_event.set()
-        if self._thread is not None and wait:
-            self._thread.join(timeout)
-            if self._thread.is_alive():
-                print("Warning: thread did not stop within timeout.")
+        with self._lock:
+            handles = [handle] if handle is not None else list(self._tasks)
+        for h in handles:
+            h.cancel()
+        if wait:
+            for h in handles:
+                h.join(timeout)
+                if h.is_alive():
+                    print("Warning: thread did not stop within timeout.")
 
     def on_thread_completion(self, thread_result):
         """
@@ -68,10 +77,14 @@ class MyThreadedClass:
         # You can perform further actions here based on the thread_result
 
     def get_result(self):
-        """Thread-safe accessor for `self.result`. Returns the current value."""
+        """Thread-safe accessor for the most recently completed result."""
         with self._lock:
             return self.result
 
+    def get_stats(self):
+        """Queue depth and run-time metrics of the worker pool."""
+        return self._manager.get_stats()
+
 # Usage example:
 if __name__ == "__main__":
     my_instance = MyThreadedClass()